@@ -0,0 +1,165 @@
+# This script contains classes for writing counter output tables in a binary, columnar format and loading them back.
+# A columnar table is a directory containing a small JSON header and one .npy file per column, so count columns can be
+# memory-mapped (making loads nearly free, even for tables with millions of rows).  Key columns (e.g. features or relative
+# positions) are stored as an array of integer codes along with an array of the labels they refer to.
+import json, os
+import numpy as np
+from array import array
+from typing import Dict, List
+
+COLUMNAR_OUTPUT_SUFFIX = ".columnar" # Output file paths with this suffix are written as columnar tables.
+COLUMNAR_HEADER_FILE_NAME = "header.json"
+COLUMNAR_FORMAT_VERSION = 1
+
+
+def isColumnarOutput(outputFilePath) -> bool:
+    return str(outputFilePath).endswith(COLUMNAR_OUTPUT_SUFFIX)
+
+
+class ColumnarTableWriter:
+    """
+    Accepts the same tab-separated rows that would be written to a tsv output file and stores them by column, writing the
+    columnar table to the given directory when closed.  The first keyColumnCount columns are stored as key columns, and the
+    remaining columns must be numeric.  (Count columns are stored as 64-bit integers unless a value isn't a whole number.)
+    Since this class can be written to like a file, the output data writer can use it in place of one.
+    """
+
+    def __init__(self, outputDirectory, headers: List[str], keyColumnCount):
+        self.outputDirectory = str(outputDirectory)
+        self.headers = list(headers)
+        self.keyColumnCount = keyColumnCount
+        self.keyCodes = [array('q') for _ in range(keyColumnCount)]
+        self.keyLabels: List[Dict[str, int]] = [dict() for _ in range(keyColumnCount)]
+        self.countColumns: List[array] = None # Created once the number of columns is known from the first row.
+        self.rowCount = 0
+        self.closed = False
+
+
+    def writeHeaders(self, headers: List[str]):
+        """
+        Replaces the headers (which may change as keys are discovered during counting).
+        """
+        assert self.rowCount == 0, "Headers can't be changed once rows have been written."
+        self.headers = list(headers)
+
+
+    def write(self, rows: str):
+        """
+        Adds the given tab-separated row(s), each ending with a newline.
+        """
+        for row in rows.splitlines():
+            values = row.split('\t')
+            if self.countColumns is None: self.countColumns = [array('q') for _ in range(len(values) - self.keyColumnCount)]
+            assert len(values) == self.keyColumnCount + len(self.countColumns), "Rows must all have the same number of columns."
+
+            for keyCodes, keyLabels, label in zip(self.keyCodes, self.keyLabels, values):
+                code = keyLabels.get(label)
+                if code is None: code = keyLabels[label] = len(keyLabels)
+                keyCodes.append(code)
+
+            for i, value in enumerate(values[self.keyColumnCount:]):
+                countColumn = self.countColumns[i]
+                if countColumn.typecode == 'q':
+                    try:
+                        countColumn.append(int(value))
+                        continue
+                    except ValueError: countColumn = self.countColumns[i] = array('d', countColumn)
+                countColumn.append(float(value))
+
+            self.rowCount += 1
+
+
+    def close(self):
+        """
+        Writes the columnar table.  (Only the first call has any effect.)
+        """
+        if self.closed: return
+        self.closed = True
+        os.makedirs(self.outputDirectory, exist_ok = True)
+
+        if self.countColumns is None: self.countColumns = [array('q') for _ in range(len(self.headers) - self.keyColumnCount)]
+        assert len(self.headers) == self.keyColumnCount + len(self.countColumns), (
+            f"There are {len(self.headers)} headers, but rows have {self.keyColumnCount + len(self.countColumns)} columns.")
+
+        columns = list()
+        for i, header in enumerate(self.headers):
+            column = {"name": header, "file": f"column_{i}.npy"}
+            if i < self.keyColumnCount:
+                column["kind"] = "key"
+                column["labelsFile"] = f"column_{i}_labels.npy"
+                labels = list(self.keyLabels[i])
+                codes = np.frombuffer(self.keyCodes[i], dtype = np.int64) if self.rowCount else np.zeros(0, np.int64)
+                np.save(os.path.join(self.outputDirectory, column["file"]), codes.astype(np.min_scalar_type(max(len(labels) - 1, 0))))
+                np.save(os.path.join(self.outputDirectory, column["labelsFile"]), np.array(labels, dtype = str))
+            else:
+                column["kind"] = "count"
+                countColumn = self.countColumns[i - self.keyColumnCount]
+                dtype = np.int64 if countColumn.typecode == 'q' else np.float64
+                values = np.frombuffer(countColumn, dtype = dtype) if self.rowCount else np.zeros(0, dtype)
+                np.save(os.path.join(self.outputDirectory, column["file"]), values)
+            columns.append(column)
+
+        with open(os.path.join(self.outputDirectory, COLUMNAR_HEADER_FILE_NAME), 'w') as headerFile:
+            json.dump({"version": COLUMNAR_FORMAT_VERSION, "rowCount": self.rowCount, "columns": columns}, headerFile, indent = 4)
+
+
+class ColumnarTable:
+    """
+    A columnar table loaded from the given directory.  Count columns are memory-mapped unless mmap is false.
+    Indexing the table by header returns that column as an array, with key columns converted to their labels.
+    For key columns, the codes and labels can also be retrieved separately (e.g. for grouping without building string arrays).
+    """
+
+    def __init__(self, tableDirectory, mmap = True):
+        self.tableDirectory = str(tableDirectory)
+        with open(os.path.join(self.tableDirectory, COLUMNAR_HEADER_FILE_NAME), 'r') as headerFile: header = json.load(headerFile)
+        if header["version"] != COLUMNAR_FORMAT_VERSION:
+            raise ValueError(f"Unsupported columnar table version: {header['version']}")
+        self.rowCount: int = header["rowCount"]
+        self.columns: Dict[str, Dict] = {column["name"]: column for column in header["columns"]}
+        self.headers = list(self.columns)
+        self.mmapMode = 'r' if mmap else None
+
+
+    def loadArray(self, fileName) -> np.ndarray:
+        return np.load(os.path.join(self.tableDirectory, fileName), mmap_mode = self.mmapMode)
+
+
+    def getKeyCodes(self, header) -> np.ndarray:
+        assert self.columns[header]["kind"] == "key", f"{header} is not a key column."
+        return self.loadArray(self.columns[header]["file"])
+
+
+    def getKeyLabels(self, header) -> np.ndarray:
+        assert self.columns[header]["kind"] == "key", f"{header} is not a key column."
+        return np.load(os.path.join(self.tableDirectory, self.columns[header]["labelsFile"]))
+
+
+    def getKeyHeaders(self) -> List[str]:
+        return [header for header, column in self.columns.items() if column["kind"] == "key"]
+
+
+    def getCountHeaders(self) -> List[str]:
+        return [header for header, column in self.columns.items() if column["kind"] == "count"]
+
+
+    def __getitem__(self, header) -> np.ndarray:
+        if self.columns[header]["kind"] == "key": return self.getKeyLabels(header)[self.getKeyCodes(header)]
+        else: return self.loadArray(self.columns[header]["file"])
+
+
+    def __len__(self): return self.rowCount
+
+
+def loadColumnarTable(tableDirectory, mmap = True) -> ColumnarTable:
+    return ColumnarTable(tableDirectory, mmap)
+
+
+def convertTableToColumnar(tableFilePath, outputDirectory, keyColumnCount):
+    """
+    Converts an existing tsv output table (with headers) to a columnar table, treating its first keyColumnCount columns as keys.
+    """
+    with open(tableFilePath, 'r') as tableFile:
+        columnarTableWriter = ColumnarTableWriter(outputDirectory, tableFile.readline().rstrip('\n').split('\t'), keyColumnCount)
+        for line in tableFile: columnarTableWriter.write(line)
+    columnarTableWriter.close()
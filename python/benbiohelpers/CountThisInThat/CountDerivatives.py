@@ -0,0 +1,106 @@
+# This script contains classes for declaring count derivative columns (e.g. counts across both strands) as array expressions
+# over the finished counts, so that they can be evaluated for every output row at once instead of through a callback on each row.
+import numpy as np
+from typing import Callable, Dict, List
+
+
+class CountTensor:
+    """
+    Stores the counts from an output data structure as a dense numpy array with one axis for each stratification level,
+    ordered by the keys for output at each level (the same order the rows are written in).
+    The last axis holds the counts within each row, so the shape of the tensor without it is the shape of the output rows.
+    """
+
+    def __init__(self, levelKeys: List[List], dataObject: Dict):
+        self.levelKeys = levelKeys
+        self.keyIndices = [{key: i for i, key in enumerate(keys)} for keys in levelKeys]
+
+        finalLevel = len(levelKeys) - 1
+        def getCounts(currentDataObject, level):
+            if level == finalLevel: return [currentDataObject[key] for key in levelKeys[level]]
+            else: return [getCounts(currentDataObject[key], level + 1) for key in levelKeys[level]]
+        # Reshaping keeps the right number of axes even if some levels have no keys.
+        self.counts = np.array(getCounts(dataObject, 0)).reshape(tuple(len(keys) for keys in levelKeys))
+
+        self.rowShape = self.counts.shape[:-1]
+
+
+    def column(self, key) -> np.ndarray:
+        """
+        Returns the counts for the given key at the final stratification level (e.g. True for the plus strand), for every row.
+        """
+        return self.counts[..., self.keyIndices[-1][key]]
+
+
+    def keys(self, level = 0) -> np.ndarray:
+        """
+        Returns the keys at the given level, shaped so that they broadcast against the rows.
+        (e.g. to weight counts by relative position)
+        """
+        return np.array(self.levelKeys[level]).reshape(
+            tuple(len(levelKeys) if i == level else 1 for i, levelKeys in enumerate(self.levelKeys[:-1]))
+        )
+
+
+    def mirrored(self, values: np.ndarray, level = 0) -> np.ndarray:
+        """
+        Reorders the given per-row values along the given level so that each row receives the values for the negation of its key.
+        (e.g. the value at dyad position -10 for the row at dyad position 10)
+        """
+        mirroredIndices = [self.keyIndices[level][-key] for key in self.levelKeys[level]]
+        return np.take(np.broadcast_to(values, self.rowShape), mirroredIndices, axis = level)
+
+
+class CountDerivative:
+    """
+    Declares a derived output column.  The given function receives a CountTensor and should return an array with one value
+    per output row (or anything that broadcasts to that shape).
+    isSum should be true only if every derived value is a sum of counts, so that the column can be summed across tables
+    like the counts themselves (e.g. when merging the partial tables of sharded counter jobs).
+    """
+
+    def __init__(self, header: str, function: Callable[[CountTensor], np.ndarray], isSum = False):
+        self.header = header
+        self.function = function
+        self.isSum = isSum
+
+
+    def evaluate(self, countTensor: CountTensor) -> List[str]:
+        """
+        Returns the derived values for every row, in the order the rows are written, formatted for output.
+        """
+        values = np.broadcast_to(self.function(countTensor), countTensor.rowShape)
+        return [str(value) for value in values.reshape(-1).tolist()]
+
+
+def sumOfColumns(header, *keys) -> CountDerivative:
+    """
+    Returns a derivative summing the counts for the given keys at the final stratification level.  (e.g. both strands' counts)
+    """
+    return CountDerivative(header, lambda countTensor: sum(countTensor.column(key) for key in keys), isSum = True)
+
+
+def mirroredSum(header, key, mirroredKey, level = 0) -> CountDerivative:
+    """
+    Returns a derivative summing the counts for one key at the final stratification level with the counts for another key in the row
+    mirrored across the given level.  (e.g. plus strand counts at a dyad position plus minus strand counts at the opposite position,
+    which aligns the strands)
+    """
+    return CountDerivative(header, lambda countTensor: countTensor.column(key) + countTensor.mirrored(countTensor.column(mirroredKey), level),
+                           isSum = True)
+
+
+def getNonSumHeaders(outputDataWriter) -> List[str]:
+    """
+    Returns the headers of the given OutputDataWriter's derived columns that can't be summed across tables the way counts can:
+    any from its getCountDerivatives function, and any count derivatives that aren't declared as sums.
+    """
+    return outputDataWriter.getCountDerivatives(True) + [countDerivative.header for countDerivative in outputDataWriter.countDerivatives
+                                                         if not countDerivative.isSum]
+
+
+def evaluateCountDerivatives(countDerivatives: List[CountDerivative], countTensor: CountTensor) -> List[List[str]]:
+    """
+    Evaluates all the given derivatives in one pass over the count tensor and returns the derived values for each row.
+    """
+    return [list(derivedValues) for derivedValues in zip(*(countDerivative.evaluate(countTensor) for countDerivative in countDerivatives))]
@@ -2,13 +2,26 @@
 # It contains a lot of modular components for, say, categorizing counts based on the strand relative to encompassing feature.
 # I'm hoping this will save me a lot of time in the future!
 from abc import ABC, abstractmethod
-import warnings, subprocess
-from typing import List
+import os, stat, tracemalloc, warnings, subprocess
+from typing import Dict, List
 from benbiohelpers.CountThisInThat.InputDataStructures import EncompassedData, EncompassingData, ENCOMPASSED_DATA, ENCOMPASSING_DATA
 from benbiohelpers.CountThisInThat.CounterOutputDataHandler import CounterOutputDataHandler
+from benbiohelpers.CountThisInThat.CounterMetrics import CounterMetrics
+from benbiohelpers.CountThisInThat.MemoryGovernor import MemoryGovernor
+from benbiohelpers.CountThisInThat.OutputDataStratifiers import EncompassedFeatureODS, EncompassingFeatureODS
+from benbiohelpers.FileSystemHandling.ChromosomeIndex import getChromosomeIndex, ChromosomeIndexedFile
+from benbiohelpers.FileSystemHandling.GenomicRegionSet import GenomicRegionSet
+from benbiohelpers.FileSystemHandling.SortCheckingReader import SortCheckingReader
 from benbiohelpers.CustomErrors import UnsortedInputError
 
 
+def isStreamInput(featuresInput):
+    """
+    Determines whether the given input should be read as a stream (an open file-like object or a named pipe) rather than a file.
+    """
+    return hasattr(featuresInput, "readline") or stat.S_ISFIFO(os.stat(featuresInput).st_mode)
+
+
 class ThisInThatCounter(ABC):
     """
     An abstract class with extremely modular structure to allow for easier scripting for the many "Count this in that, but also keep track of those..."
@@ -23,32 +36,129 @@ class ThisInThatCounter(ABC):
     it will crash and burn and give you a heap of garbage as output if the inputs aren't sorted.
     By default, this sorting is checked (assuming standard bed format), but this can be changed with the checkForSortedFiles
     parameter. With this parameter, the values in the tuple represent the encompassed and encompassing files respectively.
+
+    Either input can also be given as an open text stream (e.g. sys.stdin) or the path to a named pipe, so that data can be
+    piped in from another program without being written to disk first.  Streams can't be checked ahead of time, so their
+    sorting is checked as each line is read instead.  Streams can't be indexed, so they can't be used with useChromosomeIndex or regions.
+    Aligned reads can be counted straight from sam or bam files by giving a SamReadPositionReader (see SamReadPositions)
+    as the encompassed features input.
+
+    If sortOutputOnExit is True, output rows for individual features are written sorted by chromosome and then start and end position
+    (the sorting enforced on input files), even if the midpoints used to order features while counting are sorted differently.
+    When writing incrementally, rows are reordered in a small in-memory window as they are written.
+
+    If maxMemory is given (in bytes), the memory used by the output data structure and waiting features is estimated periodically.
+    When it nears the budget, the counter switches to incremental writing (if it isn't already writing incrementally and the first
+    stratifier is an encompassed or encompassing feature stratifier), and, when writing encompassed features incrementally,
+    writes waiting features early.  Otherwise, waiting features are written once there are more than incrementalFlushThreshold of them.
+
+    If recordMemorySnapshots is True, the memory held by the output data handler (see CounterOutputDataHandler.getMemoryReport)
+    and a tracemalloc snapshot are recorded after each chromosome, in memoryReports and memorySnapshots (keyed by chromosome).
+    tracemalloc is started if it isn't already tracing, which slows down counting considerably.
+
+    If countWeightColumn is given, each encompassed feature adds the value in that column (0-based, e.g. read depth or a collapsed
+    duplicate count) to its counts instead of 1.
+
+    If bootstrapIterations is greater than 0, counts are also recorded for each encompassing feature, and after counting,
+    bootstrapped confidence intervals for every output cell are written alongside the output (see getBootstrapFilePath).
+
+    If collectMetrics is True (or a metricsCallback is given), the time spent in each phase of counting (sort checking, parsing,
+    encompassment handling, each stratifier, supplemental information, and writing) is recorded along with throughput, peak numbers
+    of waiting features, and output data structure sizes.  The count function then returns these metrics as a dictionary,
+    and metricsCallback, if given, is called with the metrics collected so far after each chromosome.
+
+    If useChromosomeIndex is True, each input file is indexed by chromosome (see FileSystemHandling.ChromosomeIndex), and
+    the index is used to skip chromosomes not in acceptableChromosomes (instead of raising an error for them) and to jump straight
+    to the next chromosome shared by both files when reconciling chromosomes.
+
+    If regions are given (as "chr:start-end" strings, 1-based and inclusive, paths to bed files of regions, or a list of either),
+    only encompassed features within those regions and encompassing features overlapping them (after applying
+    encompassingFeatureExtraRadius) are counted.  This implies useChromosomeIndex, and the index is also used to skip straight to
+    the lines near each region.
     """
 
     def __init__(self, encompassedFeaturesFilePath, encompassingFeaturesFilePath, 
                  outputFilePath, acceptableChromosomes = None, checkForSortedFiles = (True,True),
                  headersInEncompassedFeatures = False, headersInEncompassingFeatures = False,
                  encompassingFeatureExtraRadius = 0, writeIncrementally = 0, sortOutputOnExit = False,
-                 suppressOutput = False):
+                 suppressOutput = False, bootstrapIterations = 0, bootstrapSeed = None,
+                 collectMetrics = False, metricsCallback = None, useChromosomeIndex = False, regions = None,
+                 countWeightColumn = None, maxMemory = None, incrementalFlushThreshold = 10000, recordMemorySnapshots = False):
 
         self.suppressOutput = suppressOutput
+
+        # If requested, set up metrics collection before anything else so that the sort check is timed too.
+        if collectMetrics or metricsCallback is not None:
+            self.metrics = CounterMetrics(metricsCallback)
+            self.metrics.instrumentInputParsing(self)
+        else: self.metrics = None
+
         self.checkForSortedInput(encompassedFeaturesFilePath, encompassingFeaturesFilePath, checkForSortedFiles)
 
         # Open the encompassed and encompassing files to compare against one another.
-        self.encompassedFeaturesFile = open(encompassedFeaturesFilePath, 'r')
-        self.encompassingFeaturesFile = open(encompassingFeaturesFilePath,'r')
+        # If using chromosome indices, only the acceptable chromosomes are opened for reading (and header lines are skipped automatically).
+        # If regions are given, only the parts of the files near those regions are read.
+        if regions is not None and not isinstance(regions, GenomicRegionSet): regions = GenomicRegionSet(regions)
+        self.regions = regions
+        self.useChromosomeIndex = useChromosomeIndex or self.regions is not None
+        if self.useChromosomeIndex:
+            assert not isStreamInput(encompassedFeaturesFilePath) and not isStreamInput(encompassingFeaturesFilePath), (
+                "Streamed input cannot be indexed, so it cannot be used with useChromosomeIndex or regions."
+            )
+            self.encompassedFeaturesFile = ChromosomeIndexedFile(
+                encompassedFeaturesFilePath, getChromosomeIndex(encompassedFeaturesFilePath, int(headersInEncompassedFeatures)),
+                acceptableChromosomes, self.regions
+            )
+            self.encompassingFeaturesFile = ChromosomeIndexedFile(
+                encompassingFeaturesFilePath, getChromosomeIndex(encompassingFeaturesFilePath, int(headersInEncompassingFeatures)),
+                acceptableChromosomes, self.regions, encompassingFeatureExtraRadius
+            )
+        else:
+            self.encompassedFeaturesFile = self.openFeaturesInput(encompassedFeaturesFilePath, checkForSortedFiles[0],
+                                                                  headersInEncompassedFeatures)
+            self.encompassingFeaturesFile = self.openFeaturesInput(encompassingFeaturesFilePath, checkForSortedFiles[1],
+                                                                   headersInEncompassingFeatures)
 
         # Store the other arguments passed to the constructor
+        self.encompassedFeaturesFilePath = encompassedFeaturesFilePath
+        self.encompassingFeaturesFilePath = encompassingFeaturesFilePath
+        self.headersInEncompassedFeatures = headersInEncompassedFeatures
+        self.headersInEncompassingFeatures = headersInEncompassingFeatures
         self.outputFilePath = outputFilePath
         self.writeIncrementally = writeIncrementally # 0 by default, or one of the two constants: ENCOMPASSED_DATA or ENCOMPASSING_DATA
         self.acceptableChromosomes = acceptableChromosomes
         self.encompassingFeatureExtraRadius = encompassingFeatureExtraRadius
         self.sortOutputOnExit = sortOutputOnExit
+        self.bootstrapIterations = bootstrapIterations
+        self.bootstrapSeed = bootstrapSeed
+        self.countWeightColumn = countWeightColumn
+        self.incrementalFlushThreshold = incrementalFlushThreshold
+        self.maxMemory = maxMemory
+        self.memoryGovernor: MemoryGovernor = None # Set up with the output data handler.  (See setUpCountingState)
+
+        # If requested, prepare to record memory usage after each chromosome.
+        self.memoryReports: Dict[str, Dict[str, int]] = None
+        self.memorySnapshots: Dict[str, tracemalloc.Snapshot] = None
+        self.startedTracingMemory = False
+        if recordMemorySnapshots:
+            self.memoryReports = dict()
+            self.memorySnapshots = dict()
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.startedTracingMemory = True
 
         # Skip headers if they are present.
-        if headersInEncompassedFeatures: self.encompassedFeaturesFile.readline()
-        if headersInEncompassingFeatures: self.encompassingFeaturesFile.readline()
+        if not self.useChromosomeIndex:
+            if headersInEncompassedFeatures: self.encompassedFeaturesFile.readline()
+            if headersInEncompassingFeatures: self.encompassingFeaturesFile.readline()
+
+        self.setUpCountingState()
+
 
+    def setUpCountingState(self):
+        """
+        Reads the first feature from each input and sets up the output data handler and other state needed for counting.
+        """
         # Read in the first entry in each file (as the information within may be important to setting up output data structures)
         self.currentEncompassedFeature = None
         self.currentEncompassingFeature = None
@@ -58,7 +168,13 @@ class ThisInThatCounter(ABC):
 
         # Set up data structures for the output data and tracking the state of encompassed features.
         self.setUpOutputDataHandler()
+        if self.sortOutputOnExit:
+            self.outputDataHandler.writer.enableOutputSorting()
+            self.outputDataHandler.outputDataStratifiers[0].trackSortKeys()
+        if self.maxMemory is not None: self.memoryGovernor = MemoryGovernor(self, self.maxMemory)
         self.confirmedEncompassedFeatures: List[EncompassedData] = list()
+        if self.bootstrapIterations > 0: self.outputDataHandler.trackCountsByEncompassingFeature()
+        if self.metrics is not None: self.metrics.instrumentOutputDataHandler(self)
 
         # This is normally called within readNextEncompassingFeature, but for the first pass, the output data handler doesn't exist.
         # So... Call it now instead!
@@ -71,10 +187,11 @@ class ThisInThatCounter(ABC):
         Files should be sorted by the first column alphabetically followed by the next two columns numerically
         The checkForSortedFiles parameter should be a two-item tuple containing boolean values telling whether to
         check the encompassed and encompassing feature files respectively.
+        Streamed input is skipped here, since it is checked as it is read instead.  (See openFeaturesInput)
         """
         if not self.suppressOutput: print("Checking input files for proper sorting...")
 
-        if checkForSortedFiles[0]:
+        if checkForSortedFiles[0] and not isStreamInput(encompassedFeaturesFilePath):
             if not self.suppressOutput: print("Checking encompassed features file for proper sorting...")
             try:
                 subprocess.check_output(("sort","-k1,1","-k2,2n", "-k3,3n", "-s", "-c", encompassedFeaturesFilePath))
@@ -83,7 +200,7 @@ class ThisInThatCounter(ABC):
                                          "Expected sorting based on chromosome name, alphabetically, "
                                          "followed by start and end position.")
             
-        if checkForSortedFiles[1]:
+        if checkForSortedFiles[1] and not isStreamInput(encompassingFeaturesFilePath):
             if not self.suppressOutput: print("Checking encompassing features file for proper sorting...")
             try:
                 subprocess.check_output(("sort","-k1,1","-k2,2n", "-k3,3n", "-s", "-c", encompassingFeaturesFilePath))
@@ -93,6 +210,18 @@ class ThisInThatCounter(ABC):
                                          "followed by start and end position.")
 
 
+    def openFeaturesInput(self, featuresInput, checkSorting, hasHeader):
+        """
+        Opens the given features file for reading.  Streams (open file-like objects or named pipes) are wrapped so that their
+        sorting is checked as they are read, if requested.  Streams passed in already open are left open when counting finishes.
+        """
+        if hasattr(featuresInput, "readline"):
+            return SortCheckingReader(featuresInput, checkSorting = checkSorting, headerLineCount = int(hasHeader))
+        elif isStreamInput(featuresInput):
+            return SortCheckingReader(open(featuresInput, 'r'), featuresInput, checkSorting, int(hasHeader), closeStream = True)
+        else: return open(featuresInput, 'r')
+
+
     def readNextEncompassedFeature(self):
         """
         Reads in the next encompassed feature into currentEncompassedFeature
@@ -101,30 +230,46 @@ class ThisInThatCounter(ABC):
         # Was the last feature actually encompassed? If not, pass it to the output data structure to be handled.
         if self.currentEncompassedFeature is not None and not self.isCurrentEncompassedFeatureActuallyEncompassed:
 
-            # If we are writing encompassed positions individually, do we have a large number of features waiting to be written?
-            # If so, this means we are tracking non-encompassed features and we have a large stretch between encompassing features.
-            # So, to prevent the non-encompassed features from filling up memory, write them!
-            if self.writeIncrementally == ENCOMPASSED_DATA and len(self.outputDataHandler.encompassedFeaturesToWrite) > 10000 and (
-                self.lastNonEncompassedFeature < self.currentEncompassedFeature
-            ):
+            # If we are writing encompassed positions individually, do we have a large number of features waiting to be written
+            # (or are we nearing the memory budget)?  If so, this means we are tracking non-encompassed features and we have a large
+            # stretch between encompassing features.  So, to prevent the non-encompassed features from filling up memory, write them!
+            if self.writeIncrementally == ENCOMPASSED_DATA and (
+                len(self.outputDataHandler.encompassedFeaturesToWrite) > self.incrementalFlushThreshold or
+                (self.memoryGovernor is not None and self.memoryGovernor.isNearBudget())
+            ) and self.lastNonEncompassedFeature < self.currentEncompassedFeature:
                 self.outputDataHandler.writeWaitingFeatures()
+                self.flushSortedOutput()
+                if self.memoryGovernor is not None: self.memoryGovernor.onFlush()
 
             self.outputDataHandler.onNonCountedEncompassedFeature(self.currentEncompassedFeature)
             self.lastNonEncompassedFeature = self.currentEncompassedFeature
         self.isCurrentEncompassedFeatureActuallyEncompassed = False
 
-        # Read in the next line.
-        nextLine = self.encompassedFeaturesFile.readline()
+        # Read in the next line.  If counting within regions, skip any features outside of them.
+        while True:
+            nextLine = self.encompassedFeaturesFile.readline()
 
-        # Check if EOF has been reached.
-        if not nextLine: 
-            self.currentEncompassedFeature = None
-        # Otherwise, read in the next encompassed feature.
-        else:
-            self.currentEncompassedFeature = self.constructEncompassedFeature(nextLine)
+            # Check if EOF has been reached.
+            if not nextLine: 
+                self.currentEncompassedFeature = None
+                break
+            # Otherwise, read in the next encompassed feature.
+            else:
+                self.currentEncompassedFeature = self.getEncompassedFeature(nextLine)
+                if self.regions is None or self.regions.containsPosition(self.currentEncompassedFeature.chromosome,
+                                                                         self.currentEncompassedFeature.position): break
 
         
 
+    def getEncompassedFeature(self, line) -> EncompassedData:
+        """
+        Constructs the encompassed feature from the given line and sets its count weight, if a count weight column was given.
+        """
+        encompassedFeature = self.constructEncompassedFeature(line)
+        if self.countWeightColumn is not None: encompassedFeature.setCountWeight(self.countWeightColumn)
+        return encompassedFeature
+
+
     def constructEncompassedFeature(self, line) -> EncompassedData:
         """
         Constructs the encompassed feature from the given line.
@@ -145,15 +290,22 @@ class ThisInThatCounter(ABC):
         # After the first pass, make sure to send all exiting encompassing features to the output data handler.
         if self.previousEncompassingFeature is not None: self.outputDataHandler.onExitEncompassingFeature(self.previousEncompassingFeature)
 
-        # Read in the next line.
-        nextLine = self.encompassingFeaturesFile.readline()
+        # Read in the next line.  If counting within regions, skip any features that don't overlap them.
+        while True:
+            nextLine = self.encompassingFeaturesFile.readline()
+            if not nextLine: break
+            self.currentEncompassingFeature = self.constructEncompassingFeature(nextLine)
+            if self.regions is None or self.regions.overlaps(
+                self.currentEncompassingFeature.chromosome,
+                self.currentEncompassingFeature.startPos - self.encompassingFeatureExtraRadius,
+                self.currentEncompassingFeature.endPos + self.encompassingFeatureExtraRadius
+            ): break
 
         # Check if EOF has been reached.
         if not nextLine:
             self.currentEncompassingFeature = None
-        # Otherwise, read in the next encompassing feature.
+        # Otherwise, pass along the new encompassing feature.
         else:
-            self.currentEncompassingFeature = self.constructEncompassingFeature(nextLine)
             # After the first pass, make sure to send all new encompassing features to the output data handler.
             if self.previousEncompassingFeature is not None: 
                 self.outputDataHandler.onNewEncompassingFeature(self.currentEncompassingFeature)
@@ -161,10 +313,17 @@ class ThisInThatCounter(ABC):
             if (self.previousEncompassingFeature is None 
                 or self.previousEncompassingFeature.chromosome != self.currentEncompassingFeature.chromosome):
                 if not self.suppressOutput: print("Counting in",self.currentEncompassingFeature.chromosome)
+                if self.metrics is not None: self.metrics.onNewChromosome(self.currentEncompassingFeature.chromosome)
 
         # Check confirmed encompasssed features against the current and previous encompassing features.  (Unless this is the first encompassing feature)
         if self.previousEncompassingFeature is not None: self.checkConfirmedEncompassedFeatures()
 
+        # If requested, record memory usage once the previous chromosome is finished.
+        if self.memoryReports is not None and self.previousEncompassingFeature is not None and (
+            self.currentEncompassingFeature is None or
+            self.previousEncompassingFeature.chromosome != self.currentEncompassingFeature.chromosome
+        ): self.recordMemorySnapshot(self.previousEncompassingFeature.chromosome)
+
 
     def constructEncompassingFeature(self, line) -> EncompassingData:
         """
@@ -210,16 +369,64 @@ class ThisInThatCounter(ABC):
         self.outputDataHandler.createOutputDataWriter(self.outputFilePath)
 
 
+    def getBootstrapFilePath(self):
+        """
+        Returns the file path that bootstrapped confidence intervals are written to.
+        """
+        return self.outputFilePath.rsplit('.',1)[0] + "_bootstrap.tsv"
+
+
+    def flushSortedOutput(self):
+        """
+        If sorting output while writing incrementally, writes any waiting rows that are guaranteed to come before every feature
+        that could still be written.  (Those are the features still being tracked and any that haven't been read yet, which,
+        since the input is sorted, can't come before the current feature.)
+        """
+        if not self.sortOutputOnExit or not self.outputDataHandler.writer.sortedRowsHeap: return
+
+        if self.writeIncrementally == ENCOMPASSED_DATA: nextFeature = self.currentEncompassedFeature
+        else: nextFeature = self.currentEncompassingFeature
+        waitingSortKeys = [self.outputDataHandler.outputDataStratifiers[0].getMinimumSortKey()]
+        if nextFeature is not None: waitingSortKeys.append(nextFeature.getSortKey())
+        waitingSortKeys = [sortKey for sortKey in waitingSortKeys if sortKey is not None]
+
+        self.outputDataHandler.writer.flushSortedRows(min(waitingSortKeys, default = None))
+
+
+    def recordMemorySnapshot(self, chromosome):
+        """
+        Records the output data handler's memory report (see CounterOutputDataHandler.getMemoryReport) and a tracemalloc snapshot
+        for the given (just finished) chromosome.
+        """
+        self.memoryReports[chromosome] = self.outputDataHandler.getMemoryReport()
+        self.memorySnapshots[chromosome] = tracemalloc.take_snapshot()
+
+
+    def finishWriting(self):
+        """
+        Writes the results, or finishes writing them if writing incrementally.
+        """
+        if self.writeIncrementally: self.outputDataHandler.writer.finishIndividualFeatureWriting()
+        else: self.outputDataHandler.writer.writeResults()
+
+
     def reconcileChromosomes(self):
         """
         Takes an encompassed object and encompassing object which have unequal chromosomes and reads through data until they are equal.
         """
 
         # Until the chromosomes are the same for both mutations and genes, read through the one with the eariler chromosome.
+        # If using chromosome indices, jump straight to the other feature's chromosome unless the skipped features need to be tracked.
         while (self.currentEncompassedFeature is not None and self.currentEncompassingFeature is not None and 
                self.currentEncompassedFeature.chromosome != self.currentEncompassingFeature.chromosome):
-            if self.currentEncompassedFeature.chromosome < self.currentEncompassingFeature.chromosome: self.readNextEncompassedFeature()
-            else: self.readNextEncompassingFeature()
+            if self.currentEncompassedFeature.chromosome < self.currentEncompassingFeature.chromosome:
+                if self.useChromosomeIndex and not self.outputDataHandler.trackAllEncompassed:
+                    self.encompassedFeaturesFile.seekToChromosome(self.currentEncompassingFeature.chromosome)
+                self.readNextEncompassedFeature()
+            else:
+                if self.useChromosomeIndex and not self.outputDataHandler.trackAllEncompassing:
+                    self.encompassingFeaturesFile.seekToChromosome(self.currentEncompassedFeature.chromosome)
+                self.readNextEncompassingFeature()
 
 
     def isEncompassedFeaturePastEncompassingFeature(self):
@@ -261,6 +468,33 @@ class ThisInThatCounter(ABC):
         else: return False
 
 
+    def switchToIncrementalWriting(self):
+        """
+        Starts writing encompassed or encompassing features incrementally (based on the first stratifier) partway through counting.
+        Features that may still be counted (confirmed encompassed features and the current features) are kept until they are finished.
+        If the first stratifier isn't a feature stratifier, or the final stratifier's keys (the output's columns) aren't fixed before
+        counting, the output can't be written incrementally, so a warning is given instead.
+        """
+        outputDataStratifiers = self.outputDataHandler.outputDataStratifiers
+        if outputDataStratifiers and not outputDataStratifiers[-1].hasFixedKeys():
+            self.memoryGovernor.warnAboutStructure()
+            return
+        elif outputDataStratifiers and isinstance(outputDataStratifiers[0], EncompassedFeatureODS):
+            incrementalWriting = ENCOMPASSED_DATA
+            featuresStillInUse = set(self.confirmedEncompassedFeatures)
+            if self.currentEncompassedFeature is not None: featuresStillInUse.add(self.currentEncompassedFeature)
+        elif outputDataStratifiers and isinstance(outputDataStratifiers[0], EncompassingFeatureODS):
+            incrementalWriting = ENCOMPASSING_DATA
+            featuresStillInUse = {self.currentEncompassingFeature}
+        else:
+            self.memoryGovernor.warnAboutStructure()
+            return
+
+        if not self.suppressOutput: print("Nearing the memory budget.  Switching to incremental writing...")
+        self.outputDataHandler.enableIncrementalWriting(incrementalWriting, featuresStillInUse)
+        self.writeIncrementally = incrementalWriting
+
+
     def checkConfirmedEncompassedFeatures(self):    
         """
         For all encompassed features that are confirmed to be within the previous encompassing feature, figure out how to handle them
@@ -280,7 +514,13 @@ class ThisInThatCounter(ABC):
         # Tell the output data handler to write the current set of features if incremental writing is requested.
         # NOTE: It's important that this happens before reprocessing of remaining encompassed features with the current encompassing feature, as this can
         #       cause the current encompassing feature to get flagged for writing and removal.
-        if self.writeIncrementally != 0: self.outputDataHandler.writeWaitingFeatures()
+        # If nearing the memory budget without writing incrementally, switch to incremental writing (if possible).
+        if self.memoryGovernor is not None and self.writeIncrementally == 0 and self.memoryGovernor.isNearBudget():
+            self.switchToIncrementalWriting()
+
+        if self.writeIncrementally != 0:
+            self.outputDataHandler.writeWaitingFeatures()
+            self.flushSortedOutput()
 
         # Next, reprocess all remaining features, provided they are not ahead of the encompassing feature's range.
         for feature in self.confirmedEncompassedFeatures:
@@ -288,6 +528,39 @@ class ThisInThatCounter(ABC):
                 self.outputDataHandler.onEncompassedFeatureInEncompassingFeature(feature, self.currentEncompassingFeature, False)
 
 
+    def estimate(self, sampleLinesPerChromosome = 1000):
+        """
+        Estimates the cost of counting (total features, stratifier keys, output size, peak memory when writing all at once or
+        incrementally, and wall time) by counting only the first sampleLinesPerChromosome encompassed features on each chromosome
+        and projecting the results to the full inputs.  (See CounterEstimate.CounterEstimator)
+        The counter itself is unaffected, so count can still be called afterwards.  Returns the estimates as a dictionary.
+        """
+        from benbiohelpers.CountThisInThat.CounterEstimate import CounterEstimator
+        counterEstimator = CounterEstimator(self, sampleLinesPerChromosome)
+        estimates = counterEstimator.estimate()
+        if not self.suppressOutput: print(counterEstimator.getFormattedReport())
+        return estimates
+
+
+    def countDelta(self, tableFilePath, updatedTableFilePath = None):
+        """
+        Counts this counter's encompassed features (e.g. only those added since a stored table was last counted) and adds the
+        counts into the stored table at tableFilePath.  (See DeltaCounting.updateCountTable)
+        """
+        from benbiohelpers.CountThisInThat.DeltaCounting import updateCountTable
+        updateCountTable(self, tableFilePath, updatedTableFilePath)
+
+
+    def countWithCache(self, cacheDirectory) -> bool:
+        """
+        Counts as usual unless an identical count (same inputs, counter class, stratifiers, and writer options) has already been
+        cached in the given directory, in which case the cached output is copied to the output file path instead.
+        Returns whether or not the cached output was used.  (See ResultCache.CounterResultCache)
+        """
+        from benbiohelpers.CountThisInThat.ResultCache import CounterResultCache
+        return CounterResultCache(cacheDirectory).count(self)
+
+
     def count(self):
         """
         Run through both files, counting encompassed features within encompassing features as detailed by classes setup.
@@ -330,15 +603,17 @@ class ThisInThatCounter(ABC):
         self.encompassingFeaturesFile.close()
 
         # Write (or finish writing) as necessary.
-        if self.writeIncrementally: self.outputDataHandler.writer.finishIndividualFeatureWriting()
-        else: self.outputDataHandler.writer.writeResults()
-
-        # If specified, sort the output using the same parameters for checking for sorted input.
-        # (This is useful if encompassed features are larger ranges reduced to midpoints, which
-        # can result in an unsorted output.)
-        # NOTE: This represents yet another potential problem with this library, since midpoints may not actually be sorted
-        # based on the sorting enforced by the checkForSortedInput function, and I think the logic kinda assumes they are.
-        # So... Yeah. Should probably do something about that.
-        if self.sortOutputOnExit:
-            if not self.suppressOutput: print("Sorting output...")
-            subprocess.check_output(("sort","-k1,1","-k2,2n", "-k3,3n", "-s", "-o", self.outputFilePath, self.outputFilePath))
\ No newline at end of file
+        self.finishWriting()
+        if self.startedTracingMemory: tracemalloc.stop()
+
+        # If requested, bootstrap the encompassing features to get confidence intervals for every output cell.
+        if self.bootstrapIterations > 0:
+            from benbiohelpers.CountThisInThat.ResamplingStatistics import BootstrapResampler
+            if not self.suppressOutput: print("Bootstrapping encompassing features...")
+            BootstrapResampler(self.outputDataHandler, self.bootstrapIterations, self.bootstrapSeed).writeSummary(self.getBootstrapFilePath())
+
+        # If metrics were collected, finalize and return them.
+        if self.metrics is not None:
+            self.metrics.finish()
+            if not self.suppressOutput: print(self.metrics.getFormattedReport())
+            return self.metrics.getMetrics()
@@ -0,0 +1,201 @@
+# This script contains a class for estimating the cost of running a ThisInThatCounter (total features, output size, peak memory,
+# and wall time) from a small sample of its inputs, so that resources and the write mode can be chosen before the real run.
+import copy, io, os, tempfile
+from time import perf_counter
+from typing import Dict, List
+from benbiohelpers.CountThisInThat.ColumnarOutput import isColumnarOutput, loadColumnarTable
+from benbiohelpers.CountThisInThat.CounterMetrics import CounterMetrics
+from benbiohelpers.CountThisInThat.InputDataStructures import ENCOMPASSED_DATA, ENCOMPASSING_DATA
+from benbiohelpers.CountThisInThat.MemoryGovernor import getDeepSize
+from benbiohelpers.CountThisInThat.OutputDataStratifiers import EncompassedFeatureODS, EncompassingFeatureODS
+from benbiohelpers.FileSystemHandling.ChromosomeIndex import getChromosomeIndex
+
+
+class CounterEstimator:
+    """
+    Estimates the cost of running the given counter by counting a sample of its inputs: the first sampleLinesPerChromosome
+    encompassed features on each chromosome, along with the encompassing features near them.  Chromosome indices (see
+    FileSystemHandling.ChromosomeIndex) are used to find each chromosome's lines and sizes without parsing the whole files.
+    Projections assume that the sampled lines are representative of the rest of their files.  Stratifiers that are keyed by
+    features (and the output rows and memory that depend on them) are scaled up by the number of features; other stratifiers
+    are assumed to already have all of their keys in the sample.
+    The sample is counted on a copy of the counter, so the counter itself is left untouched and can still be run afterwards.
+    """
+
+    def __init__(self, counter, sampleLinesPerChromosome = 1000):
+        assert counter.regions is None, "Estimates can't be made for counters restricted to regions."
+        assert isinstance(counter.encompassedFeaturesFilePath, (str, os.PathLike)) and isinstance(
+            counter.encompassingFeaturesFilePath, (str, os.PathLike)), "Estimates can't be made for streamed input."
+        self.counter = counter
+        self.sampleLinesPerChromosome = sampleLinesPerChromosome
+        self.estimates: Dict = None
+
+
+    def getChromosomeSizes(self, chromosomeIndex) -> Dict[str, int]:
+        """
+        Returns the number of bytes for each acceptable chromosome in the given index.
+        """
+        acceptableChromosomes = self.counter.acceptableChromosomes
+        return {chromosome: endOffset - startOffset for chromosome, (startOffset, endOffset) in chromosomeIndex.chromosomeOffsets.items()
+                if acceptableChromosomes is None or chromosome in acceptableChromosomes}
+
+
+    def sampleInputs(self):
+        """
+        Reads the sampled lines from each input.  Returns the sampled encompassed and encompassing lines along with the total
+        number of bytes in (acceptable chromosomes of) each input.
+        """
+        counter = self.counter
+        encompassedIndex = getChromosomeIndex(counter.encompassedFeaturesFilePath, int(counter.headersInEncompassedFeatures))
+        encompassingIndex = getChromosomeIndex(counter.encompassingFeaturesFilePath, int(counter.headersInEncompassingFeatures))
+        encompassedBytes = self.getChromosomeSizes(encompassedIndex)
+        encompassingBytes = self.getChromosomeSizes(encompassingIndex)
+
+        encompassedLines: List[str] = list()
+        encompassingLines: List[str] = list()
+        with open(counter.encompassedFeaturesFilePath, 'rb') as encompassedFile, \
+             open(counter.encompassingFeaturesFilePath, 'rb') as encompassingFile:
+            for chromosome in encompassedBytes:
+                if chromosome not in encompassingBytes: continue
+
+                # Read the first lines on this chromosome...
+                startOffset, endOffset = encompassedIndex.chromosomeOffsets[chromosome]
+                encompassedFile.seek(startOffset)
+                chromosomeLines = list()
+                while len(chromosomeLines) < self.sampleLinesPerChromosome and encompassedFile.tell() < endOffset:
+                    chromosomeLines.append(encompassedFile.readline().decode())
+                encompassedLines.extend(chromosomeLines)
+
+                # ...and the encompassing features that could encompass them.
+                windowStart = int(chromosomeLines[0].split('\t')[1])
+                windowEnd = int(chromosomeLines[-1].split('\t')[2])
+                startOffset, endOffset = encompassingIndex.getRegionOffsets(chromosome, windowStart, windowEnd,
+                                                                            int(counter.encompassingFeatureExtraRadius))
+                encompassingFile.seek(startOffset)
+                encompassingLines.extend(line.decode() for line in encompassingFile.read(endOffset - startOffset).splitlines(True))
+
+        assert encompassingLines, "No encompassing features were found near the sampled encompassed features, so nothing can be estimated."
+        return encompassedLines, encompassingLines, sum(encompassedBytes.values()), sum(encompassingBytes.values())
+
+
+    def countSample(self, encompassedLines, encompassingLines, outputFilePath, writeIncrementally):
+        """
+        Counts the given sample lines with a copy of the counter, writing to the given output file path, and returns the copy.
+        When writing incrementally, metrics are collected so that the peak size of the output data structure is known.
+        """
+        sampleCounter = copy.copy(self.counter)
+
+        # Remove any instance-level replacements of methods (e.g. from metrics collection), which are bound to the original counter.
+        for name, value in list(vars(sampleCounter).items()):
+            if callable(value) and hasattr(type(sampleCounter), name): delattr(sampleCounter, name)
+
+        sampleCounter.encompassedFeaturesFile = io.StringIO(''.join(encompassedLines))
+        sampleCounter.encompassingFeaturesFile = io.StringIO(''.join(encompassingLines))
+        sampleCounter.useChromosomeIndex = False
+        sampleCounter.outputFilePath = outputFilePath
+        sampleCounter.writeIncrementally = writeIncrementally
+        sampleCounter.suppressOutput = True
+        sampleCounter.sortOutputOnExit = False
+        sampleCounter.bootstrapIterations = 0
+        sampleCounter.maxMemory = None
+        sampleCounter.memoryGovernor = None
+        sampleCounter.memoryReports = None
+        sampleCounter.memorySnapshots = None
+        sampleCounter.startedTracingMemory = False
+        sampleCounter.metrics = None
+        if writeIncrementally != 0:
+            sampleCounter.metrics = CounterMetrics()
+            sampleCounter.metrics.counter = sampleCounter
+
+        sampleCounter.setUpCountingState()
+        sampleCounter.count()
+        return sampleCounter
+
+
+    def estimate(self) -> Dict:
+        """
+        Counts the sample and returns a dictionary of projections for the full inputs.
+        The sample is counted as the counter is configured (for timing and output size), and then, if the output can be
+        written incrementally, both with and without incremental writing (for peak memory).
+        """
+        encompassedLines, encompassingLines, encompassedBytes, encompassingBytes = self.sampleInputs()
+        sampledEncompassed = len(encompassedLines)
+        sampledEncompassing = len(encompassingLines)
+        projectedEncompassed = round(encompassedBytes / (sum(len(line) for line in encompassedLines) / sampledEncompassed))
+        projectedEncompassing = round(encompassingBytes / (sum(len(line) for line in encompassingLines) / sampledEncompassing))
+        featureScales = {EncompassedFeatureODS: projectedEncompassed / sampledEncompassed,
+                         EncompassingFeatureODS: projectedEncompassing / sampledEncompassing}
+
+        with tempfile.TemporaryDirectory() as tempDir:
+            outputFilePath = os.path.join(tempDir, os.path.basename(self.counter.outputFilePath or "sample.tsv"))
+
+            # Count the sample as the counter is configured.
+            startTime = perf_counter()
+            sampleCounter = self.countSample(encompassedLines, encompassingLines, outputFilePath, self.counter.writeIncrementally)
+            sampleSeconds = perf_counter() - startTime
+            if isColumnarOutput(outputFilePath):
+                outputRows = len(loadColumnarTable(outputFilePath))
+                outputBytes = sum(os.path.getsize(os.path.join(outputFilePath, fileName)) for fileName in os.listdir(outputFilePath))
+            else:
+                with open(outputFilePath, 'rb') as outputFile: outputLines = outputFile.readlines()
+                outputRows, outputBytes = len(outputLines), sum(len(line) for line in outputLines)
+
+            # Writing all at once holds the whole output data structure in memory, so measure it (and its keys) from a count
+            # that didn't write incrementally.
+            if self.counter.writeIncrementally == 0: batchCounter = sampleCounter
+            else: batchCounter = self.countSample(encompassedLines, encompassingLines, outputFilePath, 0)
+            outputDataStructure = batchCounter.outputDataHandler.outputDataStructure
+            batchMemory = getDeepSize(outputDataStructure)
+            outputDataStratifiers = batchCounter.outputDataHandler.outputDataStratifiers
+
+            # Determine how the output scales with the number of features.
+            stratifierKeys = dict()
+            for i, outputDataStratifier in enumerate(outputDataStratifiers):
+                keyCount = len(outputDataStratifier.allKeys)
+                if type(outputDataStratifier) in featureScales: keyCount = round(keyCount * featureScales[type(outputDataStratifier)])
+                stratifierKeys[f"{i}:{type(outputDataStratifier).__name__}({outputDataStratifier.outputName})"] = keyCount
+            if outputDataStratifiers and type(outputDataStratifiers[0]) in featureScales:
+                outputScale = featureScales[type(outputDataStratifiers[0])]
+                incrementalWriting = ENCOMPASSED_DATA if isinstance(outputDataStratifiers[0], EncompassedFeatureODS) else ENCOMPASSING_DATA
+            else: outputScale, incrementalWriting = 1, None
+
+            # Writing incrementally only holds the features that are still being counted.
+            if incrementalWriting is None: incrementalMemory = None
+            else:
+                incrementalCounter = self.countSample(encompassedLines, encompassingLines, outputFilePath, incrementalWriting)
+                peakKeys = incrementalCounter.metrics.peakOutputDataStructureKeys
+                incrementalMemory = round(batchMemory / max(len(outputDataStructure), 1) * peakKeys)
+
+        self.estimates = {
+            "sampledEncompassedFeatures": sampledEncompassed,
+            "sampledEncompassingFeatures": sampledEncompassing,
+            "projectedEncompassedFeatures": projectedEncompassed,
+            "projectedEncompassingFeatures": projectedEncompassing,
+            "projectedStratifierKeys": stratifierKeys,
+            "projectedOutputRows": round(outputRows * outputScale),
+            "projectedOutputBytes": round(outputBytes * outputScale),
+            "projectedPeakMemory": {"batch": round(batchMemory * outputScale), "incremental": incrementalMemory},
+            "projectedSeconds": sampleSeconds * (projectedEncompassed + projectedEncompassing) / (sampledEncompassed + sampledEncompassing)
+        }
+        return self.estimates
+
+
+    def getFormattedReport(self) -> str:
+        """
+        Returns the estimates as a human-readable string.
+        """
+        estimates = self.estimates
+        reportLines = [
+            f"Projected features: {estimates['projectedEncompassedFeatures']} encompassed, "
+            f"{estimates['projectedEncompassingFeatures']} encompassing "
+            f"(from {estimates['sampledEncompassedFeatures']} and {estimates['sampledEncompassingFeatures']} sampled)",
+            "Projected stratifier keys:"
+        ]
+        for stratifierName, keyCount in estimates["projectedStratifierKeys"].items(): reportLines.append(f"    {stratifierName}: {keyCount}")
+        reportLines.append(f"Projected output: {estimates['projectedOutputRows']} rows, {estimates['projectedOutputBytes']/2**20:.1f} MiB")
+        peakMemory = estimates["projectedPeakMemory"]
+        reportLines.append(f"Projected peak memory: {peakMemory['batch']/2**20:.1f} MiB writing all at once, " +
+                           ("not applicable" if peakMemory["incremental"] is None else f"{peakMemory['incremental']/2**20:.1f} MiB")
+                           + " writing incrementally")
+        reportLines.append(f"Projected time: {estimates['projectedSeconds']:.1f} s")
+        return '\n'.join(reportLines)
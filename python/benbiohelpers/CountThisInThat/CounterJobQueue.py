@@ -0,0 +1,423 @@
+# This script contains classes for describing ThisInThatCounter runs as JSON job files and running them from a directory-based
+# queue on shared storage, so that a large count can be split into per-chromosome shards and spread across many worker processes
+# (on one machine or many nodes) without an external workflow system.  Shard outputs are merged into a single table afterwards.
+#
+# Usage: submit jobs with CounterJobQueue.submitShards, start any number of workers with
+#     python -m benbiohelpers.CountThisInThat.CounterJobQueue <queue directory>
+# and then merge the finished shards with CounterJobQueue.mergeShards.
+import importlib, json, os, shutil, socket, sys, threading, time, traceback
+from typing import Dict, List, Type, Union
+from benbiohelpers.CountThisInThat.ColumnarOutput import ColumnarTableWriter, isColumnarOutput, loadColumnarTable
+from benbiohelpers.CountThisInThat.CountDerivatives import getNonSumHeaders
+from benbiohelpers.CountThisInThat.Counter import ThisInThatCounter
+from benbiohelpers.CountThisInThat.CounterOutputDataHandler import OutputDataWriter
+from benbiohelpers.CountThisInThat.OutputDataStratifiers import getChromosomeSortKeyFunction, parsePositionID
+from benbiohelpers.FileSystemHandling.ChromosomeIndex import getChromosomeIndex
+
+PENDING_DIRECTORY = "pending"
+CLAIMED_DIRECTORY = "claimed"
+DONE_DIRECTORY = "done"
+FAILED_DIRECTORY = "failed"
+CLAIM_SUFFIX = ".claim"
+
+
+class CounterJob:
+    """
+    Describes a single counter run: the counter class (which determines the stratifiers and writer options), the input and output
+    file paths, keyword arguments for the counter's constructor, and any counter attributes that need to be set before the
+    constructor is called (as with CounterConfiguration).  Arguments and attributes must be JSON serializable.
+    The counter class may be given as a class or as a "module:QualifiedName" string, and must be importable by the workers.
+    """
+
+    def __init__(self, counterClass: Union[Type[ThisInThatCounter], str], encompassedFeaturesFilePath, encompassingFeaturesFilePath,
+                 outputFilePath, counterArguments: Dict = None, counterAttributes: Dict = None, jobName = None, shardOf = None):
+        if not isinstance(counterClass, str):
+            assert counterClass.__module__ != "__main__", "Counter classes must be defined in an importable module to be run as jobs."
+            counterClass = f"{counterClass.__module__}:{counterClass.__qualname__}"
+        self.counterClass = counterClass
+        self.encompassedFeaturesFilePath = str(encompassedFeaturesFilePath)
+        self.encompassingFeaturesFilePath = str(encompassingFeaturesFilePath)
+        self.outputFilePath = str(outputFilePath)
+        self.counterArguments = dict() if counterArguments is None else counterArguments
+        self.counterAttributes = dict() if counterAttributes is None else counterAttributes
+        if jobName is None: jobName = os.path.basename(self.outputFilePath).rsplit('.', 1)[0]
+        self.jobName = jobName
+        self.shardOf = shardOf # The output file path of the job this is a shard of, if any.
+
+
+    def toDict(self) -> Dict:
+        return dict(vars(self))
+
+
+    @classmethod
+    def fromDict(cls, jobDict: Dict):
+        return cls(**jobDict)
+
+
+    def write(self, jobFilePath):
+        with open(jobFilePath, 'w') as jobFile: json.dump(self.toDict(), jobFile, indent = 4)
+
+
+    @classmethod
+    def read(cls, jobFilePath):
+        with open(jobFilePath, 'r') as jobFile: return cls.fromDict(json.load(jobFile))
+
+
+    def getCounterClass(self) -> Type[ThisInThatCounter]:
+        moduleName, qualifiedName = self.counterClass.split(':')
+        counterClass = importlib.import_module(moduleName)
+        for name in qualifiedName.split('.'): counterClass = getattr(counterClass, name)
+        return counterClass
+
+
+    def createCounter(self) -> ThisInThatCounter:
+        counterClass = self.getCounterClass()
+        counter = counterClass.__new__(counterClass)
+        counter.__dict__.update(self.counterAttributes) # Set any attributes needed before the constructor sets up the output data handler.
+        counter.__init__(self.encompassedFeaturesFilePath, self.encompassingFeaturesFilePath, self.outputFilePath, **self.counterArguments)
+        return counter
+
+
+    def run(self) -> Dict:
+        """
+        Runs the counter and returns a record of the run, including the number of leading key columns in the output table
+        (i.e. the columns for every stratifier but the last, along with their supplemental information), whether or not
+        the table has a header row (which tables written incrementally may not), and the headers of any derived columns
+        that can't be summed when merging tables (see CountDerivatives.getNonSumHeaders).
+        """
+        startTime = time.time()
+        counter = self.createCounter()
+        keyColumnCount = sum(1 + len(outputDataStratifier.supplementalInfoHandlers)
+                             for outputDataStratifier in counter.outputDataHandler.outputDataStratifiers[:-1])
+        counter.count()
+        # Writers other than the OutputDataWriter (e.g. for sketches) always write headers and have no derived columns.
+        writer = counter.outputDataHandler.writer
+        hasHeaders = getattr(writer, "headersWritten", True)
+        nonSumHeaders = getNonSumHeaders(writer) if isinstance(writer, OutputDataWriter) else list()
+        return {"outputFilePath": self.outputFilePath, "keyColumnCount": keyColumnCount, "hasHeaders": hasHeaders,
+                "nonSumHeaders": nonSumHeaders, "seconds": time.time() - startTime}
+
+
+    def getShards(self, shardDirectory) -> List["CounterJob"]:
+        """
+        Splits the job into one shard for each chromosome in the input files (found with their chromosome indices),
+        each of which writes a partial table to the given directory.  Partial tables have the same format (e.g. tsv, bed,
+        or columnar) as the job's output.
+        """
+        assert "acceptableChromosomes" not in self.counterArguments and "regions" not in self.counterArguments, (
+            "Jobs restricted to specific chromosomes or regions can't be sharded.")
+        # Chromosomes are sorted the same way as the input files, so shards are numbered in the order a single counter would count them.
+        chromosomes = set(getChromosomeIndex(self.encompassedFeaturesFilePath,
+                                             int(self.counterArguments.get("headersInEncompassedFeatures", False))).getChromosomes())
+        chromosomes.update(getChromosomeIndex(self.encompassingFeaturesFilePath,
+                                              int(self.counterArguments.get("headersInEncompassingFeatures", False))).getChromosomes())
+        outputExtension = os.path.splitext(self.outputFilePath)[1] or ".tsv"
+
+        shards = list()
+        for i, chromosome in enumerate(sorted(chromosomes)):
+            shardName = f"{self.jobName}_{i:04d}_{chromosome}"
+            counterArguments = dict(self.counterArguments, acceptableChromosomes = [chromosome], useChromosomeIndex = True)
+            shards.append(CounterJob(self.counterClass, self.encompassedFeaturesFilePath, self.encompassingFeaturesFilePath,
+                                     os.path.join(shardDirectory, shardName + outputExtension), counterArguments, self.counterAttributes,
+                                     shardName, self.outputFilePath))
+        return shards
+
+
+def readPartialTable(partialTableFilePath, hasHeaders = True):
+    """
+    Yields the headers of the given tsv or columnar table (None if it has no header row) followed by each of its rows,
+    each given as a list of strings.
+    """
+    if isColumnarOutput(partialTableFilePath):
+        columnarTable = loadColumnarTable(partialTableFilePath)
+        yield columnarTable.headers
+        columns = [columnarTable[header].tolist() for header in columnarTable.headers]
+        for row in zip(*columns): yield [str(value) for value in row]
+        return
+
+    with open(partialTableFilePath, 'r') as partialTableFile:
+        if hasHeaders:
+            headerLine = partialTableFile.readline()
+            yield headerLine.rstrip('\n').split('\t') if headerLine else None
+        else: yield None
+        for line in partialTableFile: yield line.rstrip('\n').split('\t')
+
+
+def mergePartialTables(partialTableFilePaths: List[str], outputFilePath, keyColumnCount, sortByPosition = False,
+                       naturalChromosomeOrder = False, hasHeaders: Union[bool, List[bool]] = True):
+    """
+    Merges tables written by shards of the same job into one table.  Rows are identified by their first keyColumnCount columns,
+    and the remaining columns of rows with the same keys are summed.  Rows are kept in the order they are first seen, so
+    tables from per-chromosome shards should be given in chromosome order.
+    If sortByPosition is true, rows are instead sorted by the feature position in their first column (e.g. "chr1:100(+)"),
+    with chromosomes in natural order if naturalChromosomeOrder is true and any rows without positions (e.g. "None") last.
+    hasHeaders gives whether or not the tsv tables have a header row (e.g. tables written incrementally without
+    writeHeadersImmediately don't), either for all of them or as a list with one value per table.  Columnar tables always have headers.
+    Tables are written as columnar tables if the output file path ends with ".columnar".
+    NOTE: Every other column is assumed to be a count, so count derivatives that aren't sums (e.g. ratios) won't be merged correctly.
+          (CounterJobQueue.mergeShards refuses to merge tables with them.)
+    """
+    if isinstance(hasHeaders, bool): hasHeaders = [hasHeaders]*len(partialTableFilePaths)
+    headers = None
+    mergedRows: Dict[tuple, list] = dict()
+    for partialTableFilePath, partialTableHasHeaders in zip(partialTableFilePaths, hasHeaders):
+        rows = readPartialTable(partialTableFilePath, partialTableHasHeaders)
+        theseHeaders = next(rows)
+        if headers is None: headers = theseHeaders
+        elif theseHeaders is not None and theseHeaders != headers:
+            raise ValueError(f"Headers in {partialTableFilePath} don't match those of the other partial tables, so they can't be merged.")
+        for choppedUpLine in rows:
+            keys = tuple(choppedUpLine[:keyColumnCount])
+            counts = [float(count) if '.' in count or 'e' in count else int(count) for count in choppedUpLine[keyColumnCount:]]
+            if keys in mergedRows: mergedRows[keys] = [mergedCount + count for mergedCount, count in zip(mergedRows[keys], counts)]
+            else: mergedRows[keys] = counts
+
+    mergedRowItems = list(mergedRows.items())
+    if sortByPosition:
+        getChromosomeSortKey = getChromosomeSortKeyFunction(naturalChromosomeOrder)
+        def getSortKey(mergedRowItem):
+            try: parsedPositionID = parsePositionID(mergedRowItem[0][0])
+            except ValueError: return (1,)
+            return (0, getChromosomeSortKey(parsedPositionID[0])) + parsedPositionID[1:]
+        mergedRowItems.sort(key = getSortKey)
+
+    if isColumnarOutput(outputFilePath):
+        assert headers is not None, "Columnar tables can't be written without headers."
+        if os.path.isdir(outputFilePath): shutil.rmtree(outputFilePath)
+        outputFile = ColumnarTableWriter(outputFilePath, headers, keyColumnCount)
+    else:
+        outputFile = open(outputFilePath, 'w')
+        if headers is not None: outputFile.write('\t'.join(headers) + '\n')
+    for keys, counts in mergedRowItems:
+        outputFile.write('\t'.join(list(keys) + [str(count) for count in counts]) + '\n')
+    outputFile.close()
+
+
+def concatenatePartialTables(partialTableFilePaths: List[str], outputFilePath):
+    """
+    Writes the given tables one after another to the output file.  Used for incrementally written bed output, where rows are
+    individual features (which are never split between per-chromosome shards) and keep the formatting of their original lines.
+    """
+    with open(outputFilePath, 'w') as outputFile:
+        for partialTableFilePath in partialTableFilePaths:
+            with open(partialTableFilePath, 'r') as partialTableFile: shutil.copyfileobj(partialTableFile, outputFile)
+
+
+class CounterJobQueue:
+    """
+    A queue of counter jobs stored as JSON files in subdirectories of the given queue directory: pending, claimed, done, and failed.
+    Workers claim jobs by renaming them from pending to claimed, which is atomic, so any number of workers (on any nodes that
+    share the directory) can pull from the same queue without claiming the same job twice.  Finished jobs are moved to done along
+    with a record of their run, and jobs that raise an error are moved to failed along with the traceback.
+    Each claimed job has a claim file naming the worker running it, which the worker refreshes periodically while the job runs
+    (see keepClaimAlive), so that only jobs whose workers have stopped are requeued, and only the current claimant can finish a job.
+    """
+
+    def __init__(self, queueDirectory):
+        self.queueDirectory = str(queueDirectory)
+        for directory in (PENDING_DIRECTORY, CLAIMED_DIRECTORY, DONE_DIRECTORY, FAILED_DIRECTORY):
+            os.makedirs(self.getDirectory(directory), exist_ok = True)
+
+
+    def getDirectory(self, directory):
+        return os.path.join(self.queueDirectory, directory)
+
+
+    def getJobFileNames(self, directory) -> List[str]:
+        return sorted(fileName for fileName in os.listdir(self.getDirectory(directory)) if fileName.endswith(".json"))
+
+
+    def submit(self, job: CounterJob):
+        """
+        Adds the given job to the queue.  The job file is written under a temporary name first, so workers never see partial files.
+        """
+        jobFileName = job.jobName + ".json"
+        for directory in (PENDING_DIRECTORY, CLAIMED_DIRECTORY, DONE_DIRECTORY, FAILED_DIRECTORY):
+            assert not os.path.exists(os.path.join(self.getDirectory(directory), jobFileName)), (
+                f"A job named {job.jobName} is already in the queue.")
+        temporaryFilePath = os.path.join(self.queueDirectory, f".{jobFileName}.{os.getpid()}.tmp")
+        job.write(temporaryFilePath)
+        os.replace(temporaryFilePath, os.path.join(self.getDirectory(PENDING_DIRECTORY), jobFileName))
+
+
+    def submitShards(self, job: CounterJob, shardDirectory = None) -> List[CounterJob]:
+        """
+        Splits the given job into per-chromosome shards (see CounterJob.getShards) and submits them.  Partial tables are written
+        to the given directory (by default, a directory next to the job's output file).  Returns the shards.
+        """
+        if shardDirectory is None: shardDirectory = job.outputFilePath.rsplit('.', 1)[0] + "_shards"
+        os.makedirs(shardDirectory, exist_ok = True)
+        shards = job.getShards(shardDirectory)
+        for shard in shards: self.submit(shard)
+        return shards
+
+
+    def getClaimFilePath(self, jobFileName):
+        return os.path.join(self.getDirectory(CLAIMED_DIRECTORY), jobFileName.rsplit('.', 1)[0] + CLAIM_SUFFIX)
+
+
+    def claimNextJob(self, workerName = None):
+        """
+        Claims the next pending job for the given worker, returning its file name and the job itself, or None if no jobs are pending.
+        """
+        for jobFileName in self.getJobFileNames(PENDING_DIRECTORY):
+            claimedFilePath = os.path.join(self.getDirectory(CLAIMED_DIRECTORY), jobFileName)
+            try: os.rename(os.path.join(self.getDirectory(PENDING_DIRECTORY), jobFileName), claimedFilePath)
+            except FileNotFoundError: continue # Another worker claimed it first.
+            with open(self.getClaimFilePath(jobFileName), 'w') as claimFile: claimFile.write(str(workerName))
+            os.utime(claimedFilePath) # Mark when the job was claimed, for requeueStaleJobs.
+            return jobFileName, CounterJob.read(claimedFilePath)
+        return None
+
+
+    def holdsClaim(self, jobFileName, workerName = None) -> bool:
+        """
+        Returns whether or not the given worker still holds its claim on the given job (i.e. it hasn't been requeued since).
+        """
+        try:
+            with open(self.getClaimFilePath(jobFileName), 'r') as claimFile: return claimFile.read() == str(workerName)
+        except FileNotFoundError: return False
+
+
+    def refreshClaim(self, jobFileName, workerName = None) -> bool:
+        """
+        Marks the given worker's claim on the given job as still active, so that requeueStaleJobs leaves the job alone.
+        Returns False if the claim has been lost.
+        """
+        if not self.holdsClaim(jobFileName, workerName): return False
+        try: os.utime(os.path.join(self.getDirectory(CLAIMED_DIRECTORY), jobFileName))
+        except FileNotFoundError: return False
+        return True
+
+
+    def keepClaimAlive(self, jobFileName, workerName, heartbeatSeconds, stopEvent: threading.Event):
+        """
+        Refreshes the given worker's claim on the given job every heartbeatSeconds until the stop event is set or the claim is lost.
+        Meant to be run in a separate thread while the job runs.
+        """
+        while not stopEvent.wait(heartbeatSeconds):
+            if not self.refreshClaim(jobFileName, workerName): return
+
+
+    def finishJob(self, jobFileName, directory, record: Dict, workerName = None) -> bool:
+        """
+        Moves a job claimed by the given worker to the given directory (done or failed), writing the given record next to it.
+        If the worker's claim was lost (e.g. the job was requeued and claimed by another worker), the job is left alone and
+        False is returned.
+        """
+        if not self.holdsClaim(jobFileName, workerName): return False
+        jobName = jobFileName.rsplit('.', 1)[0]
+        try: os.replace(os.path.join(self.getDirectory(CLAIMED_DIRECTORY), jobFileName), os.path.join(self.getDirectory(directory), jobFileName))
+        except FileNotFoundError: return False # Requeued just now.
+        with open(os.path.join(self.getDirectory(directory), jobName + ".record"), 'w') as recordFile: json.dump(record, recordFile, indent = 4)
+        try: os.remove(self.getClaimFilePath(jobFileName))
+        except FileNotFoundError: pass
+        return True
+
+
+    def requeueStaleJobs(self, maxSeconds):
+        """
+        Moves jobs whose claims haven't been refreshed in more than maxSeconds (e.g. because their workers' nodes went down) back to
+        pending.  maxSeconds should be comfortably longer than the workers' heartbeatSeconds.  Returns the names of the requeued job files.
+        """
+        requeuedJobFileNames = list()
+        for jobFileName in self.getJobFileNames(CLAIMED_DIRECTORY):
+            claimedFilePath = os.path.join(self.getDirectory(CLAIMED_DIRECTORY), jobFileName)
+            try:
+                if time.time() - os.path.getmtime(claimedFilePath) <= maxSeconds: continue
+                os.rename(claimedFilePath, os.path.join(self.getDirectory(PENDING_DIRECTORY), jobFileName))
+            except FileNotFoundError: continue # The job just finished (or was requeued by someone else).
+            try: os.remove(self.getClaimFilePath(jobFileName))
+            except FileNotFoundError: pass
+            requeuedJobFileNames.append(jobFileName)
+        return requeuedJobFileNames
+
+
+    def getStatus(self) -> Dict[str, int]:
+        """
+        Returns the number of jobs in each state.
+        """
+        return {directory: len(self.getJobFileNames(directory))
+                for directory in (PENDING_DIRECTORY, CLAIMED_DIRECTORY, DONE_DIRECTORY, FAILED_DIRECTORY)}
+
+
+    def mergeShards(self, job: CounterJob):
+        """
+        Merges the partial tables from the finished shards of the given job into the job's output file.
+        Raises a ValueError if any of its shards haven't finished successfully, or if the tables have derived columns that
+        can't be summed (see CountDerivatives.getNonSumHeaders).
+        """
+        shardRecords = list()
+        for jobFileName in self.getJobFileNames(DONE_DIRECTORY):
+            shard = CounterJob.read(os.path.join(self.getDirectory(DONE_DIRECTORY), jobFileName))
+            if shard.shardOf != job.outputFilePath: continue
+            with open(os.path.join(self.getDirectory(DONE_DIRECTORY), shard.jobName + ".record"), 'r') as recordFile:
+                shardRecords.append(json.load(recordFile))
+
+        for directory in (PENDING_DIRECTORY, CLAIMED_DIRECTORY, FAILED_DIRECTORY):
+            for jobFileName in self.getJobFileNames(directory):
+                if CounterJob.read(os.path.join(self.getDirectory(directory), jobFileName)).shardOf == job.outputFilePath:
+                    raise ValueError(f"Shard {jobFileName} of {job.jobName} is {directory}, so the shards can't be merged yet.")
+        if not shardRecords: raise ValueError(f"No finished shards were found for {job.jobName}.")
+
+        # Shard names are numbered in chromosome order, so the records are already sorted.
+        # (Bed formatted rows are only written incrementally, without headers.  Otherwise, bed output is written like a tsv table.)
+        partialTableFilePaths = [shardRecord["outputFilePath"] for shardRecord in shardRecords]
+        hasHeaders = [shardRecord["hasHeaders"] for shardRecord in shardRecords]
+        if job.outputFilePath.endswith(".bed") and not any(hasHeaders):
+            concatenatePartialTables(partialTableFilePaths, job.outputFilePath)
+            return
+
+        nonSumHeaders = shardRecords[0].get("nonSumHeaders", list())
+        if nonSumHeaders:
+            raise ValueError(f"The derived columns {', '.join(nonSumHeaders)} in the shards of {job.jobName} aren't declared as sums of "
+                             "counts, so they can't be merged.  (Use count derivatives like sumOfColumns and mirroredSum, "
+                             "or CountDerivative with isSum = True.)")
+        mergePartialTables(partialTableFilePaths, job.outputFilePath, shardRecords[0]["keyColumnCount"], hasHeaders = hasHeaders)
+
+
+def runWorker(queueDirectory, waitSeconds = 0, pollInterval = 5, workerName = None, heartbeatSeconds = 60):
+    """
+    Claims and runs jobs from the queue in the given directory until no jobs are pending.
+    If waitSeconds is positive, the worker keeps checking for new jobs every pollInterval seconds until none have been
+    pending for that long.  While a job runs, its claim is refreshed every heartbeatSeconds.  (See CounterJobQueue.requeueStaleJobs)
+    Returns the number of jobs run (including any that failed or whose claims were lost).
+    """
+    if workerName is None: workerName = f"{socket.gethostname()}:{os.getpid()}"
+    queue = CounterJobQueue(queueDirectory)
+    jobsRun = 0
+    idleSince = time.time()
+
+    while True:
+        claimedJob = queue.claimNextJob(workerName)
+        if claimedJob is None:
+            if time.time() - idleSince >= waitSeconds: return jobsRun
+            time.sleep(pollInterval)
+            continue
+
+        jobFileName, job = claimedJob
+        stopHeartbeat = threading.Event()
+        heartbeat = threading.Thread(target = queue.keepClaimAlive, args = (jobFileName, workerName, heartbeatSeconds, stopHeartbeat),
+                                     daemon = True)
+        heartbeat.start()
+        try: record = job.run()
+        except Exception: directory, record = FAILED_DIRECTORY, {"worker": workerName, "traceback": traceback.format_exc()}
+        else: directory, record = DONE_DIRECTORY, dict(record, worker = workerName)
+        finally:
+            stopHeartbeat.set()
+            heartbeat.join()
+
+        if not queue.finishJob(jobFileName, directory, record, workerName):
+            print(f"{workerName} lost its claim on {jobFileName} (it was requeued while running), so its results weren't recorded.")
+        jobsRun += 1
+        idleSince = time.time()
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python -m benbiohelpers.CountThisInThat.CounterJobQueue <queue directory> [seconds to wait for new jobs]")
+        return
+    runWorker(sys.argv[1], float(sys.argv[2]) if len(sys.argv) > 2 else 0)
+
+
+if __name__ == "__main__": main()
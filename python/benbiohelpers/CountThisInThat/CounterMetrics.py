@@ -0,0 +1,186 @@
+# This script contains a class for collecting timing and throughput information from the ThisInThatCounter.
+# Timing is added by wrapping the relevant methods on the counter and its components, so nothing is measured
+# (and nothing slows down) unless metrics are actually requested.
+from time import perf_counter
+from typing import Callable, Dict
+from benbiohelpers.CountThisInThat.SupplementalInformation import SUP_INFO_KEY
+
+
+class CounterMetrics:
+    """
+    Collects structured timing information for each phase of counting along with throughput and size information.
+    Phases are timed inclusively, so, for example, the time spent in stratifiers is also part of the encompassment handling time.
+    If a callback is given, it is called with the current metrics dictionary each time a chromosome finishes and once more at the end.
+    """
+
+    def __init__(self, metricsCallback: Callable[[Dict], None] = None):
+        self.metricsCallback = metricsCallback
+        self.startTime = perf_counter()
+        self.endTime = None
+
+        self.phaseTimes: Dict[str, float] = dict()
+        self.phaseCalls: Dict[str, int] = dict()
+
+        self.peakWaitingFeatures = {"confirmedEncompassed": 0, "encompassedToWrite": 0, "encompassingToWrite": 0}
+        self.peakOutputDataStructureKeys = 0
+        self.outputDataStructureSizes: Dict[str, Dict[str, int]] = dict()
+        self.outputCells = 0
+
+        self.currentChromosome = None
+        self.currentChromosomeStartTime = None
+        self.chromosomeTimes: Dict[str, float] = dict()
+
+        self.counter = None
+
+
+    def timeMethod(self, owner, methodName, phaseName, beforeCall: Callable[[], None] = None):
+        """
+        Replaces the given method on the given object with a version that records the time spent in it under the given phase name.
+        If beforeCall is given, it is called (untimed) before each call to the method.
+        """
+        method = getattr(owner, methodName)
+        phaseTimes = self.phaseTimes
+        phaseCalls = self.phaseCalls
+        phaseTimes.setdefault(phaseName, 0.0)
+        phaseCalls.setdefault(phaseName, 0)
+
+        def timedMethod(*args, **kwargs):
+            if beforeCall is not None: beforeCall()
+            startTime = perf_counter()
+            try: return method(*args, **kwargs)
+            finally:
+                phaseTimes[phaseName] += perf_counter() - startTime
+                phaseCalls[phaseName] += 1
+
+        setattr(owner, methodName, timedMethod)
+
+
+    def instrumentInputParsing(self, counter):
+        """
+        Times the sort check and line parsing for the given counter.  Should be called before the counter checks its input.
+        """
+        self.counter = counter
+        self.timeMethod(counter, "checkForSortedInput", "sortCheck")
+        self.timeMethod(counter, "constructEncompassedFeature", "encompassedLineParsing")
+        self.timeMethod(counter, "constructEncompassingFeature", "encompassingLineParsing")
+
+
+    def instrumentOutputDataHandler(self, counter):
+        """
+        Times encompassment handling, each stratifier, each supplemental information handler, and writing for the given counter.
+        Should be called after the counter's output data handler has been set up.
+        """
+        outputDataHandler = counter.outputDataHandler
+
+        self.timeMethod(counter, "checkConfirmedEncompassedFeatures", "confirmedFeatureChecks", self.sampleWaitingFeatures)
+        self.timeMethod(counter, "flushSortedOutput", "outputSorting")
+        self.timeMethod(outputDataHandler, "onEncompassedFeatureInEncompassingFeature", "encompassmentHandling")
+        self.timeMethod(outputDataHandler, "writeWaitingFeatures", "writing", self.sampleWaitingFeatures)
+
+        for i, outputDataStratifier in enumerate(outputDataHandler.outputDataStratifiers):
+            stratifierName = f"{i}:{type(outputDataStratifier).__name__}({outputDataStratifier.outputName})"
+            self.timeMethod(outputDataStratifier, "getRelevantKey", stratifierName + ".getRelevantKey")
+            self.timeMethod(outputDataStratifier, "getKeyDirectly", stratifierName + ".getKeyDirectly")
+            self.timeMethod(outputDataStratifier, "updateConfirmedEncompassedFeature", stratifierName + ".updateConfirmedEncompassedFeature")
+            for supplementalInfoHandler in outputDataStratifier.supplementalInfoHandlers:
+                self.timeMethod(supplementalInfoHandler, "updateSupplementalInfo",
+                                f"{type(supplementalInfoHandler).__name__}({supplementalInfoHandler.outputName}).updateSupplementalInfo")
+
+        if outputDataHandler.writer is not None:
+            for methodName in ("writeResults", "writeFeature", "finishIndividualFeatureWriting"):
+                self.timeMethod(outputDataHandler.writer, methodName, "writing")
+
+
+    def sampleWaitingFeatures(self):
+        """
+        Updates the peak number of features waiting to be confirmed or written, and the peak size of the output data structure.
+        """
+        counter = self.counter
+        outputDataHandler = counter.outputDataHandler
+        peakWaitingFeatures = self.peakWaitingFeatures
+
+        peakWaitingFeatures["confirmedEncompassed"] = max(peakWaitingFeatures["confirmedEncompassed"],
+                                                          len(counter.confirmedEncompassedFeatures))
+        if outputDataHandler.encompassedFeaturesToWrite is not None:
+            peakWaitingFeatures["encompassedToWrite"] = max(peakWaitingFeatures["encompassedToWrite"],
+                                                            len(outputDataHandler.encompassedFeaturesToWrite))
+        if outputDataHandler.encompassingFeaturesToWrite is not None:
+            peakWaitingFeatures["encompassingToWrite"] = max(peakWaitingFeatures["encompassingToWrite"],
+                                                             len(outputDataHandler.encompassingFeaturesToWrite))
+        if isinstance(outputDataHandler.outputDataStructure, dict):
+            self.peakOutputDataStructureKeys = max(self.peakOutputDataStructureKeys, len(outputDataHandler.outputDataStructure))
+
+
+    def onNewChromosome(self, chromosome):
+        """
+        Records the time spent on the previous chromosome (if any) and starts timing the given one.
+        """
+        currentTime = perf_counter()
+        if self.currentChromosome is not None:
+            self.chromosomeTimes[self.currentChromosome] = (self.chromosomeTimes.get(self.currentChromosome, 0.0) +
+                                                            currentTime - self.currentChromosomeStartTime)
+            if self.metricsCallback is not None: self.metricsCallback(self.getMetrics())
+        self.currentChromosome = chromosome
+        self.currentChromosomeStartTime = currentTime
+
+
+    def recordOutputDataStructureSizes(self):
+        """
+        Records the number of keys and dictionaries held by each stratifier along with the total number of output cells.
+        """
+        self.outputDataStructureSizes = dict()
+        for i, outputDataStratifier in enumerate(self.counter.outputDataHandler.outputDataStratifiers):
+            self.outputDataStructureSizes[f"{i}:{type(outputDataStratifier).__name__}({outputDataStratifier.outputName})"] = {
+                "keys": len(outputDataStratifier.allKeys), "dictionaries": len(outputDataStratifier.outputDataDictionaries)
+            }
+            if outputDataStratifier.childDataStratifier is None:
+                self.outputCells = sum(len(dictionary) - (SUP_INFO_KEY in dictionary)
+                                       for dictionary in outputDataStratifier.outputDataDictionaries)
+
+
+    def finish(self):
+        """
+        Stops timing, records final sizes, and passes the final metrics to the callback, if there is one.
+        """
+        self.sampleWaitingFeatures()
+        self.onNewChromosome(None)
+        self.endTime = perf_counter()
+        self.recordOutputDataStructureSizes()
+        if self.metricsCallback is not None: self.metricsCallback(self.getMetrics())
+
+
+    def getMetrics(self) -> Dict:
+        """
+        Returns all the collected metrics as a dictionary.
+        """
+        if self.endTime is None: totalTime = perf_counter() - self.startTime
+        else: totalTime = self.endTime - self.startTime
+
+        linesRead = {"encompassed": self.phaseCalls.get("encompassedLineParsing", 0),
+                     "encompassing": self.phaseCalls.get("encompassingLineParsing", 0)}
+
+        return {
+            "totalTime": totalTime,
+            "phaseTimes": dict(self.phaseTimes),
+            "phaseCalls": dict(self.phaseCalls),
+            "chromosomeTimes": dict(self.chromosomeTimes),
+            "linesRead": linesRead,
+            "linesPerSecond": sum(linesRead.values())/totalTime if totalTime > 0 else 0.0,
+            "peakWaitingFeatures": dict(self.peakWaitingFeatures),
+            "peakOutputDataStructureKeys": self.peakOutputDataStructureKeys,
+            "outputDataStructureSizes": dict(self.outputDataStructureSizes),
+            "outputCells": self.outputCells
+        }
+
+
+    def getFormattedReport(self) -> str:
+        """
+        Returns the metrics as a human-readable string, with phases sorted from slowest to fastest.
+        """
+        metrics = self.getMetrics()
+        reportLines = [f"Total time: {metrics['totalTime']:.3f} s ({metrics['linesPerSecond']:.0f} lines/s)"]
+        for phaseName, phaseTime in sorted(metrics["phaseTimes"].items(), key = lambda item: -item[1]):
+            reportLines.append(f"    {phaseName}: {phaseTime:.3f} s over {metrics['phaseCalls'][phaseName]} calls")
+        reportLines.append(f"Peak waiting features: {metrics['peakWaitingFeatures']}")
+        reportLines.append(f"Output cells: {metrics['outputCells']}")
+        return '\n'.join(reportLines)
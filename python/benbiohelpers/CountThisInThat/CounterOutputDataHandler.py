@@ -1,8 +1,11 @@
 # The class for parsing, formatting, and writing data from the ThisInThatCounter
 from benbiohelpers.CountThisInThat.InputDataStructures import EncompassedData, EncompassingData, ENCOMPASSING_DATA, ENCOMPASSED_DATA
 from benbiohelpers.CountThisInThat.OutputDataStratifiers import *
-from typing import List, Type, Union
-import warnings
+from benbiohelpers.CountThisInThat.CountDerivatives import CountDerivative, CountTensor, evaluateCountDerivatives
+from benbiohelpers.CountThisInThat.MemoryGovernor import getDeepSize
+from benbiohelpers.CountThisInThat.ColumnarOutput import ColumnarTableWriter, isColumnarOutput
+from typing import Dict, List, Tuple, Type, Union
+import heapq, sys, warnings
 
 
 class CounterOutputDataHandler:
@@ -50,10 +53,25 @@ class CounterOutputDataHandler:
         # Set up the most basic output data structre: If the feature is encompassed, include it!
         self.outputDataStructure = 0
 
+        # Set to a dictionary if counts are also being recorded for each individual encompassing feature. (e.g. for bootstrapping)
+        self.countsByEncompassingFeature: Dict[EncompassingData, Dict[Tuple, int]] = None
+
         # Placeholder for OutputDataWriter
         self.writer: OutputDataWriter = None
 
 
+    def enableIncrementalWriting(self, incrementalWriting, featuresStillInUse):
+        """
+        Switches to incremental writing of encompassed or encompassing features (ENCOMPASSED_DATA or ENCOMPASSING_DATA) partway
+        through counting.  Every feature already in the output data structure, except those given as still in use, is flagged for writing,
+        since those are the features that would have been flagged already if incremental writing had been on from the start.
+        """
+        featuresToWrite = {feature for feature in self.outputDataStructure if feature not in featuresStillInUse}
+        if incrementalWriting == ENCOMPASSED_DATA: self.encompassedFeaturesToWrite = featuresToWrite
+        elif incrementalWriting == ENCOMPASSING_DATA: self.encompassingFeaturesToWrite = featuresToWrite
+        self.writer.startIncrementalWriting()
+
+
     def getNewStratificationLevelDictionaries(self):
         """
         Creates and returns all dictionaries at the object's stratification level in the ODS
@@ -89,12 +107,15 @@ class CounterOutputDataHandler:
 
     def addRelativePositionStratifier(self, encompassingFeature: EncompassingData, centerRelativePos = True, 
                                       extraRangeRadius = 0, outputName = "Relative_Pos", positionAmbiguityHandling = AmbiguityHandling.tolerate,
-                                      strandSpecificPos = False):
+                                      strandSpecificPos = False, growRange = False, binSize = None):
         """
         Adds a layer onto the output data structure to stratify by the position of the encompassed data with the encompassing data.
+        Set growRange to true if encompassing features differ in length, and give a binSize to group relative positions into bins.
+        (See RelativePosODS for more details.)
         """
         self.addNewStratifier(RelativePosODS(positionAmbiguityHandling, self.getNewStratificationLevelDictionaries(),
-                                                         encompassingFeature, centerRelativePos, extraRangeRadius, outputName, strandSpecificPos))
+                                                         encompassingFeature, centerRelativePos, extraRangeRadius, outputName, strandSpecificPos,
+                                                         growRange, binSize))
 
 
     def addFeatureFractionStratifier(self, ambiguityHandling = AmbiguityHandling.tolerate, outputName = "Feature_Fraction", 
@@ -106,18 +127,23 @@ class CounterOutputDataHandler:
                                                  fractionNum, flankingBinSize, flankingBinNum))
 
 
-    def addEncompassingFeatureStratifier(self, ambiguityHandling = AmbiguityHandling.tolerate, outputName = "Encompassing_Feature"):
+    def addEncompassingFeatureStratifier(self, ambiguityHandling = AmbiguityHandling.tolerate, outputName = "Encompassing_Feature",
+                                         naturalChromosomeOrder = False):
         """
         Adds a layer onto the output data structure to stratify by encompassing features.
+        If naturalChromosomeOrder is true, chromosomes are written with their numbers in numerical order (e.g. chr2 before chr10).
+        (This ordering is lost if the output is sorted on exit, since output is then sorted the same way as the input files.)
         """
-        self.addNewStratifier(EncompassingFeatureODS(ambiguityHandling, self.getNewStratificationLevelDictionaries(), outputName))
+        self.addNewStratifier(EncompassingFeatureODS(ambiguityHandling, self.getNewStratificationLevelDictionaries(), outputName,
+                                                     naturalChromosomeOrder))
 
 
-    def addEncompassedFeatureStratifier(self, outputName = "Encompassed_Feature"):
+    def addEncompassedFeatureStratifier(self, outputName = "Encompassed_Feature", naturalChromosomeOrder = False):
         """
         Adds a layer onto the output data structure to stratify by encompassed features.
+        See addEncompassingFeatureStratifier for naturalChromosomeOrder.
         """
-        self.addNewStratifier(EncompassedFeatureODS(self.getNewStratificationLevelDictionaries(), outputName))
+        self.addNewStratifier(EncompassedFeatureODS(self.getNewStratificationLevelDictionaries(), outputName, naturalChromosomeOrder))
 
 
     def addEncompassedFeatureContextStratifier(self, contextSize, includeAlteredTo, outputName = "Context"):
@@ -169,7 +195,8 @@ class CounterOutputDataHandler:
 
     def createOutputDataWriter(self, outputFilePath: str, oDSSubs: List = None, 
                                customStratifyingNames = None, getCountDerivatives = None, omitZeroRows = False,
-                               omitFinalStratificationCounts = False, writeHeadersImmediately = False):
+                               omitFinalStratificationCounts = False, writeHeadersImmediately = False,
+                               countDerivatives: List[CountDerivative] = None):
         """
         Pretty self explanatory.  See the __init__ method for OutputDataWriter for more info.
 
@@ -182,11 +209,19 @@ class CounterOutputDataHandler:
                 self.ignoreAmbiguityODSs.append(outputDataStratifier)
                 if self.countAllEncompassed: warnings.warn("Ignoring ambiguity is pointless when counting all encompassed features.")
 
+        # If every stratifier tolerates ambiguity, keys can be computed directly from each pair of features, so switch to the faster
+        # handling of encompassed features (unless a child class has changed how they are handled).
+        if (not self.nontolerantAmbiguityHandling and len(self.outputDataStratifiers) > 0 and all(
+            getattr(type(self), methodName) is getattr(CounterOutputDataHandler, methodName)
+            for methodName in ("onEncompassedFeatureInEncompassingFeature", "updateODSs", "countFeature")
+        )):
+            self.onEncompassedFeatureInEncompassingFeature = self.onEncompassedFeatureInEncompassingFeatureTolerant
+
         self.writer = OutputDataWriter(self.outputDataStructure, self.outputDataStratifiers, outputFilePath,
                                        oDSSubs = oDSSubs, customStratifyingNames = customStratifyingNames,
                                        getCountDerivatives = getCountDerivatives, omitZeroRows = omitZeroRows,
                                        omitFinalStratificationCounts = omitFinalStratificationCounts,
-                                       writeHeadersImmediately = writeHeadersImmediately)
+                                       writeHeadersImmediately = writeHeadersImmediately, countDerivatives = countDerivatives)
 
         if self.encompassedFeaturesToWrite is not None or self.encompassingFeaturesToWrite is not None:
             assert isinstance(self.outputDataStratifiers[0], (EncompassedFeatureODS, EncompassingFeatureODS)), (
@@ -219,6 +254,50 @@ class CounterOutputDataHandler:
         self.outputDataStratifiers[0].manageMemory()
 
 
+    def getMemoryReport(self) -> Dict[str, int]:
+        """
+        Returns the approximate memory (in bytes) held by each part of the output data structure and its bookkeeping:
+        the output dictionaries still reachable from the output data structure, the keys (e.g. features) stored in them,
+        the stratifiers' allKeys sets, supplemental information, features waiting to be written, the stratifiers' lists of
+        dictionaries, and any "orphaned" dictionaries that stratifiers still reference even though they have been pruned from the
+        output data structure (which manageMemory should free up).  The number of orphaned dictionaries and the total are included as well.
+        Objects are only counted once, under the first category they are found in.
+        """
+        report = dict()
+        seen = set()
+
+        # Find every dictionary still reachable from the output data structure.
+        reachableDictionaries = list()
+        if isinstance(self.outputDataStructure, dict):
+            currentDictionaries = [self.outputDataStructure]
+            while currentDictionaries:
+                reachableDictionaries.extend(currentDictionaries)
+                currentDictionaries = [value for dictionary in currentDictionaries
+                                       for value in dictionary.values() if isinstance(value, dict)] # (Supplemental information is stored in lists.)
+        seen.update(id(dictionary) for dictionary in reachableDictionaries)
+        report["outputDictionaries"] = sum(sys.getsizeof(dictionary) for dictionary in reachableDictionaries)
+
+        report["supplementalInfo"] = sum(getDeepSize(dictionary[SUP_INFO_KEY], seen)
+                                         for dictionary in reachableDictionaries if SUP_INFO_KEY in dictionary)
+        report["keys"] = sum(getDeepSize(key, seen) for dictionary in reachableDictionaries for key in dictionary)
+        report["allKeys"] = sum(getDeepSize(outputDataStratifier.allKeys, seen) for outputDataStratifier in self.outputDataStratifiers)
+        report["waitingFeatures"] = sum(getDeepSize(featuresToWrite, seen) for featuresToWrite in
+                                        (self.encompassedFeaturesToWrite, self.encompassingFeaturesToWrite) if featuresToWrite is not None)
+
+        orphanedDictionaries = [dictionary for outputDataStratifier in self.outputDataStratifiers
+                                for dictionary in outputDataStratifier.outputDataDictionaries if id(dictionary) not in seen]
+        report["orphanedDictionaryCount"] = len(orphanedDictionaries)
+        report["orphanedDictionaries"] = sum(getDeepSize(dictionary, seen) for dictionary in orphanedDictionaries)
+        report["dictionaryLists"] = sum(sys.getsizeof(outputDataStratifier.outputDataDictionaries)
+                                        for outputDataStratifier in self.outputDataStratifiers)
+
+        if self.countsByEncompassingFeature is not None:
+            report["countsByEncompassingFeature"] = getDeepSize(self.countsByEncompassingFeature, seen)
+
+        report["total"] = sum(size for category, size in report.items() if category != "orphanedDictionaryCount")
+        return report
+
+
     def updateODSs(self, encompassedFeature, encompassingFeature):
         """
         Updates all relevant values in each ODS using the current encompassed and encompassing features.
@@ -245,7 +324,8 @@ class CounterOutputDataHandler:
                 outputDataStratifier.onNonCountedEncompassedFeature(encompassedFeature)
             if self.encompassedFeaturesToWrite is not None: self.encompassedFeaturesToWrite.add(encompassedFeature)
             if self.countAllEncompassed: self.countFeature(encompassedFeature, encompassingFeature)
-            if self.countNonCountedEncompassedAsNegative: self.countFeature(encompassedFeature, encompassingFeature, -1)
+            if self.countNonCountedEncompassedAsNegative:
+                self.countFeature(encompassedFeature, encompassingFeature, -encompassedFeature.countWeight)
 
 
     def onNewEncompassingFeature(self, encompassingFeature: EncompassingData):
@@ -266,11 +346,37 @@ class CounterOutputDataHandler:
         if self.trackAllEncompassing and self.encompassingFeaturesToWrite is not None: self.encompassingFeaturesToWrite.add(encompassingFeature)
 
 
-    def countFeature(self, encompassedFeature, encompassingFeature, countValue = 1):
+    def trackCountsByEncompassingFeature(self):
+        """
+        In addition to the normal output data structure, record the counts contributed by each encompassing feature
+        to each output cell (the tuple of relevant keys from every stratifier).  Counts for encompassed features
+        that are counted without an encompassing feature are recorded under None.
+        This allows the encompassing features to be resampled later without re-running the counter.
+        """
+        self.countsByEncompassingFeature = dict()
+
+
+    def recordCountByEncompassingFeature(self, encompassedFeature, encompassingFeature, countValue, cellKeys: Tuple = None):
+        """
+        Records the given count for the given encompassing feature in the relevant output cell.
+        If the cell's keys are not given, they are retrieved from the output data stratifiers.
+        """
+        if cellKeys is None:
+            cellKeys = tuple(outputDataStratifier.getRelevantKey(encompassedFeature) for outputDataStratifier in self.outputDataStratifiers)
+        featureCounts = self.countsByEncompassingFeature.setdefault(encompassingFeature, dict())
+        featureCounts[cellKeys] = featureCounts.get(cellKeys, 0) + countValue
+
+
+    def countFeature(self, encompassedFeature, encompassingFeature, countValue = None):
         """
         If count is true, increments the proper object in the output data structure.
         Otherwise, just updates supplemental information.
+        If no count value is given, the encompassed feature's count weight is used.  (1, unless a weight column was given)
         """
+        if countValue is None: countValue = encompassedFeature.countWeight
+
+        if self.countsByEncompassingFeature is not None:
+            self.recordCountByEncompassingFeature(encompassedFeature, encompassingFeature, countValue)
 
         # Account for the base case where we are just counting all features.
         if len(self.outputDataStratifiers) == 0: 
@@ -359,11 +465,48 @@ class CounterOutputDataHandler:
                 if self.encompassedFeaturesToWrite is not None: self.encompassedFeaturesToWrite.add(encompassedFeature)
 
 
+    def onEncompassedFeatureInEncompassingFeatureTolerant(self, encompassedFeature: EncompassedData, encompassingFeature: EncompassingData,
+                                                          exitingEncompassment):
+        """
+        Replaces onEncompassedFeatureInEncompassingFeature when every stratifier tolerates ambiguity.
+        In this case, there is no need to track stratifier data on the encompassed feature, so each key is computed directly from
+        the given pair of features (once) and used for both supplemental information and counting.
+        """
+
+        # Record the encompassing feature if they are being written incrementally.
+        if self.encompassingFeaturesToWrite is not None: self.encompassingFeaturesToWrite.add(encompassingFeature)
+
+        # Exiting features have already been counted, so they just need to be written (if applicable).
+        if exitingEncompassment:
+            if self.encompassedFeaturesToWrite is not None: self.encompassedFeaturesToWrite.add(encompassedFeature)
+            return
+
+        keys = [outputDataStratifier.getKeyDirectly(encompassedFeature, encompassingFeature)
+                for outputDataStratifier in self.outputDataStratifiers]
+
+        if self.countsByEncompassingFeature is not None:
+            self.recordCountByEncompassingFeature(encompassedFeature, encompassingFeature, encompassedFeature.countWeight, tuple(keys))
+
+        # Drill down through the ODS's, updating supplemental information along the way, and count.
+        currentODSDict = self.outputDataStructure
+        for outputDataStratifier, key in zip(self.outputDataStratifiers[:-1], keys):
+            currentODSDict = currentODSDict[key]
+            for i, supplementalInfoHandler in enumerate(outputDataStratifier.supplementalInfoHandlers):
+                if supplementalInfoHandler.updateUntilExit:
+                    currentODSDict[SUP_INFO_KEY][i] = supplementalInfoHandler.updateSupplementalInfo(currentODSDict[SUP_INFO_KEY][i], 
+                                                                                                     encompassedFeature, encompassingFeature)
+                if supplementalInfoHandler.updateOnCount:
+                    currentODSDict[SUP_INFO_KEY][i] = supplementalInfoHandler.updateSupplementalInfo(currentODSDict[SUP_INFO_KEY][i], 
+                                                                                                     encompassedFeature, encompassingFeature)
+        currentODSDict[keys[-1]] += encompassedFeature.countWeight
+
+
 class OutputDataWriter():
 
     def __init__(self, outputDataStructure, outputDataStratifiers, outputFilePath: str,
                     oDSSubs: List = None, customStratifyingNames = None, getCountDerivatives = None, omitZeroRows = False,
-                    omitFinalStratificationCounts = False, writeHeadersImmediately = False):
+                    omitFinalStratificationCounts = False, writeHeadersImmediately = False,
+                    countDerivatives: List[CountDerivative] = None):
         """
         Set up the OutputDataWriter by providing access to the output data stratifiers and the underlying dictionaries as well as by
         giving an output file path and the two optional arguments described below.
@@ -385,6 +528,11 @@ class OutputDataWriter():
         Also, MAKE SURE that the returned list, whether getHeaders is true or false, is always the SAME LENGTH.
         If not assigned, the default function simply returns an empty list.
 
+        The countDerivatives variable, if supplied, should contain a list of CountDerivative objects (see CountDerivatives.py), which
+        declare derived columns as array expressions over all the counts at once (e.g. sums across strands or mirrored positions).
+        These are evaluated for every row in one pass before writing, so they are much faster than getCountDerivatives
+        for large outputs.  Their columns are written after any columns from getCountDerivatives.
+
         The omitZeroRows flag, if set to true, ensures that only rows with at least one count are written.
 
         The omitFinalStratificationCounts flag, if true, ignores any counts in the final layer of stratification. (This is
@@ -393,12 +541,23 @@ class OutputDataWriter():
 
         The writeHeadersImmediately flag, if true, writes the headers at the end of the constructor.
         (This is useful when writing incrementally to a non-bed file, as the headers get skipped otherwise.)
+
+        If the output file path ends with ".columnar", the output is written as a binary columnar table (a directory with one
+        memory-mappable array per column) instead of a tsv file.  (See ColumnarOutput.py)
         """
 
         self.outputDataStructure = outputDataStructure
         self.outputDataStratifiers: List[OutputDataStratifier] = outputDataStratifiers
         self.outputFilePath = outputFilePath
-        self.outputFile = open(outputFilePath, 'w')
+        if isColumnarOutput(outputFilePath):
+            assert oDSSubs is None and len(outputDataStratifiers) > 0, (
+                "Columnar output requires at least one stratifier and can't be used with oDSSubs.")
+            keyColumnCount = sum(1 + len(outputDataStratifier.supplementalInfoHandlers) for outputDataStratifier in outputDataStratifiers[:-1])
+            self.outputFile = ColumnarTableWriter(outputFilePath, list(), keyColumnCount)
+        else: self.outputFile = open(outputFilePath, 'w')
+        self.sortedRowsHeap = None # Only used if output sorting is enabled.  (See enableOutputSorting)
+        self.currentSortKey = None
+        self.sortedRowsCount = 0
 
         self.oDSSubs = oDSSubs
         self.customStratifyingNames = customStratifyingNames
@@ -422,11 +581,18 @@ class OutputDataWriter():
             self.getCountDerivativesFunc = lambda outputDataWriter, getHeaders: list()
         else: self.getCountDerivativesFunc = getCountDerivatives
 
+        if countDerivatives is None: countDerivatives = list()
+        self.countDerivatives: List[CountDerivative] = countDerivatives
+        self.derivedRows = None
+        self.derivedRowIndex = 0
+
         # Obtain headers once here for individual feature writing (checks oDSSubs for valid input as well)
         # NOTE: If the final data stratifier establishes keys dynamically, (i.e. new keys are discovered during the counting process)
         #       these headers may be incorrect later on.
         self.headers = self.getHeaders()
-        if writeHeadersImmediately: self.outputFile.write('\t'.join(self.headers) + '\n')
+        self.headersWritten = False # Whether or not the output has a header row.  (See writeHeaders)
+        self.writeHeadersImmediately = writeHeadersImmediately
+        if writeHeadersImmediately or isinstance(self.outputFile, ColumnarTableWriter): self.writeHeaders(self.headers)
 
 
     def __del__(self):
@@ -436,6 +602,44 @@ class OutputDataWriter():
         self.outputFile.close()
 
 
+    def enableOutputSorting(self):
+        """
+        Ensures that rows are written sorted by chromosome and then start and end position (the same sorting enforced on input files)
+        whenever the keys at the first stratification level are features.  Rows are held in a heap until flushSortedRows confirms
+        that no earlier rows can still be written, so when writing incrementally, only a small window of rows is held in memory.
+        """
+        self.sortedRowsHeap = list()
+
+
+    def writeHeaders(self, headers: List[str]):
+        """
+        Writes the given headers to the output file (or gives them to the columnar table).
+        """
+        if isinstance(self.outputFile, ColumnarTableWriter): self.outputFile.writeHeaders(headers)
+        else: self.outputFile.write('\t'.join(headers) + '\n')
+        self.headersWritten = True
+
+
+    def writeRow(self, row: str):
+        """
+        Writes the given row to the output file, or, if sorting output by feature, adds it to the heap of rows waiting to be written.
+        """
+        if self.sortedRowsHeap is None or self.currentSortKey is None: self.outputFile.write(row)
+        else:
+            # The count breaks ties so that rows with equal keys keep their order (and rows themselves are never compared).
+            heapq.heappush(self.sortedRowsHeap, (self.currentSortKey, self.sortedRowsCount, row))
+            self.sortedRowsCount += 1
+
+
+    def flushSortedRows(self, watermark = None):
+        """
+        Writes all waiting rows with sort keys less than the given watermark (all waiting rows if the watermark is None).
+        """
+        if not self.sortedRowsHeap: return
+        while self.sortedRowsHeap and (watermark is None or self.sortedRowsHeap[0][0] < watermark):
+            self.outputFile.write(heapq.heappop(self.sortedRowsHeap)[2])
+
+
     def getCountDerivatives(self, getHeaders):
         """
         A simple wrapper for the passed getCountDerivatives function
@@ -443,6 +647,17 @@ class OutputDataWriter():
         return self.getCountDerivativesFunc(self, getHeaders)
 
 
+    def prepareCountDerivatives(self, dataObject, firstLevelKeys):
+        """
+        Evaluates the vectorized count derivatives for all the rows that are about to be written from the given data object,
+        where the given keys are the keys at the first stratification level.
+        """
+        if not self.countDerivatives: return
+        levelKeys = [firstLevelKeys] + [outputDataStratifier.getKeysForOutput() for outputDataStratifier in self.outputDataStratifiers[1:]]
+        self.derivedRows = evaluateCountDerivatives(self.countDerivatives, CountTensor(levelKeys, dataObject))
+        self.derivedRowIndex = 0
+
+
     def getHeaders(self):
         """
         Returns a list of the headers for the output data.
@@ -459,6 +674,7 @@ class OutputDataWriter():
                 headers.append(self.getOutputName(-1, key))
 
         headers += self.getCountDerivatives(True)
+        headers += [countDerivative.header for countDerivative in self.countDerivatives]
 
         assert self.oDSSubs is None or len(self.oDSSubs) == len(headers), (
             "Output data has "+str(len(headers))+" levels, but ODSSubs is a list of length "+str(len(self.oDSSubs))+".  "
@@ -485,13 +701,16 @@ class OutputDataWriter():
     def getOutputName(self, stratificationLevel, key):
         """
         A convenience function for getting output names from keys based on the customStratifyingNames parameter.
+        Custom names may be given for either the keys themselves or the keys as formatted for output
+        (e.g. "ACG>T" for integer-encoded sequence contexts).
         """
 
-        if (self.customStratifyingNames is None 
-            or self.customStratifyingNames[stratificationLevel] is None 
-            or key not in self.customStratifyingNames[stratificationLevel]):
+        if self.customStratifyingNames is None or self.customStratifyingNames[stratificationLevel] is None:
             return self.outputDataStratifiers[stratificationLevel].formatKeyForOutput(key)
-        else: return self.customStratifyingNames[stratificationLevel][key]
+        elif key in self.customStratifyingNames[stratificationLevel]: return self.customStratifyingNames[stratificationLevel][key]
+        else:
+            formattedKey = self.outputDataStratifiers[stratificationLevel].formatKeyForOutput(key)
+            return self.customStratifyingNames[stratificationLevel].get(formattedKey, formattedKey)
 
     def writeDataRows(self, currentDataObject, stratificationLevel, supplementalInfoCount):
         """
@@ -503,6 +722,9 @@ class OutputDataWriter():
         if stratificationLevel + 1 != len(self.outputDataStratifiers):
             for key in self.outputDataStratifiers[stratificationLevel].getKeysForOutput():
 
+                if stratificationLevel == 0 and self.sortedRowsHeap is not None:
+                    self.currentSortKey = key.getSortKey() if hasattr(key, "getSortKey") else None
+
                 self.setDataCol(stratificationLevel + supplementalInfoCount, self.getOutputName(stratificationLevel, key))
                 self.previousKeys[stratificationLevel] = key
 
@@ -527,13 +749,19 @@ class OutputDataWriter():
                     self.setDataCol(stratificationLevel + supplementalInfoCount + i, str(counts))
             if self.omitFinalStratificationCounts: i = 0
 
+            # Get the next row of vectorized derivatives (even if the row is omitted, so the rows stay in step).
+            if self.derivedRows is not None:
+                derivedValues = self.derivedRows[self.derivedRowIndex]
+                self.derivedRowIndex += 1
+            else: derivedValues = list()
+
             if omitRow: return
 
-            self.currentDataRow[stratificationLevel + supplementalInfoCount + i + 1:] = self.getCountDerivatives(False)
+            self.currentDataRow[stratificationLevel + supplementalInfoCount + i + 1:] = self.getCountDerivatives(False) + derivedValues
 
             if isinstance(self.currentDataRow[0],list):
-                self.outputFile.write('\t'.join(['\t'.join(self.currentDataRow[0])] + self.currentDataRow[1:]) + '\n')
-            else: self.outputFile.write('\t'.join(self.currentDataRow) + '\n')
+                self.writeRow('\t'.join(['\t'.join(self.currentDataRow[0])] + self.currentDataRow[1:]) + '\n')
+            else: self.writeRow('\t'.join(self.currentDataRow) + '\n')
 
 
     def writeFeature(self, featureToWrite: Union[EncompassingData, EncompassedData]):
@@ -560,15 +788,25 @@ class OutputDataWriter():
             self.setDataCol(i + 1, supplementalInfo)
 
         self.previousKeys[0] = featureToWrite
+        if self.sortedRowsHeap is not None: self.currentSortKey = featureToWrite.getSortKey()
+        self.prepareCountDerivatives({featureToWrite: self.outputDataStructure[featureToWrite]}, [featureToWrite])
         self.writeDataRows(self.outputDataStructure[featureToWrite], 1, len(supplementalInfoHandlers))
 
 
+    def startIncrementalWriting(self):
+        """
+        Called when switching to incremental writing partway through counting.  Writes the headers for non-bed output
+        (unless they were already written), since the output would have had them if it had been written all at once.
+        """
+        if not self.outputFilePath.endswith(".bed") and not self.writeHeadersImmediately:
+            self.writeHeaders(self.getHeaders())
+
+
     def finishIndividualFeatureWriting(self):
         """
-        Close the output file.
-        NOTE: I previously had a note here that said this function was sorting the output, but it wasn't? Also,
-              I'm not sure it's even necessary in the first place...
+        Writes any rows still waiting to be sorted and closes the output file.
         """
+        self.flushSortedRows()
         self.outputFile.close()
 
 
@@ -583,11 +821,13 @@ class OutputDataWriter():
         else:
 
             # Write headers.
-            self.outputFile.write('\t'.join(self.getHeaders()) + '\n')
+            self.writeHeaders(self.getHeaders())
 
             # Next, write the rest of the data using the recursive writeDataRows function
             self.currentDataRow = [None]*(len(self.getHeaders()))
 
+            self.prepareCountDerivatives(self.outputDataStructure, self.outputDataStratifiers[0].getKeysForOutput())
             self.writeDataRows(self.outputDataStructure, 0, 0)
+            self.flushSortedRows()
 
         self.outputFile.close()
\ No newline at end of file
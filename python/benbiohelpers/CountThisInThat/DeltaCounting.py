@@ -0,0 +1,100 @@
+# This script contains functions for keeping a stored count table current as new encompassed features (e.g. new samples or
+# mutations appended to a cohort) arrive: only the new features are counted, and their counts are added into the stored table.
+# The configuration of the counter that produced the table is stored next to it, so that deltas from differently configured
+# counters can't be added in by mistake.
+import json, os
+from typing import Dict
+from benbiohelpers.CountThisInThat.ColumnarOutput import isColumnarOutput
+from benbiohelpers.CountThisInThat.CountDerivatives import getNonSumHeaders
+from benbiohelpers.CountThisInThat.CounterJobQueue import mergePartialTables
+from benbiohelpers.CountThisInThat.OutputDataStratifiers import EncompassedFeatureODS, EncompassingFeatureODS
+
+COUNTER_CONFIGURATION_SUFFIX = ".counter_config.json"
+
+
+def getCounterConfigurationFilePath(tableFilePath):
+    return str(tableFilePath) + COUNTER_CONFIGURATION_SUFFIX
+
+
+def getCounterConfiguration(counter) -> Dict:
+    """
+    Describes everything about the given counter that determines the layout and meaning of its output table: the counter class,
+    the encompassing features it counts within, the chromosomes it counts and how features are weighted, each stratifier's type,
+    output name, ambiguity handling, and supplemental information, and the writer's derived columns.
+    """
+    encompassingFeaturesFilePath = counter.encompassingFeaturesFilePath
+    if isinstance(encompassingFeaturesFilePath, (str, os.PathLike)): encompassingFeaturesFilePath = os.path.abspath(encompassingFeaturesFilePath)
+    else: encompassingFeaturesFilePath = None # Streamed input
+    acceptableChromosomes = counter.acceptableChromosomes
+    if acceptableChromosomes is not None: acceptableChromosomes = sorted(acceptableChromosomes)
+    writer = counter.outputDataHandler.writer
+    return {
+        "counterClass": f"{type(counter).__module__}:{type(counter).__qualname__}",
+        "encompassingFeaturesFilePath": encompassingFeaturesFilePath,
+        "encompassingFeatureExtraRadius": counter.encompassingFeatureExtraRadius,
+        "acceptableChromosomes": acceptableChromosomes,
+        "countWeightColumn": counter.countWeightColumn,
+        "stratifiers": [{"type": type(outputDataStratifier).__name__, "outputName": outputDataStratifier.outputName,
+                         "ambiguityHandling": outputDataStratifier.ambiguityHandling.name,
+                         "supplementalInformation": [supplementalInfoHandler.outputName
+                                                     for supplementalInfoHandler in outputDataStratifier.supplementalInfoHandlers]}
+                        for outputDataStratifier in counter.outputDataHandler.outputDataStratifiers],
+        "writer": {"omitFinalStratificationCounts": writer.omitFinalStratificationCounts,
+                   "getCountDerivatives": writer.getCountDerivatives(True),
+                   "countDerivatives": [[countDerivative.header, countDerivative.isSum] for countDerivative in writer.countDerivatives]}
+    }
+
+
+def writeCounterConfiguration(counter, tableFilePath = None):
+    """
+    Records the configuration of the given counter next to its output table (or the given table), so that the table can be
+    updated with updateCountTable later.
+    """
+    if tableFilePath is None: tableFilePath = counter.outputFilePath
+    with open(getCounterConfigurationFilePath(tableFilePath), 'w') as configurationFile:
+        json.dump(getCounterConfiguration(counter), configurationFile, indent = 4)
+
+
+def updateCountTable(counter, tableFilePath, updatedTableFilePath = None):
+    """
+    Counts the given counter, which should be set up with only the new encompassed features as its input, and adds its counts
+    into the stored table at tableFilePath.  The updated table replaces the stored one unless updatedTableFilePath is given.
+    Raises a ValueError if the table's recorded counter configuration (see writeCounterConfiguration) doesn't match the counter's.
+    Tables without a recorded configuration are accepted as long as their headers match, and the configuration is recorded
+    for the updated table.
+
+    Since counts are summed cell by cell, the update is exact as long as every column is a count (or a sum of counts),
+    which holds for ambiguity handling too, since each encompassed feature's ambiguity depends only on that feature.
+    A ValueError is raised if the counter's writer has derived columns that aren't declared as sums (see CountDerivative.isSum),
+    including any from a getCountDerivatives function, since those can't be summed.
+    Tables keyed by features stay sorted by position, with the new features' rows inserted among the old ones.
+    """
+    assert not isColumnarOutput(tableFilePath) and not str(tableFilePath).endswith(".bed"), "Only tsv tables can be updated."
+    assert counter.writeIncrementally == 0 or counter.outputDataHandler.writer.writeHeadersImmediately, (
+        "Counters writing incrementally must write headers immediately for their output to be added to a stored table.")
+    if updatedTableFilePath is None: updatedTableFilePath = tableFilePath
+
+    nonSumHeaders = getNonSumHeaders(counter.outputDataHandler.writer)
+    if nonSumHeaders:
+        raise ValueError(f"The derived columns {', '.join(nonSumHeaders)} aren't declared as sums of counts, so they can't be added "
+                         f"to {tableFilePath}.  (Use count derivatives like sumOfColumns and mirroredSum, or CountDerivative with isSum = True.)")
+
+    configuration = getCounterConfiguration(counter)
+    configurationFilePath = getCounterConfigurationFilePath(tableFilePath)
+    if os.path.exists(configurationFilePath):
+        with open(configurationFilePath, 'r') as configurationFile: storedConfiguration = json.load(configurationFile)
+        if storedConfiguration != configuration:
+            mismatchedKeys = [key for key in configuration if storedConfiguration.get(key) != configuration[key]]
+            raise ValueError(f"The counter's configuration doesn't match the one recorded for {tableFilePath} "
+                             f"(differences in: {', '.join(mismatchedKeys)}), so its counts can't be added to the table.")
+
+    counter.count()
+
+    outputDataStratifiers = counter.outputDataHandler.outputDataStratifiers
+    keyColumnCount = sum(1 + len(outputDataStratifier.supplementalInfoHandlers) for outputDataStratifier in outputDataStratifiers[:-1])
+    sortByPosition = keyColumnCount > 0 and isinstance(outputDataStratifiers[0], (EncompassedFeatureODS, EncompassingFeatureODS))
+    temporaryTableFilePath = str(updatedTableFilePath) + ".updating"
+    mergePartialTables([tableFilePath, counter.outputFilePath], temporaryTableFilePath, keyColumnCount, sortByPosition,
+                       sortByPosition and outputDataStratifiers[0].naturalChromosomeOrder)
+    os.replace(temporaryTableFilePath, updatedTableFilePath)
+    writeCounterConfiguration(counter, updatedTableFilePath)
@@ -1,5 +1,6 @@
 # This script contains two data objects that represent the inputs from two files in the related "ThisInThatCounter".
 # These objects are meant to be inherited from and overridden as necessary.
+import sys
 
 ENCOMPASSED_DATA = 1
 ENCOMPASSING_DATA = 2
@@ -9,6 +10,9 @@ class EncompassedData:
     Stores data on each of the features that are expected to be encompassed by the second feature 
     e.g. this could be for mutations that are expected to be encompassed by nucleosomes
     """
+
+    countWeight = 1 # The value the feature adds to counts.  (See setCountWeight)
+
     def __init__(self, line: str, acceptableChromosomes):
 
         # Read in the next line.
@@ -30,6 +34,13 @@ class EncompassedData:
     def __lt__(self, other) -> bool:
         return (self.__key()[:2]) < (other.__key()[:2])
 
+    def getSortKey(self):
+        """
+        Returns a key matching the sorting enforced on input files (chromosome, then start and end positions), 
+        which, unlike the midpoint-based comparisons above, is used to sort output.
+        """
+        return (self.chromosome, float(self.choppedUpLine[1]), float(self.choppedUpLine[2]))
+
     def setLocationData(self, acceptableChromosomes):
         """
         Sets the chromosome, position, and strand of the feature.
@@ -48,6 +59,15 @@ class EncompassedData:
     def getLocationString(self):
         return self.chromosome + ':' + str(self.position) + '(' + self.strand + ')'
 
+    def setCountWeight(self, countWeightColumn):
+        """
+        Sets the value the feature adds to counts (e.g. read depth or a collapsed duplicate count) from the given column.
+        Whole numbers are kept as integers so that counts are still written as integers.
+        """
+        countWeight = float(self.choppedUpLine[countWeightColumn])
+        if countWeight.is_integer(): self.countWeight = int(countWeight)
+        else: self.countWeight = countWeight
+
 
     def updateStratifierData(self, stratifierClass, newData):
         """
@@ -122,6 +142,12 @@ class EncompassingData:
     def __lt__(self, other) -> bool:
         return (self.__key()[:3]) < (other.__key()[:3])
 
+    def getSortKey(self):
+        """
+        Returns a key matching the sorting enforced on input files (chromosome, then start and end positions), used to sort output.
+        """
+        return (self.chromosome, self.startPos, self.endPos)
+
     def setLocationData(self, acceptableChromosomes):
         """
         Sets the chromosome, position, and strand of the feature.
@@ -173,7 +199,7 @@ class TfbsData(EncompassingData):
 
     def setOtherData(self):
         self.sequence = self.choppedUpLine[4]
-        self.tfbsName = self.choppedUpLine[6] # Might need to change the column number here...
+        self.tfbsName = sys.intern(self.choppedUpLine[6]) # Might need to change the column number here...  (Interned, since names repeat often)
 
 
 class ColorDomainData(EncompassingDataDefaultStrand):
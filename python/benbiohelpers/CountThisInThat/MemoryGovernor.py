@@ -0,0 +1,102 @@
+# This script contains a class for keeping the ThisInThatCounter within a memory budget by estimating the size of its output data
+# structure and waiting features and switching to (or speeding up) incremental writing when the budget is nearly used up.
+import sys, warnings
+from itertools import islice
+
+
+def getDeepSize(obj, seen: set = None):
+    """
+    Estimates the memory used by the given object along with any containers and instance attributes it references.
+    Objects that have already been seen (by id) are not counted again.
+    """
+    if seen is None: seen = set()
+    if id(obj) in seen or isinstance(obj, type): return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(getDeepSize(key, seen) + getDeepSize(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(getDeepSize(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += getDeepSize(vars(obj), seen)
+    return size
+
+
+class MemoryGovernor:
+    """
+    Periodically estimates the memory used by the counter's output data structure and waiting features (by measuring a small
+    sample of entries and scaling up) and reports when that estimate nears maxMemory (in bytes).
+    Estimates are only updated every checkInterval calls to isNearBudget (and after each flush), so that checking is cheap.
+    """
+
+    def __init__(self, counter, maxMemory, nearBudgetFraction = 0.8, checkInterval = 1000, sampleSize = 10):
+        self.counter = counter
+        self.maxMemory = maxMemory
+        self.nearBudgetFraction = nearBudgetFraction
+        self.checkInterval = checkInterval
+        self.sampleSize = sampleSize
+
+        self.callsUntilCheck = 0
+        self.nearBudget = False
+        self.peakEstimatedMemory = 0
+        self.warnedAboutStructure = False
+
+
+    def getSampledSize(self, items, itemCount, getItemSize):
+        """
+        Estimates the total size of a collection from the average size of its first few items.
+        """
+        if itemCount == 0: return 0
+        sample = list(islice(items, self.sampleSize))
+        return sum(getItemSize(item) for item in sample) / len(sample) * itemCount
+
+
+    def estimateMemory(self):
+        """
+        Returns the estimated memory (in bytes) used by the output data structure and all waiting features.
+        """
+        outputDataHandler = self.counter.outputDataHandler
+        outputDataStructure = outputDataHandler.outputDataStructure
+        estimatedMemory = 0
+
+        if isinstance(outputDataStructure, dict):
+            estimatedMemory += self.getSampledSize(outputDataStructure, len(outputDataStructure),
+                                                   lambda key: getDeepSize(key) + getDeepSize(outputDataStructure[key]))
+
+        for waitingFeatures in (self.counter.confirmedEncompassedFeatures, outputDataHandler.encompassedFeaturesToWrite,
+                                outputDataHandler.encompassingFeaturesToWrite):
+            if waitingFeatures is not None: estimatedMemory += self.getSampledSize(waitingFeatures, len(waitingFeatures), getDeepSize)
+
+        self.peakEstimatedMemory = max(self.peakEstimatedMemory, estimatedMemory)
+        return estimatedMemory
+
+
+    def isNearBudget(self):
+        """
+        Returns whether or not the estimated memory usage was near the budget when it was last checked, re-checking as necessary.
+        """
+        if self.callsUntilCheck <= 0:
+            self.nearBudget = self.estimateMemory() >= self.maxMemory * self.nearBudgetFraction
+            self.callsUntilCheck = self.checkInterval
+        self.callsUntilCheck -= 1
+        return self.nearBudget
+
+
+    def onFlush(self):
+        """
+        Forces memory usage to be re-estimated at the next check, since waiting features were just written.
+        """
+        self.callsUntilCheck = 0
+        self.nearBudget = False
+
+
+    def warnAboutStructure(self):
+        """
+        Warns (once) that memory usage can't be reduced because the output data structure can't be written incrementally.
+        """
+        if not self.warnedAboutStructure:
+            warnings.warn("Estimated memory usage is nearing maxMemory, but the output data structure can't be written incrementally "
+                          "because its first stratifier isn't an encompassed or encompassing feature stratifier, or its final "
+                          "stratifier's keys aren't known before counting.")
+            self.warnedAboutStructure = True
@@ -1,10 +1,13 @@
 # This script contains an abstract class as well as its children that represent different ways the 
 # output data structure from the CounterOutputDataHandler can be stratified.
+import heapq, math, re
 from abc import ABC, abstractmethod
+from functools import lru_cache
 from benbiohelpers.CountThisInThat.SupplementalInformation import SUP_INFO_KEY, SupplementalInformationHandler
 from typing import List, Dict, Tuple, Union, Any
 from enum import Enum
 from benbiohelpers.CountThisInThat.InputDataStructures import *
+from benbiohelpers.DNA_SequenceHandling import encodeSequence, decodeSequence
 
 
 class AmbiguityHandling(Enum):
@@ -16,37 +19,59 @@ class AmbiguityHandling(Enum):
     record = 2 # Ambiguous entries are recorded as such.  Non-ambiguous entries are recorded once.
 
 
-def sortPositionIDs(positionIDs: Union[List[str], List[Tuple]]):
+@lru_cache(maxsize = None)
+def getNaturalChromosomeSortKey(chromosome: str):
     """
-    Sorts the position IDs derived from the Encompassed Data and Encompassing Data ODS's.
-    Can handle input as a list of strings or tuples, and with a single position or both a start and end position.
-    However, it is assumed that all members of the list are formatted the same with respect to the above variations.
+    Returns a key which sorts chromosome names with their numbers in numerical order (e.g. chr2 before chr10)
+    instead of alphabetical order.  Results are cached, since there are few chromosomes but many features on each one.
     """
+    # Splitting on digit runs (with a capturing group) alternates non-digit and digit strings, so the keys are always comparable.
+    return tuple(int(part) if i % 2 else part for i, part in enumerate(re.split(r"(\d+)", chromosome)))
 
-    # Sorting for list of strings:
-    if isinstance(positionIDs[0], str):
 
-        # If both start and end positions are given (Represented by a '-' between positions, before the strand designation), sort on end position first
-        if '-' in positionIDs[0].split('(')[0]:
-            positionIDs.sort(key = lambda positionID: float(positionID.split('(')[0].split('-')[1]))
+def getChromosomeSortKeyFunction(naturalChromosomeOrder = False):
+    """
+    Returns the function used to convert chromosome names to sort keys: natural ordering if requested, and alphabetical otherwise.
+    """
+    if naturalChromosomeOrder: return getNaturalChromosomeSortKey
+    else: return str
 
-        # Next, sort on the first (potentially only) given position.
-        positionIDs.sort(key = lambda positionID: float(positionID.split('(')[0].split(':')[1].split('-')[0]))
 
-        # Finally, sort on the chromosome identifier.
-        positionIDs.sort(key = lambda positionID: positionID.split(':')[0])
+def parsePositionID(positionID: str):
+    """
+    Parses a position ID string of the form "chr:start-end(strand)" or "chr:position(strand)" into a tuple
+    of the chromosome followed by the numerical position(s).
+    """
+    chromosome, positions = positionID.split('(', 1)[0].rsplit(':', 1)
+    return (chromosome,) + tuple(float(position) for position in positions.split('-'))
 
-        return positionIDs # Do this as a formality, even though this sorts in place (I think).
 
-    # Otherwise, assume we have some iterable.
-    else:
+def sortPositionIDs(positionIDs: Union[List[str], List[Tuple]], naturalChromosomeOrder = False):
+    """
+    Sorts the position IDs derived from the Encompassed Data and Encompassing Data ODS's by chromosome, then
+    start position, then end position (if present).
+    Can handle input as a list of strings or tuples, and with a single position or both a start and end position.
+    However, it is assumed that all members of the list are formatted the same with respect to the above variations.
+    Each ID is parsed only once, and chromosomes are sorted alphabetically unless naturalChromosomeOrder is true.
+    The list is sorted in place and also returned.
+    """
+    if not positionIDs: return positionIDs
+    getChromosomeSortKey = getChromosomeSortKeyFunction(naturalChromosomeOrder)
 
-        # If the iterable has 4 items, sort on item 3 first, which represents the end position
-        if len(positionIDs[0]) == 4: positionIDs.sort(key = lambda positionID: positionID[2])
+    # Sorting for list of strings:
+    if isinstance(positionIDs[0], str):
+        def getSortKey(positionID):
+            parsedPositionID = parsePositionID(positionID)
+            return (getChromosomeSortKey(parsedPositionID[0]),) + parsedPositionID[1:]
 
-        # Next, sort by the start position and then the chromosome
-        positionIDs.sort(key = lambda positionID: positionID[1])
-        positionIDs.sort(key = lambda positionID: positionID[0])
+    # Otherwise, assume we have some iterable.  If the iterable has 4 items, item 3 represents the end position.
+    else:
+        positionCount = 2 if len(positionIDs[0]) == 4 else 1
+        def getSortKey(positionID):
+            return (getChromosomeSortKey(positionID[0]),) + tuple(positionID[1:1+positionCount])
+
+    positionIDs.sort(key = getSortKey)
+    return positionIDs
 
 
 class OutputDataStratifier(ABC):
@@ -70,6 +95,8 @@ class OutputDataStratifier(ABC):
         self.outputName = outputName
         self.childDataStratifier: OutputDataStratifier = None
         self.supplementalInfoHandlers: List[SupplementalInformationHandler] = list()
+        self.sortKeyHeap = None # Only used if tracking sort keys.  (See trackSortKeys)
+        self.sortKeyCount = 0
 
         if self.ambiguityHandling == AmbiguityHandling.record: self.attemptAddKey(None)
 
@@ -145,6 +172,7 @@ class OutputDataStratifier(ABC):
         hasChildStratifier = self.childDataStratifier is not None
         self.allKeys.add(key)
         self.sortedKeys = None
+        if self.sortKeyHeap is not None and hasattr(key, "getSortKey"): self.pushSortKey(key)
 
         for dictionary in self.outputDataDictionaries:
 
@@ -168,6 +196,33 @@ class OutputDataStratifier(ABC):
         self.allKeys.remove(key)
 
 
+    def trackSortKeys(self):
+        """
+        Starts keeping a heap of the sort keys (see EncompassedData.getSortKey) of all feature keys, so that the smallest sort key
+        among keys still present can be found with getMinimumSortKey without looking through every key.
+        Keys that aren't features (e.g. None when recording ambiguity) are ignored.
+        """
+        self.sortKeyHeap = list()
+        for key in self.allKeys:
+            if hasattr(key, "getSortKey"): self.pushSortKey(key)
+
+
+    def pushSortKey(self, key):
+        # The count breaks ties so that the keys themselves are never compared.
+        heapq.heappush(self.sortKeyHeap, (key.getSortKey(), self.sortKeyCount, key))
+        self.sortKeyCount += 1
+
+
+    def getMinimumSortKey(self):
+        """
+        Returns the smallest sort key among the feature keys still present, or None if there are none.
+        Entries for removed keys are discarded from the heap as they are encountered.
+        """
+        while self.sortKeyHeap and self.sortKeyHeap[0][2] not in self.allKeys: heapq.heappop(self.sortKeyHeap)
+        if self.sortKeyHeap: return self.sortKeyHeap[0][0]
+        else: return None
+
+
     def manageMemory(self):
         """
         Perform 3 tasks to free up memory:  
@@ -233,6 +288,17 @@ class OutputDataStratifier(ABC):
         else: return None
 
 
+    def getKeyDirectly(self, encompassedFeature: EncompassedData, encompassingFeature: EncompassingData):
+        """
+        Retrieves the key for the given encompassed feature within the given encompassing feature without needing to track ambiguity.
+        This is only used when every stratifier tolerates ambiguity, in which case children should override it to compute the key
+        straight from the two features instead of storing it in the encompassed feature's stratifierData dictionary first.
+        By default, just updates the encompassed feature and then retrieves the relevant key.
+        """
+        self.updateConfirmedEncompassedFeature(encompassedFeature, encompassingFeature)
+        return self.getRelevantKey(encompassedFeature)
+
+
     def getSortedKeysForOutput(self):
         """
         A function which implements some functionality previously handled by getKeysForOutput by
@@ -266,35 +332,55 @@ class OutputDataStratifier(ABC):
         else: return self.sortedKeys
 
 
+    def hasFixedKeys(self):
+        """
+        Returns whether or not every key this stratifier could output is known before counting starts (rather than being found
+        during counting).  By default, keys are assumed to be found during counting.
+        """
+        return False
+
+
 class RelativePosODS(OutputDataStratifier):
     """
     An output data stratifier which tracks the position of the encompassed feature relative to the encompassing feature.
     """
 
     def __init__(self, ambiguityHandling, outputDataDictionaries,
-                 encompassingFeature: EncompassingData, centerRelativePos, extraRangeRadius, outputName, strandSpecificPos):
+                 encompassingFeature: EncompassingData, centerRelativePos, extraRangeRadius, outputName, strandSpecificPos,
+                 growRange = False, binSize = None):
         """
         Uses the size of the given encompassing feature to set up the given layer of the output data structure using the range of values encompassed.
         If centerRelativePos is true, the "0" position in the dictionary is the middle of the range, rounded up.
         extraRangeRadius adds 2*[value] positions to the given range. 
         If strandSpecificPos is true, positions take into account strandedness, so
         positions encompassed by features on the '-' strand have their sign flipped.
-        NOTE: I'm pretty sure that the way this initialization works, it expects that ALL encompassing features will have the same
-        size. This may need to be updated in the future with a parameter that allows for dynamic expansion of relative position values via the
-        attemptAddKey function.
+        NOTE: By default, this initialization expects that ALL encompassing features will have the same size.
+        If growRange is true, encompassing features may have different sizes, and the range of relative positions is expanded as
+        positions outside of it are encountered.  (Symmetrically, if centerRelativePos is true.)  In this case, encompassingFeature
+        may be None, in which case the range starts out empty.
+        If binSize is given, relative positions are grouped into bins of that many positions.  Each bin is keyed by the multiple of binSize
+        nearest to its positions if centerRelativePos is true (so that bins are symmetric around 0) and by its first position otherwise.
         """
         super().__init__(ambiguityHandling, outputDataDictionaries, outputName)
 
         # Set important class variables
         self.centerRelativePos = centerRelativePos
         self.strandSpecificPos = strandSpecificPos
+        self.growRange = growRange
+        self.binSize = binSize
         self.relativePosIntPositions = list()
         self.relativePosHalfPositions = list()
         self.usedIntPosition = False
         self.usedHalfPosition = False
+        self.minPosition = None # The bounds of the int positions (or bins) in the range, used to expand it.
+        self.maxPosition = None
 
-        # Calculate the output data range length
-        outputDataRangeLength = encompassingFeature.endPos - encompassingFeature.startPos + extraRangeRadius*2 + 1
+        if encompassingFeature is None:
+            assert growRange, "An encompassing feature is needed to determine the range of relative positions unless growRange is true."
+            outputDataRangeLength = 0
+        else:
+            # Calculate the output data range length
+            outputDataRangeLength = encompassingFeature.endPos - encompassingFeature.startPos + extraRangeRadius*2 + 1
 
         # Center the range, if necessary.
         if centerRelativePos:
@@ -311,29 +397,98 @@ class RelativePosODS(OutputDataStratifier):
             self.relativePosIntPositions.append(i)
             if (outputDataRangeLength % 2 == 0 and centerRelativePos) or i != outputDataRange.stop - 1: self.relativePosHalfPositions.append(i+0.5)
 
+        # If binning, only the bins covering the range are used.
+        if binSize is not None:
+            assert binSize > 0, "binSize must be positive."
+            self.relativePosIntPositions = sorted({self.getBin(position) for position in
+                                                   self.relativePosIntPositions + self.relativePosHalfPositions})
+            self.relativePosHalfPositions = list()
+
         # Set up this stratification level of the output data structure.
         for dictionary in self.outputDataDictionaries:
             for position in self.relativePosIntPositions+self.relativePosHalfPositions:
                 dictionary[position] = 0
 
         self.allKeys.update(self.relativePosIntPositions + self.relativePosHalfPositions)
+        if self.relativePosIntPositions:
+            self.minPosition = min(self.relativePosIntPositions)
+            self.maxPosition = max(self.relativePosIntPositions)
 
         # Convert the lists of int and half positions to sets for easier lookup.
         self.relativePosIntPositions = set(self.relativePosIntPositions)
         self.relativePosHalfPositions = set(self.relativePosHalfPositions)
 
 
-    def updateConfirmedEncompassedFeature(self, encompassedFeature: EncompassedData, encompassingFeature: EncompassingData):
+    def getBin(self, relativePos):
         """
-        Checks the position of the encompassed feature relative to the encompassing feature.
+        Returns the key for the bin containing the given relative position.  (See __init__)
+        """
+        if self.centerRelativePos: return math.floor(relativePos / self.binSize + 0.5) * self.binSize
+        else: return math.floor(relativePos / self.binSize) * self.binSize
+
+
+    def expandRange(self, relativePos):
+        """
+        Expands the range of relative positions (or bins) so that it contains the given position, adding every position in between
+        so that the range stays contiguous.  Each position is only ever added once, so the total cost is linear in the final range.
+        """
+        step = 1 if self.binSize is None else self.binSize
+        if self.centerRelativePos:
+            maxPosition = max(math.ceil(abs(relativePos)), self.maxPosition or 0, -(self.minPosition or 0))
+            minPosition = -maxPosition
+        else:
+            minPosition = math.floor(relativePos) if self.minPosition is None else min(self.minPosition, math.floor(relativePos))
+            maxPosition = math.ceil(relativePos) if self.maxPosition is None else max(self.maxPosition, math.ceil(relativePos))
+
+        for position in range(minPosition, maxPosition + 1, step):
+            if position not in self.relativePosIntPositions:
+                self.relativePosIntPositions.add(position)
+                self.attemptAddKey(position)
+            if self.binSize is None and position != maxPosition and position + 0.5 not in self.relativePosHalfPositions:
+                self.relativePosHalfPositions.add(position + 0.5)
+                self.attemptAddKey(position + 0.5)
+
+        self.minPosition = minPosition
+        self.maxPosition = maxPosition
+
+
+    def getRelativePosition(self, encompassedFeature: EncompassedData, encompassingFeature: EncompassingData):
+        """
+        Computes the (binned, if applicable) position of the encompassed feature relative to the encompassing feature,
+        expanding the range of relative positions to include it if growRange is true.
         """
         if self.centerRelativePos:
-            relativePosition = encompassedFeature.position - encompassingFeature.center
+            relativePos = encompassedFeature.position - encompassingFeature.center
         else:
-            relativePosition = encompassedFeature.position - encompassingFeature.startPos
-        if self.strandSpecificPos and encompassingFeature.strand == '-': relativePosition *= -1
+            relativePos = encompassedFeature.position - encompassingFeature.startPos
+        if self.strandSpecificPos and encompassingFeature.strand == '-': relativePos *= -1
 
-        encompassedFeature.updateStratifierData(type(self), relativePosition)
+        if self.binSize is not None: relativePos = self.getBin(relativePos)
+        if (self.growRange and relativePos not in self.relativePosIntPositions
+            and relativePos not in self.relativePosHalfPositions): self.expandRange(relativePos)
+
+        return relativePos
+
+
+    def updateConfirmedEncompassedFeature(self, encompassedFeature: EncompassedData, encompassingFeature: EncompassingData):
+        """
+        Checks the position of the encompassed feature relative to the encompassing feature.
+        """
+        encompassedFeature.updateStratifierData(type(self), self.getRelativePosition(encompassedFeature, encompassingFeature))
+
+
+    def getKeyDirectly(self, encompassedFeature: EncompassedData, encompassingFeature: EncompassingData):
+        """
+        Computes the relative position straight from the two features (still keeping track of int and half position usage).
+        """
+        relativePos = self.getRelativePosition(encompassedFeature, encompassingFeature)
+
+        if not self.usedIntPosition and relativePos in self.relativePosIntPositions:
+            self.usedIntPosition = True
+        if not self.usedHalfPosition and relativePos in self.relativePosHalfPositions:
+            self.usedHalfPosition = True
+
+        return relativePos
 
 
     def getRelevantKey(self, encompassedFeature: EncompassedData):
@@ -354,6 +509,14 @@ class RelativePosODS(OutputDataStratifier):
         else: return None
 
 
+    def hasFixedKeys(self):
+        """
+        The range of positions is only fixed if it can't grow, and if there are no half positions whose use would change
+        which positions are output.
+        """
+        return not self.growRange and not self.relativePosHalfPositions
+
+
     def getSortedKeysForOutput(self):
         """
         Returns the positions as keys for output, sorted numerically.
@@ -396,12 +559,23 @@ class FeatureFractionODS(OutputDataStratifier):
         for fraction in range(self.fractionNum): self.attemptAddKey(fraction + 1)
         for i in range(self.flankingBinNum): self.attemptAddKey(0-i); self.attemptAddKey(self.fractionNum+1+i)
 
+
+    def hasFixedKeys(self):
+        return True
+
     
     def updateConfirmedEncompassedFeature(self, encompassedFeature: EncompassedData, encompassingFeature: EncompassingData):
         """
         Using the given features, determine what fraction the encompassed feature belongs in with respect to the 
         encompassing feature.  Also, check for ambiguity as necessary.
         """
+        encompassedFeature.updateStratifierData(type(self), self.getKeyDirectly(encompassedFeature, encompassingFeature))
+
+
+    def getKeyDirectly(self, encompassedFeature: EncompassedData, encompassingFeature: EncompassingData):
+        """
+        Determines the bin that the encompassed feature belongs in with respect to the encompassing feature.
+        """
 
         # Determine the bin size for the given feature. (Calculated without flanking regions.)
         nonFlankingSize = encompassingFeature.getLength()-2*self.flankingBinSize*self.flankingBinNum
@@ -416,12 +590,12 @@ class FeatureFractionODS(OutputDataStratifier):
         # and a relative position of "nonFlankingSize" is the start of the first flanking bin on the other side.
         relativePos -= self.flankingBinSize*self.flankingBinNum
 
-        # Determine which bin the encompassed feature belongs in and update it accordingly.
+        # Determine which bin the encompassed feature belongs in.
         if relativePos < 0: encompassedBinNum = int((relativePos+1)/self.flankingBinSize)
         elif relativePos >= nonFlankingSize: 
             encompassedBinNum = int( (relativePos - nonFlankingSize) / self.flankingBinSize ) + self.fractionNum + 1
         else: encompassedBinNum = int(relativePos/binSize) + 1
-        encompassedFeature.updateStratifierData(type(self), encompassedBinNum)
+        return encompassedBinNum
 
 
 class StrandComparisonODS(OutputDataStratifier):
@@ -441,6 +615,10 @@ class StrandComparisonODS(OutputDataStratifier):
         self.allKeys.update((True, False))
 
 
+    def hasFixedKeys(self):
+        return True
+
+
     def updateConfirmedEncompassedFeature(self, encompassedFeature: EncompassedData, encompassingFeature: EncompassingData):
         """
         Checks the difference between strands on the current encompassed and encompassing features.
@@ -449,6 +627,10 @@ class StrandComparisonODS(OutputDataStratifier):
         encompassedFeature.updateStratifierData(type(self), strandComparison)
 
 
+    def getKeyDirectly(self, encompassedFeature: EncompassedData, encompassingFeature: EncompassingData):
+        return encompassedFeature.strand == encompassingFeature.strand
+
+
     def getSortedKeysForOutput(self):
         """
         Returns True and False for strand matching and mismatching and also None if recording ambiguity
@@ -462,12 +644,14 @@ class EncompassingFeatureODS(OutputDataStratifier):
     Stratifies the output data structure by the position of encompassing features.
     """
     
-    def __init__(self, ambiguityHandling, outputDataDictionaries, outputName):
+    def __init__(self, ambiguityHandling, outputDataDictionaries, outputName, naturalChromosomeOrder = False):
         """
         Nothing too special here!
         All keys (except None if recording ambiguity) cannot be pre-determined and are added as they are encountered.
+        If naturalChromosomeOrder is true, chromosomes are sorted for output with their numbers in numerical order.
         """
         super().__init__(ambiguityHandling, outputDataDictionaries, outputName=outputName)
+        self.naturalChromosomeOrder = naturalChromosomeOrder
 
 
     def updateConfirmedEncompassedFeature(self, encompassedFeature: EncompassedData, encompassingFeature: EncompassingData):
@@ -477,6 +661,10 @@ class EncompassingFeatureODS(OutputDataStratifier):
         encompassedFeature.updateStratifierData(type(self), encompassingFeature)
 
 
+    def getKeyDirectly(self, encompassedFeature: EncompassedData, encompassingFeature: EncompassingData):
+        return encompassingFeature
+
+
     def onNewEncompassingFeature(self, encompassingFeature: EncompassingData):
         """
         Add the encompassing feature to the set of keys.
@@ -488,6 +676,18 @@ class EncompassingFeatureODS(OutputDataStratifier):
         self.attemptAddKey(encompassingFeature)
 
 
+    def getSortedKeysForOutput(self):
+        """
+        Sorts the encompassing features by chromosome, start, and end position (the same order as their comparison operator)
+        using a single key tuple for each feature instead of comparing the features themselves.
+        """
+        getChromosomeSortKey = getChromosomeSortKeyFunction(self.naturalChromosomeOrder)
+        sortedKeys = sorted(self.allKeys - {None}, key = lambda feature: (getChromosomeSortKey(feature.chromosome),
+                                                                          feature.startPos, feature.endPos))
+        if None in self.allKeys: sortedKeys.append(None)
+        return sortedKeys
+
+
     def formatKeyForOutput(self, key: EncompassingData) -> str:
         if key is None: return str(key)
         else: return key.getLocationString()
@@ -498,12 +698,14 @@ class EncompassedFeatureODS(OutputDataStratifier):
     Stratifies the output data structure by the position of encompassed features.
     """
     
-    def __init__(self, outputDataDictionaries, outputName):
+    def __init__(self, outputDataDictionaries, outputName, naturalChromosomeOrder = False):
         """
         Ambiguity handling is forced to be tolerant as there can be no ambiguity as to an encompassed data's own identity.
         All keys cannot be pre-determined and are added as they are encountered.
+        If naturalChromosomeOrder is true, chromosomes are sorted for output with their numbers in numerical order.
         """
         super().__init__(AmbiguityHandling.tolerate, outputDataDictionaries, outputName=outputName)
+        self.naturalChromosomeOrder = naturalChromosomeOrder
 
 
     def updateConfirmedEncompassedFeature(self, encompassedFeature: EncompassedData, encompassingFeature: EncompassingData):
@@ -534,6 +736,19 @@ class EncompassedFeatureODS(OutputDataStratifier):
         return encompassedFeature
 
 
+    def getKeyDirectly(self, encompassedFeature: EncompassedData, encompassingFeature: EncompassingData):
+        return self.getRelevantKey(encompassedFeature)
+
+
+    def getSortedKeysForOutput(self):
+        """
+        Sorts the encompassed features by chromosome and position (the same order as their comparison operator)
+        using a single key tuple for each feature instead of comparing the features themselves.
+        """
+        getChromosomeSortKey = getChromosomeSortKeyFunction(self.naturalChromosomeOrder)
+        return sorted(self.allKeys, key = lambda feature: (getChromosomeSortKey(feature.chromosome), feature.position))
+
+
     def formatKeyForOutput(self, key: EncompassedData) -> str:
         if key is None: return str(key)
         else: return key.getLocationString()
@@ -542,6 +757,8 @@ class EncompassedFeatureODS(OutputDataStratifier):
 class EncompassedFeatureContextODS(OutputDataStratifier):
     """
     An output data stratifier which stratifies based on the context (dinuc, trinuc, etc.) of encompassed features.
+    Contexts (and the bases they are altered to, if included) are stored as integers using 2 bits per base, and are only
+    converted back to strings (e.g. "ACG>T") for output.  Contexts containing anything other than A, C, G, or T are stored as strings.
     """
 
     def __init__(self, outputDataDictionaries, outputName, contextSize, includeAlteredTo):
@@ -553,6 +770,7 @@ class EncompassedFeatureContextODS(OutputDataStratifier):
         super().__init__(AmbiguityHandling.tolerate, outputDataDictionaries, outputName)
         self.contextSize = contextSize
         self.includeAlteredTo = includeAlteredTo
+        self.keyCache: Dict[Union[str, Tuple[str, str]], Union[int, str]] = dict()
 
 
     def updateConfirmedEncompassedFeature(self, encompassedFeature: EncompassedData, encompassingFeature: EncompassingData):
@@ -564,27 +782,71 @@ class EncompassedFeatureContextODS(OutputDataStratifier):
 
     def getRelevantKey(self, encompassedFeature: EncompassedDataWithContext):
         """
-        Retrieve the context of the desired size from the encompassed feature's context.
-        If the retrieved context hasn't been seen before, add it to the dictionaries.
+        Retrieve the key for the context of the desired size from the encompassed feature's context.
+        Keys are cached by the encompassed feature's full context (and alteredTo value), so each distinct
+        context only needs to be trimmed, encoded, and added to the dictionaries once.
+        """
+        if self.includeAlteredTo: cacheKey = (encompassedFeature.context, encompassedFeature.alteredTo)
+        else: cacheKey = encompassedFeature.context
+
+        key = self.keyCache.get(cacheKey)
+        if key is None:
+            key = self.getKey(self.getTrimmedContext(encompassedFeature.context), encompassedFeature.alteredTo if self.includeAlteredTo else None)
+            self.attemptAddKey(key)
+            self.keyCache[cacheKey] = key
+
+        return key
+
+
+    def getKeyDirectly(self, encompassedFeature: EncompassedDataWithContext, encompassingFeature: EncompassingData):
+        return self.getRelevantKey(encompassedFeature)
+
+
+    def getTrimmedContext(self, context: str):
+        """
+        Retrieve the central portion of the given context with the desired size.
         """
 
         # Run some checks to make sure we can get the desired context from the given data.
-        assert len(encompassedFeature.context) >= self.contextSize, ("Encompassed feature's context, " + encompassedFeature.context + 
-                                                                     ", has insufficient length for desired size: " + str(self.contextSize))
-        assert len(encompassedFeature.context) % 2 == self.contextSize % 2, ("Encompassed feature's context length, " + encompassedFeature.context + 
-                                                                             ", does not have the same parity as context size.")
+        assert len(context) >= self.contextSize, ("Encompassed feature's context, " + context + 
+                                                  ", has insufficient length for desired size: " + str(self.contextSize))
+        assert len(context) % 2 == self.contextSize % 2, ("Encompassed feature's context length, " + context + 
+                                                          ", does not have the same parity as context size.")
+
+        contextSizeDifference = len(context) - self.contextSize
+        return context[int(contextSizeDifference/2):self.contextSize+int(contextSizeDifference/2)]
+
+
+    def getKey(self, context: str, alteredTo: str = None):
+        """
+        Returns the key used to store the given context (already trimmed to the desired size) and, if given, the base it is altered to.
+        Alternatively, a single string formatted for output (e.g. "ACG>T") may be given as the context.
+        Useful for accessing the output data structure directly (e.g. in count derivative functions).
+        """
+        if alteredTo is None and '>' in context: context, alteredTo = context.split('>')
+        key = encodeSequence(context if alteredTo is None else context + alteredTo)
+        if key is None:
+            if alteredTo is None: return context
+            else: return context + '>' + alteredTo
+        else: return key
 
-        # Get the context of desired size.
-        contextSizeDifference = len(encompassedFeature.context) - self.contextSize
-        context = encompassedFeature.context[int(contextSizeDifference/2):self.contextSize+int(contextSizeDifference/2)]
 
-        # If requested, add information on the mutant base (or other alteration)
-        if self.includeAlteredTo: context = context + ">" + encompassedFeature.alteredTo
+    def getSortedKeysForOutput(self):
+        """
+        Sorts keys based on their formatted strings, so that integer-encoded and string keys are ordered together alphabetically.
+        """
+        return sorted(self.allKeys, key = self.formatKeyForOutput)
 
-        # Add this context to the output data dictionaries if we haven't seen it before.
-        self.attemptAddKey(context)
 
-        return context
+    def formatKeyForOutput(self, key):
+        """
+        Converts integer-encoded keys back to their context strings, adding the altered-to base(s) if necessary.
+        """
+        if isinstance(key, int):
+            sequence = decodeSequence(key)
+            if self.includeAlteredTo: return sequence[:self.contextSize] + '>' + sequence[self.contextSize:]
+            else: return sequence
+        else: return str(key)
 
 
 class SimpleEncompassingColStrODS(OutputDataStratifier):
@@ -605,6 +867,11 @@ class SimpleEncompassingColStrODS(OutputDataStratifier):
         if key is not None: self.attemptAddKey(key)
         return key
 
+    def getKeyDirectly(self, encompassedFeature: EncompassedData, encompassingFeature: EncompassingData):
+        key = encompassingFeature.choppedUpLine[self.colIndex]
+        self.attemptAddKey(key)
+        return key
+
 
 class PlaceholderODS(OutputDataStratifier):
     """
@@ -619,6 +886,10 @@ class PlaceholderODS(OutputDataStratifier):
         self.allKeys.add(None)
 
 
+    def hasFixedKeys(self):
+        return True
+
+
     def updateConfirmedEncompassedFeature(self, encompassedFeature: EncompassedData, encompassingFeature: EncompassingData):
         return None
 
@@ -627,5 +898,9 @@ class PlaceholderODS(OutputDataStratifier):
         return None
 
 
+    def getKeyDirectly(self, encompassedFeature: EncompassedData, encompassingFeature: EncompassingData):
+        return None
+
+
     def formatKeyForOutput(self, key):
         return self.outputName
\ No newline at end of file
@@ -0,0 +1,673 @@
+# This script contains tools for deriving null models and confidence intervals for the ThisInThatCounter's output.
+# Instead of re-running the counter on a new set of randomized files for every iteration, the necessary data
+# is held in memory, and every iteration is computed with array operations over all output cells at once.
+from abc import ABC, abstractmethod
+from typing import Dict, List, Tuple
+import warnings
+import numpy as np
+from benbiohelpers.CountThisInThat.Counter import ThisInThatCounter
+from benbiohelpers.CountThisInThat.InputDataStructures import EncompassedData, EncompassingData
+from benbiohelpers.CountThisInThat.CounterOutputDataHandler import CounterOutputDataHandler
+from benbiohelpers.CountThisInThat.OutputDataStratifiers import *
+
+
+def getSortedKeysForSummary(outputDataStratifier: OutputDataStratifier, keys):
+    """
+    Sorts the given keys for a single stratification level, preferring the order used by the stratifier itself when it
+    accounts for every key.  Otherwise, keys are sorted by value (or by their string representation if they can't be compared)
+    with None placed at the end.
+    """
+    stratifierOrder = {key: i for i, key in enumerate(outputDataStratifier.getKeysForOutput())}
+    if all(key in stratifierOrder for key in keys): return sorted(keys, key = lambda key: stratifierOrder[key])
+
+    nonNoneKeys = [key for key in keys if key is not None]
+    try: sortedKeys = sorted(nonNoneKeys)
+    except TypeError: sortedKeys = sorted(nonNoneKeys, key = str)
+    if None in keys: sortedKeys.append(None)
+    return sortedKeys
+
+
+def formatCount(count):
+    """
+    Formats the given count for output, dropping the decimal from whole numbers.
+    """
+    if float(count).is_integer(): return str(int(count))
+    else: return str(count)
+
+
+class CellRegistry:
+    """
+    Keeps track of the output cells (one key per stratification level) encountered while resampling.
+    Keys are converted to integer codes for each level so that cells can be grouped with array operations,
+    and each unique combination of codes is assigned a column in the resulting count matrices.
+    """
+
+    def __init__(self, levelCount):
+        self.levelCount = levelCount
+        self.keyCodes: List[Dict] = [dict() for _ in range(levelCount)]
+        self.keysByLevel: List[List] = [list() for _ in range(levelCount)]
+        self.cellColumns: Dict[Tuple, int] = dict()
+        self.cells: List[Tuple] = list()
+
+
+    def getCode(self, level, key):
+        """
+        Returns the integer code for the given key at the given level, creating a new one if necessary.
+        """
+        key = self.convertKey(key)
+        code = self.keyCodes[level].get(key)
+        if code is None:
+            code = len(self.keysByLevel[level])
+            self.keyCodes[level][key] = code
+            self.keysByLevel[level].append(key)
+        return code
+
+
+    @staticmethod
+    def convertKey(key):
+        """
+        Converts numpy scalars back to their python equivalents, with whole-number floats becoming ints
+        (to match the keys used by the stratifiers themselves).
+        """
+        if isinstance(key, np.generic): key = key.item()
+        if isinstance(key, float) and key.is_integer(): key = int(key)
+        return key
+
+
+    def getCodes(self, level, keys: np.ndarray):
+        """
+        Converts an array of keys to an array of integer codes for the given level.
+        """
+        if len(keys) == 0: return np.zeros(0, dtype = np.int64)
+        uniqueKeys, inverse = np.unique(keys, return_inverse = True)
+        uniqueCodes = np.array([self.getCode(level, key) for key in uniqueKeys], dtype = np.int64)
+        return uniqueCodes[inverse.reshape(-1)]
+
+
+    def getCellColumns(self, cellCodes: np.ndarray):
+        """
+        Given a 2D array of unique cell codes (one row per cell), returns the column associated with each cell.
+        """
+        columns = np.empty(len(cellCodes), dtype = np.int64)
+        for i, codes in enumerate(map(tuple, cellCodes.tolist())):
+            column = self.cellColumns.get(codes)
+            if column is None:
+                column = len(self.cells)
+                self.cellColumns[codes] = column
+                self.cells.append(codes)
+            columns[i] = column
+        return columns
+
+
+    def getCellKeys(self, column):
+        """
+        Returns the original keys for the cell at the given column.
+        """
+        return tuple(self.keysByLevel[level][code] for level, code in enumerate(self.cells[column]))
+
+
+class ChromosomeFeatures:
+    """
+    Holds the encompassed and encompassing features for a single chromosome as arrays.
+    Encompassing features are assumed to be sorted by their start positions (as enforced by the counter).
+    """
+
+    def __init__(self, chromosome, encompassedFeatures: List[EncompassedData], encompassingFeatures: List[EncompassingData],
+                 encompassingFeatureExtraRadius):
+        self.chromosome = chromosome
+        self.encompassedFeatures = encompassedFeatures
+        self.encompassingFeatures = encompassingFeatures
+
+        self.positions = np.array([feature.position for feature in encompassedFeatures], dtype = float)
+        self.countWeights = np.array([feature.countWeight for feature in encompassedFeatures], dtype = float)
+        self.strands = np.array([feature.strand for feature in encompassedFeatures])
+
+        self.encompassingStarts = np.array([feature.startPos for feature in encompassingFeatures], dtype = float)
+        self.encompassingEnds = np.array([feature.endPos for feature in encompassingFeatures], dtype = float)
+        self.encompassingCenters = np.array([feature.center for feature in encompassingFeatures], dtype = float)
+        self.encompassingStrands = np.array([feature.strand for feature in encompassingFeatures])
+
+        # Expand the encompassing features by the extra radius and keep a running maximum of their end positions
+        # so that the first encompassing feature which could contain a given position can be found with a binary search.
+        self.searchStarts = self.encompassingStarts - encompassingFeatureExtraRadius
+        self.searchEnds = self.encompassingEnds + encompassingFeatureExtraRadius
+        if len(encompassingFeatures) > 0: self.runningMaxEnds = np.maximum.accumulate(self.searchEnds)
+        else: self.runningMaxEnds = self.searchEnds
+
+
+    def findEncompassment(self, positions: np.ndarray):
+        """
+        Finds every pairing of the given positions (one per encompassed feature) with the encompassing features that contain them.
+        Returns two arrays: the indices of the encompassed features and the indices of their encompassing features.
+        The pairs are sorted by encompassed feature and then by encompassing feature.
+        """
+        if len(positions) == 0 or len(self.encompassingFeatures) == 0:
+            return np.zeros(0, dtype = np.int64), np.zeros(0, dtype = np.int64)
+
+        firstCandidates = np.searchsorted(self.runningMaxEnds, positions, "left")
+        candidateStops = np.searchsorted(self.searchStarts, positions, "right")
+        candidateCounts = candidateStops - firstCandidates
+
+        encompassedIndices = list()
+        encompassingIndices = list()
+        for offset in range(max(int(candidateCounts.max()), 0)):
+            stillSearching = np.nonzero(candidateCounts > offset)[0]
+            candidates = firstCandidates[stillSearching] + offset
+            encompassed = self.searchEnds[candidates] >= positions[stillSearching]
+            encompassedIndices.append(stillSearching[encompassed])
+            encompassingIndices.append(candidates[encompassed])
+
+        if len(encompassedIndices) == 0: return np.zeros(0, dtype = np.int64), np.zeros(0, dtype = np.int64)
+        encompassedIndices = np.concatenate(encompassedIndices)
+        encompassingIndices = np.concatenate(encompassingIndices)
+        order = np.lexsort((encompassingIndices, encompassedIndices))
+        return encompassedIndices[order], encompassingIndices[order]
+
+
+class ResampledCounts(ABC):
+    """
+    A parent class for anything that produces many resampled versions of the counter's output.
+    Children should fill in the cell registry along with the observed counts and the resampled counts
+    (a 2D array with one row per iteration and one column per output cell) in their run function.
+    """
+
+    summaryPrefix = "Resampled"
+
+    def __init__(self, outputDataHandler: CounterOutputDataHandler):
+        self.outputDataHandler = outputDataHandler
+        self.outputDataStratifiers: List[OutputDataStratifier] = outputDataHandler.outputDataStratifiers
+        self.cellRegistry = CellRegistry(len(self.outputDataStratifiers))
+        self.observedCounts = None
+        self.resampledCounts = None
+
+
+    @abstractmethod
+    def run(self) -> np.ndarray:
+        """
+        Computes and returns the resampled counts.
+        """
+
+
+    def getSortedCellColumns(self):
+        """
+        Returns the cell columns sorted by the keys at each stratification level, outermost level first.
+        """
+        keyOrders = list()
+        for level, outputDataStratifier in enumerate(self.outputDataStratifiers):
+            sortedKeys = getSortedKeysForSummary(outputDataStratifier, self.cellRegistry.keysByLevel[level])
+            keyOrders.append({self.cellRegistry.getCode(level, key): i for i, key in enumerate(sortedKeys)})
+        return sorted(range(len(self.cellRegistry.cells)),
+                      key = lambda column: [keyOrders[level][code] for level, code in enumerate(self.cellRegistry.cells[column])])
+
+
+    def summarize(self, quantiles = (0.025, 0.5, 0.975)) -> Dict[Tuple, Tuple[float, float, List[float]]]:
+        """
+        Returns a dictionary with each output cell (a tuple of keys, one per stratification level) as a key.
+        Each value is a tuple containing the observed count, the mean of the resampled counts, and the requested quantiles.
+        """
+        if self.resampledCounts is None: self.run()
+        means = self.resampledCounts.mean(axis = 0)
+        quantileValues = np.quantile(self.resampledCounts, quantiles, axis = 0)
+        return {self.cellRegistry.getCellKeys(column): (self.observedCounts[column], means[column], quantileValues[:,column].tolist())
+                for column in self.getSortedCellColumns()}
+
+
+    def writeSummary(self, outputFilePath, quantiles = (0.025, 0.5, 0.975)):
+        """
+        Writes the observed counts along with the mean and quantiles of the resampled counts for every output cell.
+        Key formatting (including any custom stratifying names) is taken from the counter's output data writer.
+        """
+        summary = self.summarize(quantiles)
+        writer = self.outputDataHandler.writer
+
+        with open(outputFilePath, 'w') as outputFile:
+            headers = [outputDataStratifier.outputName if outputDataStratifier.outputName is not None else "Level_" + str(level)
+                       for level, outputDataStratifier in enumerate(self.outputDataStratifiers)]
+            headers += ["Observed_Counts", self.summaryPrefix + "_Mean"] + [self.summaryPrefix + "_Quantile_" + str(quantile) for quantile in quantiles]
+            outputFile.write('\t'.join(headers) + '\n')
+
+            for cellKeys, (observed, mean, quantileValues) in summary.items():
+                if writer is not None: formattedKeys = [writer.getOutputName(level, key) for level, key in enumerate(cellKeys)]
+                else: formattedKeys = [self.outputDataStratifiers[level].formatKeyForOutput(key) for level, key in enumerate(cellKeys)]
+                outputFile.write('\t'.join(formattedKeys + [formatCount(observed), formatCount(mean)] + [formatCount(value) for value in quantileValues]) + '\n')
+
+
+class PermutationNullModel(ResampledCounts):
+    """
+    Builds a null model for the given ThisInThatCounter by randomly repositioning its encompassed features many times
+    and recording the counts in each output cell for each permutation.
+    Encompassed features are only ever repositioned within their own chromosome, and positions within masked regions are never used.
+    If matchContext is true, each feature is instead moved to a randomly chosen position from the given candidate positions file
+    (formatted like the encompassed features file) which shares the same central context of size contextSize.
+    By default, features are placed anywhere between the start of the chromosome and the furthest position observed in either input file,
+    but the chromosomeSizes dictionary can be used to give the actual size of each chromosome.
+
+    NOTE: The counter should be freshly constructed (its stratifiers and writer set up), but count() should NOT be called.
+          The null model reads the rest of the counter's input files itself, so the counter is consumed in the process.
+    """
+
+    summaryPrefix = "Null"
+
+    def __init__(self, counter: ThisInThatCounter, permutations = 1000, matchContext = False, contextSize = 3,
+                 candidatePositionsFilePath = None, maskedRegionsFilePath = None, chromosomeSizes: Dict[str, int] = None,
+                 seed = None):
+
+        super().__init__(counter.outputDataHandler)
+        self.counter = counter
+        self.permutations = permutations
+        self.matchContext = matchContext
+        self.contextSize = contextSize
+        self.randomNumberGenerator = np.random.default_rng(seed)
+
+        assert not self.matchContext or candidatePositionsFilePath is not None, (
+            "Candidate positions must be given in order to match contexts."
+        )
+        for outputDataStratifier in self.outputDataStratifiers:
+            if isinstance(outputDataStratifier, EncompassedFeatureODS):
+                raise ValueError("Encompassed features cannot be stratified by their own identity when their positions are permuted.")
+
+
+        self.readInputFeatures()
+        self.readMaskedRegions(maskedRegionsFilePath)
+        if self.matchContext: self.readCandidatePositions(candidatePositionsFilePath)
+        else: self.setUpChromosomeTerritories(chromosomeSizes)
+
+
+    def readInputFeatures(self):
+        """
+        Reads the remaining features from the counter's input files into memory, grouped by chromosome.
+        """
+        if not self.counter.suppressOutput: print("Reading input features into memory...")
+
+        encompassedFeaturesByChromosome: Dict[str, List[EncompassedData]] = dict()
+        encompassingFeaturesByChromosome: Dict[str, List[EncompassingData]] = dict()
+
+        if self.counter.currentEncompassedFeature is not None:
+            feature = self.counter.currentEncompassedFeature
+            encompassedFeaturesByChromosome.setdefault(feature.chromosome, list()).append(feature)
+        for line in self.counter.encompassedFeaturesFile:
+            feature = self.counter.getEncompassedFeature(line)
+            encompassedFeaturesByChromosome.setdefault(feature.chromosome, list()).append(feature)
+
+        if self.counter.currentEncompassingFeature is not None:
+            feature = self.counter.currentEncompassingFeature
+            encompassingFeaturesByChromosome.setdefault(feature.chromosome, list()).append(feature)
+        for line in self.counter.encompassingFeaturesFile:
+            feature = self.counter.constructEncompassingFeature(line)
+            encompassingFeaturesByChromosome.setdefault(feature.chromosome, list()).append(feature)
+
+        self.counter.encompassedFeaturesFile.close()
+        self.counter.encompassingFeaturesFile.close()
+
+        self.chromosomeFeatures: Dict[str, ChromosomeFeatures] = dict()
+        for chromosome in sorted(encompassedFeaturesByChromosome):
+            self.chromosomeFeatures[chromosome] = ChromosomeFeatures(
+                chromosome, encompassedFeaturesByChromosome[chromosome],
+                encompassingFeaturesByChromosome.get(chromosome, list()), self.counter.encompassingFeatureExtraRadius
+            )
+
+        # Precompute the codes for any stratification levels that depend on only one of the two features.
+        self.encompassedFeatureCodes: Dict[Tuple[int, str], np.ndarray] = dict()
+        self.encompassingFeatureCodes: Dict[Tuple[int, str], np.ndarray] = dict()
+        for level, outputDataStratifier in enumerate(self.outputDataStratifiers):
+            for chromosome, features in self.chromosomeFeatures.items():
+                if isinstance(outputDataStratifier, (EncompassedFeatureContextODS, PlaceholderODS)):
+                    self.encompassedFeatureCodes[(level, chromosome)] = np.array(
+                        [self.cellRegistry.getCode(level, outputDataStratifier.getRelevantKey(feature))
+                         for feature in features.encompassedFeatures], dtype = np.int64)
+                elif isinstance(outputDataStratifier, EncompassingFeatureODS):
+                    self.encompassingFeatureCodes[(level, chromosome)] = np.array(
+                        [self.cellRegistry.getCode(level, feature) for feature in features.encompassingFeatures], dtype = np.int64)
+                elif isinstance(outputDataStratifier, SimpleEncompassingColStrODS):
+                    self.encompassingFeatureCodes[(level, chromosome)] = np.array(
+                        [self.cellRegistry.getCode(level, feature.choppedUpLine[outputDataStratifier.colIndex])
+                         for feature in features.encompassingFeatures], dtype = np.int64)
+
+
+    def readMaskedRegions(self, maskedRegionsFilePath):
+        """
+        Reads in masked regions from a bed file and merges them into sorted, non-overlapping intervals for each chromosome.
+        Intervals are stored as 0-based, half-open ranges.
+        """
+        self.maskedRegions: Dict[str, np.ndarray] = dict()
+        if maskedRegionsFilePath is None: return
+
+        unmergedRegions: Dict[str, List[Tuple[int, int]]] = dict()
+        with open(maskedRegionsFilePath, 'r') as maskedRegionsFile:
+            for line in maskedRegionsFile:
+                choppedUpLine = line.split('\t')
+                unmergedRegions.setdefault(choppedUpLine[0], list()).append((int(choppedUpLine[1]), int(choppedUpLine[2])))
+
+        for chromosome, regions in unmergedRegions.items():
+            mergedRegions = list()
+            for start, end in sorted(regions):
+                if mergedRegions and start <= mergedRegions[-1][1]: mergedRegions[-1][1] = max(mergedRegions[-1][1], end)
+                else: mergedRegions.append([start, end])
+            self.maskedRegions[chromosome] = np.array(mergedRegions, dtype = np.int64)
+
+
+    def isMasked(self, chromosome, positions: np.ndarray):
+        """
+        Returns a boolean array representing whether or not each given position falls within a masked region.
+        """
+        if chromosome not in self.maskedRegions: return np.zeros(len(positions), dtype = bool)
+        maskedRegions = self.maskedRegions[chromosome]
+        regionIndices = np.searchsorted(maskedRegions[:,0], positions, "right") - 1
+        return (regionIndices >= 0) & (positions < maskedRegions[np.maximum(regionIndices, 0), 1])
+
+
+    def setUpChromosomeTerritories(self, chromosomeSizes: Dict[str, int]):
+        """
+        Determines the unmasked intervals that encompassed features can be placed in for each chromosome.
+        Intervals are stored along with the cumulative number of positions preceding them so that uniformly
+        distributed positions can be drawn with a single binary search.
+        """
+        self.territories: Dict[str, Tuple[np.ndarray, np.ndarray]] = dict()
+        for chromosome, features in self.chromosomeFeatures.items():
+
+            if chromosomeSizes is not None: chromosomeSize = chromosomeSizes[chromosome]
+            else:
+                chromosomeSize = int(features.positions.max()) + 1
+                if len(features.encompassingFeatures) > 0:
+                    chromosomeSize = max(chromosomeSize, int(features.searchEnds.max()) + 1)
+
+            # Subtract the masked regions from the chromosome.
+            intervals = list()
+            intervalStart = 0
+            for maskedStart, maskedEnd in self.maskedRegions.get(chromosome, np.zeros((0,2), dtype = np.int64)).tolist():
+                if maskedStart > intervalStart: intervals.append((intervalStart, min(maskedStart, chromosomeSize)))
+                intervalStart = max(intervalStart, maskedEnd)
+                if intervalStart >= chromosomeSize: break
+            if intervalStart < chromosomeSize: intervals.append((intervalStart, chromosomeSize))
+            intervals = [interval for interval in intervals if interval[1] > interval[0]]
+            if len(intervals) == 0: raise ValueError(f"No unmasked positions available in {chromosome}.")
+
+            intervals = np.array(intervals, dtype = np.int64)
+            self.territories[chromosome] = (intervals, np.cumsum(intervals[:,1] - intervals[:,0]))
+
+
+    def getContextKey(self, context: str):
+        """
+        Returns the central portion of the given context with size contextSize.
+        """
+        contextSizeDifference = len(context) - self.contextSize
+        return context[int(contextSizeDifference/2):self.contextSize+int(contextSizeDifference/2)]
+
+
+    def readCandidatePositions(self, candidatePositionsFilePath):
+        """
+        Reads in the positions that encompassed features may be moved to, grouped by chromosome and context.
+        Candidate positions within masked regions are discarded.
+        """
+        candidatePositions: Dict[Tuple[str, str], List[float]] = dict()
+        with open(candidatePositionsFilePath, 'r') as candidatePositionsFile:
+            for line in candidatePositionsFile:
+                feature = self.counter.constructEncompassedFeature(line)
+                candidatePositions.setdefault((feature.chromosome, self.getContextKey(feature.context)), list()).append(feature.position)
+
+        self.candidatePositions: Dict[Tuple[str, str], np.ndarray] = dict()
+        for (chromosome, context), positions in candidatePositions.items():
+            positions = np.array(positions, dtype = float)
+            self.candidatePositions[(chromosome, context)] = positions[~self.isMasked(chromosome, positions)]
+
+        self.featureContexts: Dict[str, np.ndarray] = {
+            chromosome: np.array([self.getContextKey(feature.context) for feature in features.encompassedFeatures])
+            for chromosome, features in self.chromosomeFeatures.items()
+        }
+
+
+    def getRandomPositions(self, chromosome):
+        """
+        Returns a new, random position for every encompassed feature on the given chromosome.
+        Any fractional part of the original position (e.g. from the midpoint of an even-length feature) is preserved.
+        """
+        features = self.chromosomeFeatures[chromosome]
+        fractionalOffsets = features.positions % 1
+
+        if self.matchContext:
+            positions = np.empty(len(features.positions), dtype = float)
+            contexts = self.featureContexts[chromosome]
+            for context in np.unique(contexts):
+                withContext = np.nonzero(contexts == context)[0]
+                candidates = self.candidatePositions.get((chromosome, context))
+                if candidates is None or len(candidates) == 0:
+                    raise ValueError(f"No candidate positions available for context {context} in {chromosome}.")
+                positions[withContext] = np.floor(candidates[self.randomNumberGenerator.integers(0, len(candidates), len(withContext))])
+        else:
+            intervals, cumulativeSizes = self.territories[chromosome]
+            randomOffsets = self.randomNumberGenerator.integers(0, cumulativeSizes[-1], len(features.positions))
+            intervalIndices = np.searchsorted(cumulativeSizes, randomOffsets, "right")
+            precedingSizes = np.concatenate(((0,), cumulativeSizes[:-1]))
+            positions = (intervals[intervalIndices, 0] + randomOffsets - precedingSizes[intervalIndices]).astype(float)
+
+        return positions + fractionalOffsets
+
+
+    def getLevelKeys(self, level, outputDataStratifier: OutputDataStratifier, features: ChromosomeFeatures,
+                     positions: np.ndarray, encompassedIndices: np.ndarray, encompassingIndices: np.ndarray):
+        """
+        Returns the codes for the given stratification level for every encompassed/encompassing pair.
+        Common stratifiers are computed with array operations.  Anything else falls back on the stratifier's own methods.
+        """
+        chromosome = features.chromosome
+
+        if (level, chromosome) in self.encompassedFeatureCodes:
+            return self.encompassedFeatureCodes[(level, chromosome)][encompassedIndices]
+
+        elif (level, chromosome) in self.encompassingFeatureCodes:
+            return self.encompassingFeatureCodes[(level, chromosome)][encompassingIndices]
+
+        # (Growing ranges need to be expanded by the stratifier itself, so they use the fallback below.)
+        elif isinstance(outputDataStratifier, RelativePosODS) and not outputDataStratifier.growRange:
+            if outputDataStratifier.centerRelativePos:
+                relativePositions = positions[encompassedIndices] - features.encompassingCenters[encompassingIndices]
+            else: relativePositions = positions[encompassedIndices] - features.encompassingStarts[encompassingIndices]
+            if outputDataStratifier.strandSpecificPos:
+                relativePositions[features.encompassingStrands[encompassingIndices] == '-'] *= -1
+            if outputDataStratifier.binSize is not None: # Matches RelativePosODS.getBin
+                binSize = outputDataStratifier.binSize
+                if outputDataStratifier.centerRelativePos: relativePositions = np.floor(relativePositions/binSize + 0.5)*binSize
+                else: relativePositions = np.floor(relativePositions/binSize)*binSize
+            return self.cellRegistry.getCodes(level, relativePositions)
+
+        elif isinstance(outputDataStratifier, StrandComparisonODS):
+            return self.cellRegistry.getCodes(level, features.strands[encompassedIndices] ==
+                                                     features.encompassingStrands[encompassingIndices])
+
+        elif isinstance(outputDataStratifier, FeatureFractionODS):
+            flankingSize = outputDataStratifier.flankingBinSize*outputDataStratifier.flankingBinNum
+            starts = features.encompassingStarts[encompassingIndices]
+            ends = features.encompassingEnds[encompassingIndices]
+            nonFlankingSizes = ends - starts + 1 - 2*flankingSize
+            binSizes = nonFlankingSizes/outputDataStratifier.fractionNum
+            relativePositions = np.where(features.encompassingStrands[encompassingIndices] == '+',
+                                         positions[encompassedIndices] - starts, ends - positions[encompassedIndices]) - flankingSize
+            with np.errstate(divide = "ignore", invalid = "ignore"):
+                binNums = np.where(
+                    relativePositions < 0, np.trunc((relativePositions + 1)/max(outputDataStratifier.flankingBinSize, 1)),
+                    np.where(relativePositions >= nonFlankingSizes,
+                             np.trunc((relativePositions - nonFlankingSizes)/max(outputDataStratifier.flankingBinSize, 1))
+                             + outputDataStratifier.fractionNum + 1,
+                             np.trunc(relativePositions/binSizes) + 1)
+                )
+            return self.cellRegistry.getCodes(level, binNums.astype(np.int64))
+
+        # Fall back on the stratifier's own methods, one pair at a time.
+        else:
+            codes = np.empty(len(encompassedIndices), dtype = np.int64)
+            for i, (encompassedIndex, encompassingIndex) in enumerate(zip(encompassedIndices.tolist(), encompassingIndices.tolist())):
+                encompassedFeature = features.encompassedFeatures[encompassedIndex]
+                originalPosition = encompassedFeature.position
+                encompassedFeature.position = positions[encompassedIndex]
+                encompassedFeature.stratifierData = dict()
+                outputDataStratifier.updateConfirmedEncompassedFeature(encompassedFeature, features.encompassingFeatures[encompassingIndex])
+                codes[i] = self.cellRegistry.getCode(level, outputDataStratifier.getRelevantKey(encompassedFeature))
+                encompassedFeature.position = originalPosition
+                encompassedFeature.stratifierData = dict()
+            return codes
+
+
+    def getUnencompassedCodes(self, level, outputDataStratifier: OutputDataStratifier, chromosome, unencompassedIndices: np.ndarray):
+        """
+        Returns the codes for encompassed features that were never actually encompassed.  Only keys that are intrinsic
+        to the encompassed features are retained.  Everything else is recorded as None.
+        """
+        if (level, chromosome) in self.encompassedFeatureCodes:
+            return self.encompassedFeatureCodes[(level, chromosome)][unencompassedIndices]
+        else: return np.full(len(unencompassedIndices), self.cellRegistry.getCode(level, None), dtype = np.int64)
+
+
+    def getCounts(self, positionsByChromosome: Dict[str, np.ndarray]):
+        """
+        Counts encompassed features at the given positions using the counter's stratifiers.
+        Returns a 1D array of counts indexed by the columns in the cell registry.
+        """
+        countColumns = list()
+        countValues = list()
+        nontolerant = self.outputDataHandler.nontolerantAmbiguityHandling
+
+        for chromosome, features in self.chromosomeFeatures.items():
+
+            positions = positionsByChromosome[chromosome]
+            weights = features.countWeights
+            encompassedIndices, encompassingIndices = features.findEncompassment(positions)
+            levelCodes = [self.getLevelKeys(level, outputDataStratifier, features, positions, encompassedIndices, encompassingIndices)
+                          for level, outputDataStratifier in enumerate(self.outputDataStratifiers)]
+
+            # If there is non-tolerant ambiguity handling, each encompassed feature is counted once, using the most recent
+            # encompassing feature for tolerant stratifiers, and checking for ambiguity in the rest.
+            if nontolerant and len(encompassedIndices) > 0:
+                groupStarts = np.concatenate(((0,), np.nonzero(np.diff(encompassedIndices))[0] + 1))
+                groupEnds = np.concatenate((groupStarts[1:], (len(encompassedIndices),))) - 1
+                countedFeatures = np.ones(len(groupStarts), dtype = bool)
+                for level, outputDataStratifier in enumerate(self.outputDataStratifiers):
+                    codes = levelCodes[level][groupEnds]
+                    if outputDataStratifier.ambiguityHandling is not AmbiguityHandling.tolerate:
+                        ambiguous = (np.minimum.reduceat(levelCodes[level], groupStarts) !=
+                                     np.maximum.reduceat(levelCodes[level], groupStarts))
+                        if outputDataStratifier.ambiguityHandling is AmbiguityHandling.record:
+                            codes = np.where(ambiguous, self.cellRegistry.getCode(level, None), codes)
+                        else: countedFeatures &= ~ambiguous
+                    levelCodes[level] = codes
+                levelCodes = [codes[countedFeatures] for codes in levelCodes]
+                encompassedIndices = encompassedIndices[groupStarts][countedFeatures]
+
+            pairWeights = weights[encompassedIndices]
+
+            # Account for features that were never encompassed, if necessary.
+            if self.outputDataHandler.countAllEncompassed or self.outputDataHandler.countNonCountedEncompassedAsNegative:
+                unencompassed = np.ones(len(positions), dtype = bool)
+                unencompassed[encompassedIndices] = False
+                unencompassedIndices = np.nonzero(unencompassed)[0]
+                unencompassedWeights = weights[unencompassedIndices]
+                if self.outputDataHandler.countNonCountedEncompassedAsNegative:
+                    unencompassedWeights = unencompassedWeights * (int(self.outputDataHandler.countAllEncompassed) - 1)
+                levelCodes = [np.concatenate((codes, self.getUnencompassedCodes(level, outputDataStratifier, chromosome, unencompassedIndices)))
+                              for level, (codes, outputDataStratifier) in enumerate(zip(levelCodes, self.outputDataStratifiers))]
+                pairWeights = np.concatenate((pairWeights, unencompassedWeights))
+
+            if len(pairWeights) == 0: continue
+
+            # Group the counts by cell.
+            uniqueCells, cellIndices = np.unique(np.stack(levelCodes, axis = 1), axis = 0, return_inverse = True)
+            countColumns.append(self.cellRegistry.getCellColumns(uniqueCells))
+            countValues.append(np.bincount(cellIndices.reshape(-1), weights = pairWeights, minlength = len(uniqueCells)))
+
+        counts = np.zeros(len(self.cellRegistry.cells))
+        for columns, values in zip(countColumns, countValues): np.add.at(counts, columns, values)
+        return counts
+
+
+    def run(self):
+        """
+        Counts the observed data and then each permutation.
+        Returns the permuted counts as a 2D array with one row per permutation and one column per output cell.
+        """
+        if not self.counter.suppressOutput: print("Counting observed features...")
+        self.observedCounts = self.getCounts({chromosome: features.positions for chromosome, features in self.chromosomeFeatures.items()})
+
+        permutedCounts = list()
+        for permutation in range(self.permutations):
+            if not self.counter.suppressOutput and permutation % 100 == 0:
+                print(f"Running permutations {permutation+1}-{min(permutation+100, self.permutations)}...")
+            permutedCounts.append(self.getCounts({chromosome: self.getRandomPositions(chromosome) for chromosome in self.chromosomeFeatures}))
+
+        # Cells may have been discovered partway through, so pad each set of counts to the final number of cells.
+        cellCount = len(self.cellRegistry.cells)
+        self.observedCounts = np.pad(self.observedCounts, (0, cellCount - len(self.observedCounts)))
+        self.resampledCounts = np.zeros((self.permutations, cellCount))
+        for permutation, counts in enumerate(permutedCounts): self.resampledCounts[permutation, :len(counts)] = counts
+
+        return self.resampledCounts
+
+
+class BootstrapResampler(ResampledCounts):
+    """
+    Produces bootstrapped versions of the counter's output by resampling encompassing features with replacement.
+    Requires that the output data handler recorded counts by encompassing feature during counting.
+    (See CounterOutputDataHandler.trackCountsByEncompassingFeature)
+    Counts that were recorded without an encompassing feature are included in every iteration as-is.
+    """
+
+    summaryPrefix = "Bootstrap"
+
+    def __init__(self, outputDataHandler: CounterOutputDataHandler, iterations = 1000, seed = None):
+
+        super().__init__(outputDataHandler)
+        assert outputDataHandler.countsByEncompassingFeature is not None, (
+            "Counts were not recorded by encompassing feature, so they cannot be bootstrapped."
+        )
+        self.iterations = iterations
+        self.randomNumberGenerator = np.random.default_rng(seed)
+
+
+    def run(self):
+        """
+        Converts the recorded counts to sparse arrays (one entry per encompassing feature and output cell with a count)
+        and computes the output cell counts for each iteration with a single weighted bincount.
+        """
+        featureIndices = list()
+        cellCodes = list()
+        countValues = list()
+        fixedCellCodes = list()
+        fixedCountValues = list()
+
+        featureIndex = 0
+        for encompassingFeature, featureCounts in self.outputDataHandler.countsByEncompassingFeature.items():
+            for cellKeys, count in featureCounts.items():
+                codes = tuple(self.cellRegistry.getCode(level, key) for level, key in enumerate(cellKeys))
+                if encompassingFeature is None:
+                    fixedCellCodes.append(codes)
+                    fixedCountValues.append(count)
+                else:
+                    featureIndices.append(featureIndex)
+                    cellCodes.append(codes)
+                    countValues.append(count)
+            if encompassingFeature is not None: featureIndex += 1
+        featureCount = featureIndex
+
+        def getColumns(codes):
+            if len(codes) == 0: return np.zeros(0, dtype = np.int64)
+            uniqueCells, cellIndices = np.unique(np.array(codes, dtype = np.int64).reshape(len(codes), -1), axis = 0, return_inverse = True)
+            return self.cellRegistry.getCellColumns(uniqueCells)[cellIndices.reshape(-1)]
+
+        columns = getColumns(cellCodes)
+        fixedColumns = getColumns(fixedCellCodes)
+        featureIndices = np.array(featureIndices, dtype = np.int64)
+        countValues = np.array(countValues, dtype = float)
+        cellCount = len(self.cellRegistry.cells)
+
+        fixedCounts = np.bincount(fixedColumns, weights = np.array(fixedCountValues, dtype = float), minlength = cellCount)
+        self.observedCounts = np.bincount(columns, weights = countValues, minlength = cellCount) + fixedCounts
+
+        self.resampledCounts = np.tile(fixedCounts.astype(float), (self.iterations, 1))
+        if featureCount == 0:
+            warnings.warn("No counts were recorded for any encompassing features.  Bootstrapped counts will not vary.")
+            return self.resampledCounts
+
+        for iteration in range(self.iterations):
+            featureMultiplicities = np.bincount(self.randomNumberGenerator.integers(0, featureCount, featureCount), minlength = featureCount)
+            self.resampledCounts[iteration] += np.bincount(columns, weights = countValues*featureMultiplicities[featureIndices],
+                                                           minlength = cellCount)
+
+        return self.resampledCounts
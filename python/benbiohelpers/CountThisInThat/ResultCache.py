@@ -0,0 +1,190 @@
+# This script contains a cache of completed counter outputs, keyed by a fingerprint of everything that determines them:
+# the contents of both input files, the counter's class (and the source code behind it), its stratifier chain, its writer
+# options, and any other counter settings that affect the output.  Repeated counts are then copied from the cache instead of recounted.
+import hashlib, inspect, json, os, shutil
+from enum import Enum
+from typing import Dict
+
+FILE_HASH_SUFFIX = ".sha256"
+
+# Counter attributes which don't affect the output (or are fingerprinted separately).
+IGNORED_COUNTER_ATTRIBUTES = {"suppressOutput", "metrics", "useChromosomeIndex", "encompassedFeaturesFilePath",
+                              "encompassingFeaturesFilePath", "outputFilePath", "incrementalFlushThreshold", "memoryGovernor",
+                              "memoryReports", "memorySnapshots", "startedTracingMemory", "regions", "lastNonEncompassedFeature",
+                              "isCurrentEncompassedFeatureActuallyEncompassed", "previousEncompassingFeature", "confirmedEncompassedFeatures"}
+
+
+def getFileHash(filePath, writeHashFile = True) -> str:
+    """
+    Returns the sha256 hash of the given file's contents.  Like chromosome indices, hashes are stored in a sidecar file
+    (when writeHashFile is true and the directory is writable) and are only recomputed when the file's size or modification time changes.
+    """
+    fileStats = os.stat(filePath)
+    hashFilePath = str(filePath) + FILE_HASH_SUFFIX
+    if os.path.exists(hashFilePath):
+        try:
+            with open(hashFilePath, 'r') as hashFile: storedHash = json.load(hashFile)
+            if storedHash["fileSize"] == fileStats.st_size and storedHash["modificationTime"] == fileStats.st_mtime_ns:
+                return storedHash["sha256"]
+        except (ValueError, KeyError): pass # Unreadable hash files are just rewritten.
+
+    fileHash = hashlib.sha256()
+    with open(filePath, 'rb') as file:
+        for chunk in iter(lambda: file.read(2**20), b''): fileHash.update(chunk)
+    fileHash = fileHash.hexdigest()
+
+    if writeHashFile:
+        try:
+            with open(hashFilePath, 'w') as hashFile:
+                json.dump({"fileSize": fileStats.st_size, "modificationTime": fileStats.st_mtime_ns, "sha256": fileHash}, hashFile)
+        except OSError: pass # The hash is still usable; it just needs to be recomputed next time.
+    return fileHash
+
+
+def getSimpleAttributes(obj, ignoredAttributes = ()) -> Dict:
+    """
+    Returns the attributes of the given object whose values can be written as JSON (e.g. numbers, strings, and lists of them).
+    Enum values are given by name.
+    """
+    simpleAttributes = dict()
+    for name, value in vars(obj).items():
+        if name in ignoredAttributes: continue
+        if isinstance(value, Enum): value = value.name
+        try: json.dumps(value)
+        except (TypeError, ValueError): continue
+        simpleAttributes[name] = value
+    return simpleAttributes
+
+
+def describeClass(cls) -> Dict[str, str]:
+    """
+    Returns a hash of the source code of each class the given class is built from, so that changes to any of them
+    (e.g. to a counter's setupOutputDataStratifiers) change the fingerprint.
+    """
+    description = dict()
+    for baseClass in cls.__mro__:
+        if baseClass is object: continue
+        try: source = inspect.getsource(baseClass)
+        except (OSError, TypeError): source = "" # e.g. classes defined interactively.
+        description[f"{baseClass.__module__}:{baseClass.__qualname__}"] = hashlib.sha256(source.encode()).hexdigest()
+    return description
+
+
+def describeConstant(constant) -> str:
+    """
+    Describes a constant from a code object in a way that is the same in every Python process: nested code objects (e.g. from
+    generator expressions or inner functions) are described by their contents instead of their memory addresses, and
+    frozensets are sorted instead of being given in hash order.
+    """
+    if inspect.iscode(constant): return describeCode(constant)
+    elif isinstance(constant, tuple): return '(' + ','.join(describeConstant(item) for item in constant) + ')'
+    elif isinstance(constant, frozenset): return '{' + ','.join(sorted(describeConstant(item) for item in constant)) + '}'
+    else: return repr(constant)
+
+
+def describeCode(code) -> str:
+    """
+    Returns a hash of the given code object's bytecode, names, and constants (including any nested code objects).
+    """
+    codeHash = hashlib.sha256(code.co_code)
+    codeHash.update(repr((code.co_names, code.co_varnames, code.co_freevars)).encode())
+    for constant in code.co_consts: codeHash.update(describeConstant(constant).encode())
+    return codeHash.hexdigest()
+
+
+def describeCallable(function) -> str:
+    """
+    Describes a function (e.g. a count derivative) by its name, code (see describeCode), and any values it closes over
+    (described recursively if they are functions themselves).
+    """
+    if function is None: return "None"
+    code = getattr(function, "__code__", None)
+    if code is None: return getattr(function, "__qualname__", type(function).__qualname__)
+    closureValues = [describeCallable(cell.cell_contents) if callable(cell.cell_contents) else describeConstant(cell.cell_contents)
+                     for cell in function.__closure__ or ()]
+    return f"{function.__qualname__}:{describeCode(code)}:{closureValues}"
+
+
+def getCounterFingerprint(counter) -> str:
+    """
+    Returns a hash of everything that determines the given (constructed but not yet counted) counter's output.
+    """
+    assert isinstance(counter.encompassedFeaturesFilePath, (str, os.PathLike)) and isinstance(
+        counter.encompassingFeaturesFilePath, (str, os.PathLike)), "Counts from streamed input can't be cached."
+    outputDataHandler = counter.outputDataHandler
+    writer = outputDataHandler.writer
+
+    description = {
+        "encompassedFeatures": getFileHash(counter.encompassedFeaturesFilePath),
+        "encompassingFeatures": getFileHash(counter.encompassingFeaturesFilePath),
+        "outputFormat": os.path.splitext(str(counter.outputFilePath))[1],
+        "counterClass": describeClass(type(counter)),
+        "counterAttributes": getSimpleAttributes(counter, IGNORED_COUNTER_ATTRIBUTES),
+        "regions": None if counter.regions is None else getSimpleAttributes(counter.regions),
+        "outputDataHandler": [describeClass(type(outputDataHandler)), getSimpleAttributes(outputDataHandler, {"outputDataStructure"})],
+        "stratifiers": [[describeClass(type(outputDataStratifier)), getSimpleAttributes(outputDataStratifier),
+                         [[describeClass(type(supplementalInfoHandler)), getSimpleAttributes(supplementalInfoHandler)]
+                          for supplementalInfoHandler in outputDataStratifier.supplementalInfoHandlers]]
+                        for outputDataStratifier in outputDataHandler.outputDataStratifiers],
+        "writer": None if writer is None else {
+            "writerClass": describeClass(type(writer)),
+            "headers": getattr(writer, "headers", None),
+            "attributes": getSimpleAttributes(writer, {"outputFilePath"}),
+            "customStratifyingNames": repr(getattr(writer, "customStratifyingNames", None)),
+            "getCountDerivatives": describeCallable(getattr(writer, "getCountDerivativesFunc", None)),
+            "countDerivatives": [[countDerivative.header, describeCallable(countDerivative.function)]
+                                 for countDerivative in getattr(writer, "countDerivatives", ())]
+        }
+    }
+    return hashlib.sha256(json.dumps(description, default = repr).encode()).hexdigest()
+
+
+class CounterResultCache:
+    """
+    Stores completed counter outputs in the given directory under their counters' fingerprints (see getCounterFingerprint).
+    Counting through the cache copies a cached output to the counter's output file path if one exists, and otherwise
+    counts as usual and adds the output to the cache.
+    NOTE: Only the counter's main output is cached, so counters producing other outputs (e.g. bootstrapped confidence intervals)
+    can't be counted through the cache.
+    """
+
+    def __init__(self, cacheDirectory):
+        self.cacheDirectory = str(cacheDirectory)
+        os.makedirs(self.cacheDirectory, exist_ok = True)
+
+
+    def getCachedOutputFilePath(self, fingerprint, outputFilePath) -> str:
+        return os.path.join(self.cacheDirectory, fingerprint[:2], fingerprint + os.path.splitext(str(outputFilePath))[1])
+
+
+    def copyOutput(self, sourceFilePath, destinationFilePath):
+        """
+        Copies an output file (or columnar table directory), replacing the destination all at once so that it is never partially written.
+        """
+        temporaryFilePath = f"{destinationFilePath}.{os.getpid()}.tmp"
+        if os.path.isdir(sourceFilePath):
+            shutil.copytree(sourceFilePath, temporaryFilePath)
+            if os.path.isdir(destinationFilePath): shutil.rmtree(destinationFilePath)
+        else: shutil.copyfile(sourceFilePath, temporaryFilePath)
+        os.replace(temporaryFilePath, destinationFilePath)
+
+
+    def count(self, counter) -> bool:
+        """
+        Produces the given counter's output, from the cache if possible.  Returns whether or not the output was cached.
+        """
+        assert counter.bootstrapIterations == 0, "Counters producing bootstrapped confidence intervals can't be counted through the cache."
+        fingerprint = getCounterFingerprint(counter)
+        cachedOutputFilePath = self.getCachedOutputFilePath(fingerprint, counter.outputFilePath)
+
+        if os.path.exists(cachedOutputFilePath):
+            # Close the output the counter has already opened before replacing it.
+            if counter.outputDataHandler.writer is not None: counter.outputDataHandler.writer.outputFile.close()
+            self.copyOutput(cachedOutputFilePath, counter.outputFilePath)
+            if not counter.suppressOutput: print(f"Using cached output for {counter.outputFilePath}")
+            return True
+
+        counter.count()
+        os.makedirs(os.path.dirname(cachedOutputFilePath), exist_ok = True)
+        self.copyOutput(counter.outputFilePath, cachedOutputFilePath)
+        return False
@@ -0,0 +1,152 @@
+# This script contains a file-like reader which derives a single position (e.g. the 5' end) and strand from each aligned read in a
+# sam or bam file and returns them as bed lines, so that reads can be counted by the ThisInThatCounter directly, without first
+# converting them to bed files and sorting them.
+import gzip, heapq, subprocess
+from collections import deque
+from benbiohelpers.CustomErrors import UnsortedInputError
+from benbiohelpers.FileSystemHandling.SamFileIterator import SamFileIterator
+
+FIVE_PRIME = SamFileIterator.SamRead.FIVE_PRIME
+THREE_PRIME = SamFileIterator.SamRead.THREE_PRIME
+MIDPOINT = 0
+
+UNMAPPED_FLAG = 0x4
+REVERSE_STRAND_FLAG = 0x10
+SECONDARY_FLAG = 0x100
+SUPPLEMENTARY_FLAG = 0x800
+
+# CIGAR operations which consume the reference sequence.
+REFERENCE_CONSUMING_OPERATIONS = "MDN=X"
+
+
+def getReferenceLength(cigarString: str) -> int:
+    """
+    Returns the number of reference bases spanned by an alignment with the given CIGAR string.
+    """
+    referenceLength = 0
+    operationLength = 0
+    for character in cigarString:
+        if character.isdigit(): operationLength = operationLength*10 + int(character)
+        else:
+            if character in REFERENCE_CONSUMING_OPERATIONS: referenceLength += operationLength
+            operationLength = 0
+    return referenceLength
+
+
+class SamReadPositionReader:
+    """
+    Reads through a coordinate-sorted sam file (optionally gzipped) or bam file (read through "samtools view") and returns a bed line
+    for each aligned read, giving the read's 5' end, 3' end (single nucleotide positions, accounting for strand), or the midpoint
+    of its aligned span (readPosition = FIVE_PRIME, THREE_PRIME, or MIDPOINT respectively).  The read name is given in the fourth
+    column and the mapping quality in the fifth.
+    Since readline is implemented, the reader can be given to the ThisInThatCounter in place of the encompassed features file path.
+
+    Unmapped reads are always skipped, as are secondary and supplementary alignments unless skipSecondaryAlignments is False,
+    and reads with mapping quality below minMappingQuality.  Each read of a pair is treated as its own feature.
+
+    Because the positions at the far end of reads (e.g. the 5' ends of reads on the minus strand) don't follow the sam file's
+    sorting, lines are held back in a small buffer until no later read can come before them, so the output is sorted
+    by chromosome and then start and end position, as the counter expects.  Reads must be sorted by start position
+    within each chromosome (an UnsortedInputError is raised otherwise), and, like bed inputs, chromosomes must be in the same
+    (alphabetical) order as in the encompassing features file, which may not be the order of the sam header's @SQ lines.
+    """
+
+    def __init__(self, samFilePath, readPosition = FIVE_PRIME, minMappingQuality = 0, skipSecondaryAlignments = True):
+        assert readPosition in (FIVE_PRIME, THREE_PRIME, MIDPOINT), f"Unrecognized read position: {readPosition}"
+        self.samFilePath = str(samFilePath)
+        self.name = self.samFilePath
+        self.readPosition = readPosition
+        self.minMappingQuality = minMappingQuality
+        self.skippedFlags = UNMAPPED_FLAG
+        if skipSecondaryAlignments: self.skippedFlags |= SECONDARY_FLAG | SUPPLEMENTARY_FLAG
+
+        self.samtoolsProcess = None
+        if self.samFilePath.endswith(".bam"):
+            self.samtoolsProcess = subprocess.Popen(("samtools", "view", self.samFilePath), stdout = subprocess.PIPE,
+                                                    universal_newlines = True)
+            self.samFile = self.samtoolsProcess.stdout
+        elif self.samFilePath.endswith(".gz"): self.samFile = gzip.open(self.samFilePath, 'rt')
+        else: self.samFile = open(self.samFilePath, 'r')
+
+        self.bufferedLines = list() # A heap of (start, end, read number, line) tuples for the current chromosome.
+        self.readyLines = deque()
+        self.readNumber = 0
+        self.currentChromosome = None
+        self.previousReadStart = None
+        self.readsSkipped = 0
+
+
+    def getBedLine(self, splitLine):
+        """
+        Returns the (start, end, bed line) for the read in the given split sam line.
+        """
+        flag = int(splitLine[1])
+        isReverseStrand = flag & REVERSE_STRAND_FLAG
+        alignmentStart = int(splitLine[3]) - 1
+        alignmentEnd = alignmentStart + getReferenceLength(splitLine[5])
+
+        if self.readPosition == MIDPOINT: start, end = alignmentStart, alignmentEnd
+        else:
+            if (self.readPosition == FIVE_PRIME) != bool(isReverseStrand): start = alignmentStart
+            else: start = alignmentEnd - 1
+            end = start + 1
+
+        return start, end, '\t'.join((splitLine[2], str(start), str(end), splitLine[0], splitLine[4],
+                                      '-' if isReverseStrand else '+')) + '\n'
+
+
+    def releaseBufferedLines(self, beforePosition = None):
+        """
+        Moves buffered lines starting before the given position (or all of them if it is None) to the lines ready to be returned.
+        """
+        while self.bufferedLines and (beforePosition is None or self.bufferedLines[0][0] < beforePosition):
+            self.readyLines.append(heapq.heappop(self.bufferedLines)[3])
+
+
+    def readline(self) -> str:
+        while not self.readyLines:
+            samLine = self.samFile.readline()
+            if not samLine:
+                self.releaseBufferedLines()
+                break
+            if samLine.startswith('@'): continue
+
+            splitLine = samLine.split('\t', 6)
+            if int(splitLine[1]) & self.skippedFlags or splitLine[5] == '*' or int(splitLine[4]) < self.minMappingQuality:
+                self.readsSkipped += 1
+                continue
+
+            chromosome, readStart = splitLine[2], int(splitLine[3]) - 1
+            if chromosome != self.currentChromosome:
+                self.releaseBufferedLines()
+                self.currentChromosome = chromosome
+            elif readStart < self.previousReadStart:
+                raise UnsortedInputError(self.samFilePath, "Expected reads sorted by start position within each chromosome "
+                                                           "(e.g. with \"samtools sort\").")
+            # No read has any positions before the start of its alignment, so buffered lines starting before the current
+            # read's start can't be preceded by any line still to come.
+            else: self.releaseBufferedLines(readStart)
+
+            self.previousReadStart = readStart
+            start, end, bedLine = self.getBedLine(splitLine)
+            heapq.heappush(self.bufferedLines, (start, end, self.readNumber, bedLine))
+            self.readNumber += 1
+
+        if self.readyLines: return self.readyLines.popleft()
+        return ''
+
+
+    def __iter__(self): return iter(self.readline, '')
+
+
+    def close(self):
+        self.samFile.close()
+        if self.samtoolsProcess is not None:
+            self.samtoolsProcess.wait()
+            if self.samtoolsProcess.returncode not in (0, -13): # -13: samtools stopped by closing the pipe early (SIGPIPE).
+                raise subprocess.CalledProcessError(self.samtoolsProcess.returncode, self.samtoolsProcess.args)
+
+
+    def __enter__(self): return self
+
+    def __exit__(self, type, value, traceback): self.close()
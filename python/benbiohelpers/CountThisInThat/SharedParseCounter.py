@@ -0,0 +1,180 @@
+# This script contains a counter which reads a pair of encompassed and encompassing feature files once while driving several
+# independently configured output data handlers (e.g. a dyad position profile and a per-nucleosome count table) at the same time.
+import copy
+from typing import List, Type
+from benbiohelpers.CountThisInThat.Counter import ThisInThatCounter
+from benbiohelpers.CountThisInThat.CounterOutputDataHandler import CounterOutputDataHandler
+from benbiohelpers.CountThisInThat.InputDataStructures import EncompassedData, EncompassingData, ENCOMPASSED_DATA, ENCOMPASSING_DATA
+
+
+class CounterConfiguration:
+    """
+    Describes one of the outputs of a SharedParseCounter: the counter class whose output data handler setup should be used
+    (setUpOutputDataHandler and the methods it calls), the output file path, and any other counter attributes those methods
+    rely on (e.g. writeIncrementally, which is 0 unless given).
+    NOTE: The counter class's constructor is never called, so attributes it would normally set must be given here instead.
+    """
+
+    def __init__(self, counterClass: Type[ThisInThatCounter], outputFilePath, **counterAttributes):
+        self.counterClass = counterClass
+        self.outputFilePath = outputFilePath
+        self.counterAttributes = counterAttributes
+
+
+class FanOutOutputDataHandler:
+    """
+    Passes every event from the counter on to each of several output data handlers, so that they can all be driven by one read
+    through the input files.  Each handler keeps its own output data structure, ambiguity handling, and writer.
+    """
+
+    def __init__(self, outputDataHandlers: List[CounterOutputDataHandler]):
+        self.outputDataHandlers = outputDataHandlers
+        self.trackAllEncompassed = any(outputDataHandler.trackAllEncompassed for outputDataHandler in outputDataHandlers)
+        self.trackAllEncompassing = any(outputDataHandler.trackAllEncompassing for outputDataHandler in outputDataHandlers)
+
+        # Stratifiers store their data on encompassed features by class, so if more than one handler relies on that data
+        # (non-tolerant ambiguity handling), each one needs to be given its own copy to avoid false ambiguity.
+        self.separateStratifierData = sum(outputDataHandler.nontolerantAmbiguityHandling for outputDataHandler in outputDataHandlers) > 1
+
+        # Exposed for metrics collection.  (The fan-out handler has no output data structure or writer of its own.)
+        self.outputDataStratifiers = [outputDataStratifier for outputDataHandler in outputDataHandlers
+                                      for outputDataStratifier in outputDataHandler.outputDataStratifiers]
+        self.outputDataStructure = None
+        self.writer = None
+
+
+    @property
+    def encompassedFeaturesToWrite(self):
+        """
+        Returns the largest set of encompassed features waiting to be written by any handler (or None if none write them incrementally).
+        """
+        return max((outputDataHandler.encompassedFeaturesToWrite for outputDataHandler in self.outputDataHandlers
+                    if outputDataHandler.encompassedFeaturesToWrite is not None), key = len, default = None)
+
+
+    @property
+    def encompassingFeaturesToWrite(self):
+        """
+        Returns the largest set of encompassing features waiting to be written by any handler (or None if none write them incrementally).
+        """
+        return max((outputDataHandler.encompassingFeaturesToWrite for outputDataHandler in self.outputDataHandlers
+                    if outputDataHandler.encompassingFeaturesToWrite is not None), key = len, default = None)
+
+
+    def useStratifierDataFor(self, encompassedFeature: EncompassedData, handlerIndex):
+        """
+        Gives the encompassed feature the stratifier data belonging to the handler at the given index.
+        """
+        stratifierDataByHandler = getattr(encompassedFeature, "stratifierDataByHandler", None)
+        if stratifierDataByHandler is None:
+            stratifierDataByHandler = encompassedFeature.stratifierDataByHandler = [dict() for _ in self.outputDataHandlers]
+        encompassedFeature.stratifierData = stratifierDataByHandler[handlerIndex]
+
+
+    def onEncompassedFeatureInEncompassingFeature(self, encompassedFeature: EncompassedData, encompassingFeature: EncompassingData,
+                                                  exitingEncompassment):
+        for i, outputDataHandler in enumerate(self.outputDataHandlers):
+            if self.separateStratifierData: self.useStratifierDataFor(encompassedFeature, i)
+            outputDataHandler.onEncompassedFeatureInEncompassingFeature(encompassedFeature, encompassingFeature, exitingEncompassment)
+
+
+    def onNonCountedEncompassedFeature(self, encompassedFeature: EncompassedData, encompassingFeature: EncompassingData = None):
+        for i, outputDataHandler in enumerate(self.outputDataHandlers):
+            if self.separateStratifierData: self.useStratifierDataFor(encompassedFeature, i)
+            outputDataHandler.onNonCountedEncompassedFeature(encompassedFeature, encompassingFeature)
+
+
+    def onNewEncompassingFeature(self, encompassingFeature: EncompassingData):
+        for outputDataHandler in self.outputDataHandlers: outputDataHandler.onNewEncompassingFeature(encompassingFeature)
+
+
+    def onExitEncompassingFeature(self, encompassingFeature: EncompassingData):
+        for outputDataHandler in self.outputDataHandlers: outputDataHandler.onExitEncompassingFeature(encompassingFeature)
+
+
+    def writeWaitingFeatures(self):
+        """
+        Writes any waiting features for each handler that is writing incrementally.
+        """
+        for outputDataHandler in self.outputDataHandlers: outputDataHandler.writeWaitingFeatures()
+
+
+    def getMemoryReport(self):
+        """
+        Returns the sum of the memory reports from every handler.  (See CounterOutputDataHandler.getMemoryReport)
+        """
+        report = dict()
+        for outputDataHandler in self.outputDataHandlers:
+            for category, size in outputDataHandler.getMemoryReport().items(): report[category] = report.get(category, 0) + size
+        return report
+
+
+    def finishWriting(self):
+        """
+        Writes each handler's results, or finishes writing them for handlers writing incrementally.
+        """
+        for outputDataHandler in self.outputDataHandlers:
+            if outputDataHandler.encompassedFeaturesToWrite is not None or outputDataHandler.encompassingFeaturesToWrite is not None:
+                outputDataHandler.writer.finishIndividualFeatureWriting()
+            else: outputDataHandler.writer.writeResults()
+
+
+class SharedParseCounter(ThisInThatCounter):
+    """
+    Counts encompassed features within encompassing features once for several counter configurations (see CounterConfiguration),
+    writing each configuration's output to its own file.  The input files are read and parsed only once, so running a battery of
+    differently stratified counts over the same pair of files costs little more than running the most expensive one.
+
+    Each configuration's output data handler is set up by running its counter class's setup methods on a copy of this counter,
+    so they can use the shared state (e.g. currentEncompassingFeature and encompassingFeatureExtraRadius) as usual.
+    Features are constructed using the first configuration's counter class, so its feature classes must provide the data
+    every configuration needs.  (e.g. EncompassedDataWithContext if any configuration stratifies by context)
+
+    Other keyword arguments are passed to ThisInThatCounter, except for outputFilePath and writeIncrementally (which are given
+    per configuration) and sortOutputOnExit, bootstrapIterations, and maxMemory, which aren't supported.
+    """
+
+    def __init__(self, encompassedFeaturesFilePath, encompassingFeaturesFilePath, counterConfigurations: List[CounterConfiguration],
+                 **counterArguments):
+        assert len(counterConfigurations) > 0, "At least one counter configuration must be given."
+        for unsupportedArgument in ("outputFilePath", "writeIncrementally", "sortOutputOnExit", "bootstrapIterations", "maxMemory"):
+            assert not counterArguments.get(unsupportedArgument), f"{unsupportedArgument} is not supported by the SharedParseCounter."
+        self.counterConfigurations = counterConfigurations
+        self.featureCounterClass = counterConfigurations[0].counterClass
+
+        super().__init__(encompassedFeaturesFilePath, encompassingFeaturesFilePath, None, **counterArguments)
+
+
+    def constructEncompassedFeature(self, line) -> EncompassedData:
+        return self.featureCounterClass.constructEncompassedFeature(self, line)
+
+
+    def constructEncompassingFeature(self, line) -> EncompassingData:
+        return self.featureCounterClass.constructEncompassingFeature(self, line)
+
+
+    def setUpOutputDataHandler(self):
+        """
+        Sets up each configuration's output data handler and fans out to them.
+        The counter-level writeIncrementally value is set so that waiting features are checked (and written) whenever
+        any configuration is writing incrementally.
+        """
+        outputDataHandlers = list()
+        for counterConfiguration in self.counterConfigurations:
+            configuredCounter = copy.copy(self)
+            configuredCounter.__class__ = counterConfiguration.counterClass
+            configuredCounter.outputFilePath = counterConfiguration.outputFilePath
+            configuredCounter.writeIncrementally = 0
+            configuredCounter.__dict__.update(counterConfiguration.counterAttributes)
+            configuredCounter.setUpOutputDataHandler()
+            outputDataHandlers.append(configuredCounter.outputDataHandler)
+
+        self.outputDataHandler = FanOutOutputDataHandler(outputDataHandlers)
+
+        if self.outputDataHandler.encompassedFeaturesToWrite is not None: self.writeIncrementally = ENCOMPASSED_DATA
+        elif self.outputDataHandler.encompassingFeaturesToWrite is not None: self.writeIncrementally = ENCOMPASSING_DATA
+        else: self.writeIncrementally = 0
+
+
+    def finishWriting(self):
+        self.outputDataHandler.finishWriting()
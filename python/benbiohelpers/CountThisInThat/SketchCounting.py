@@ -0,0 +1,311 @@
+# This script contains an output data handler which counts with fixed-size sketches instead of the nested output data structure,
+# for stratifications with too many keys (e.g. encompassed feature x context x strand) to hold every count in memory.
+# Counts for any combination of keys can be estimated from a count-min sketch, and the heaviest combinations are tracked
+# (along with bounds on their error) so that they can be written.  A second pass over the same input can then count just those
+# heaviest combinations exactly.
+import hashlib, heapq, math, random
+import numpy as np
+from typing import Callable, Dict, List, Optional, Tuple
+from benbiohelpers.CountThisInThat.Counter import ThisInThatCounter
+from benbiohelpers.CountThisInThat.CounterOutputDataHandler import CounterOutputDataHandler
+from benbiohelpers.CountThisInThat.InputDataStructures import EncompassedData, EncompassingData
+from benbiohelpers.CountThisInThat.OutputDataStratifiers import AmbiguityHandling, EncompassedFeatureODS, EncompassingFeatureODS
+
+# A prime used to derive each row's hash function from the key's hash.
+HASH_PRIME = 2**61 - 1
+
+
+def encodeKey(key) -> bytes:
+    """
+    Encodes the given key (e.g. a tuple of stratifier keys) the same way in every Python process, so that it can be hashed
+    reproducibly.  (The built-in hash is randomized for strings.)  Equal numbers (e.g. 16 and 16.0) are encoded the same way,
+    as are equal features (by their locations).
+    """
+    if isinstance(key, tuple): return b'(' + b','.join(encodeKey(item) for item in key) + b')'
+    elif key is None: return b'N'
+    elif isinstance(key, (EncompassedData, EncompassingData)): encodedKey, prefix = key.getLocationString().encode(), b'F'
+    elif isinstance(key, str): encodedKey, prefix = key.encode(), b'S'
+    elif isinstance(key, (int, float)):
+        if isinstance(key, float) and key.is_integer(): key = int(key)
+        encodedKey, prefix = repr(int(key) if isinstance(key, bool) else key).encode(), b'#'
+    else: encodedKey, prefix = repr(key).encode(), b'R'
+    # Lengths are included so that keys containing separators can't be confused with tuples of keys.
+    return prefix + str(len(encodedKey)).encode() + b':' + encodedKey
+
+
+def getKeyHash(key) -> int:
+    """
+    Returns a 64-bit hash of the given key that is the same in every Python process.  (See encodeKey)
+    """
+    return int.from_bytes(hashlib.blake2b(encodeKey(key), digest_size = 8).digest(), "little")
+
+
+class CountMinSketch:
+    """
+    Approximates counts for an unbounded number of keys in a fixed amount of memory.
+    With probability at least 1 - failureProbability, each estimated count exceeds the true count by at most
+    relativeError times the total of all counts.  Estimates never fall below the true count (as long as all counts are positive).
+    Keys are hashed reproducibly (see getKeyHash), so the same seed gives the same estimates in every run.
+    """
+
+    def __init__(self, relativeError = 0.0001, failureProbability = 0.01, seed = 0):
+        self.relativeError = relativeError
+        self.failureProbability = failureProbability
+        self.width = math.ceil(math.e / relativeError)
+        self.depth = math.ceil(math.log(1 / failureProbability))
+
+        randomNumberGenerator = random.Random(seed)
+        self.hashParameters = [(randomNumberGenerator.randrange(1, HASH_PRIME), randomNumberGenerator.randrange(HASH_PRIME))
+                               for _ in range(self.depth)]
+        self.rowIndices = np.arange(self.depth)
+        self.counts = np.zeros((self.depth, self.width))
+        self.totalCount = 0
+
+
+    def getColumns(self, key) -> List[int]:
+        """
+        Returns the column the given (hashable) key maps to in each row.
+        """
+        keyHash = getKeyHash(key)
+        return [(a * keyHash + b) % HASH_PRIME % self.width for a, b in self.hashParameters]
+
+
+    def add(self, key, countValue = 1):
+        """
+        Adds the given count value to the key and returns the key's new estimated count.
+        """
+        assert countValue >= 0, "Count-min sketches can't estimate counts when negative values are added."
+        columns = self.getColumns(key)
+        self.counts[self.rowIndices, columns] += countValue
+        self.totalCount += countValue
+        return self.counts[self.rowIndices, columns].min()
+
+
+    def estimate(self, key):
+        """
+        Returns the estimated count for the given key.
+        """
+        return self.counts[self.rowIndices, self.getColumns(key)].min()
+
+
+    def getErrorBound(self):
+        """
+        Returns the most that any estimate is expected to exceed the true count by (with probability 1 - failureProbability).
+        """
+        return self.relativeError * self.totalCount
+
+
+class HeavyHitters:
+    """
+    Tracks the (approximately) topK most frequent keys with the "space-saving" algorithm: Once topK keys are being tracked,
+    a new key replaces the key with the smallest count and inherits that count as its potential overcount.
+    For every tracked key, the true count is between its count minus its overcount and its count, so counts with no overcount
+    are exact.  Any key whose true count is more than 1/topK of the total is guaranteed to be tracked.
+    """
+
+    def __init__(self, topK = 1000):
+        self.topK = topK
+        self.counts: Dict = dict()
+        self.overcounts: Dict = dict()
+
+        # A min-heap of (count, entry number, key) for finding the smallest count.  Entries are left in place when
+        # their key's count changes, and are skipped (or the heap is rebuilt) later.
+        self.heap: List[Tuple] = list()
+        self.entryNumber = 0
+
+
+    def pushEntry(self, key):
+        self.entryNumber += 1
+        heapq.heappush(self.heap, (self.counts[key], self.entryNumber, key))
+
+
+    def popSmallest(self):
+        """
+        Removes the key with the smallest count and returns its count.
+        """
+        while True:
+            count, _, key = heapq.heappop(self.heap)
+            if self.counts.get(key) == count: break
+        self.counts.pop(key)
+        self.overcounts.pop(key)
+        return count
+
+
+    def add(self, key, countValue = 1):
+        if key in self.counts: self.counts[key] += countValue
+        elif len(self.counts) < self.topK:
+            self.counts[key] = countValue
+            self.overcounts[key] = 0
+        else:
+            smallestCount = self.popSmallest()
+            self.counts[key] = smallestCount + countValue
+            self.overcounts[key] = smallestCount
+        self.pushEntry(key)
+
+        # Rebuild the heap from the current counts when outdated entries start to take up too much memory.
+        if len(self.heap) > 4 * self.topK:
+            self.heap = [(count, i, key) for i, (key, count) in enumerate(self.counts.items())]
+            heapq.heapify(self.heap)
+            self.entryNumber = len(self.heap)
+
+
+    def getSortedKeys(self) -> List:
+        """
+        Returns the tracked keys from highest to lowest count.
+        """
+        return sorted(self.counts, key = lambda key: -self.counts[key])
+
+
+class SketchCounterOutputDataHandler(CounterOutputDataHandler):
+    """
+    Counts each combination of stratifier keys in a count-min sketch and tracks the heaviest combinations, instead of
+    building the nested output data structure.  Memory is bounded by the sketch's size (set by relativeError and
+    failureProbability) and topK, no matter how many combinations of keys are encountered.
+    The output has one row for each of the topK heaviest combinations (highest count first), with the approximate count
+    and the most it may exceed the true count by (so 0 means the count is exact).  Any combination can also be estimated
+    after counting with getApproximateCount, within getErrorBound of its true count.
+    For exact counts of the heaviest combinations, a second handler can re-count them over the same input after setUpExactPass.
+    (See countTopKExactly)
+
+    Stratifiers are added as usual, but must all tolerate ambiguity, and supplemental information, tracking of non-counted
+    features, and incremental writing are not supported.
+    """
+
+    def __init__(self, relativeError = 0.0001, failureProbability = 0.01, topK = 1000, seed = 0):
+        super().__init__(None)
+        self.sketch = CountMinSketch(relativeError, failureProbability, seed)
+        self.heavyHitters = HeavyHitters(topK)
+        self.featureStratifierLevels: List[int] = list()
+        self.exactCounts: Optional[Dict[Tuple, int]] = None
+
+
+    def setUpExactPass(self, firstPassOutputDataHandler: "SketchCounterOutputDataHandler"):
+        """
+        Sets up this handler to re-count the input counted by the given handler, counting only the heaviest combinations of keys
+        it tracked, but exactly.  Its sketch and heavy hitters are kept so the output can compare the exact and approximate counts.
+        """
+        self.sketch = firstPassOutputDataHandler.sketch
+        self.heavyHitters = firstPassOutputDataHandler.heavyHitters
+        self.exactCounts = {keys: 0 for keys in self.heavyHitters.counts}
+
+
+    def getNewStratificationLevelDictionaries(self):
+        """
+        No output dictionaries are used, so stratifiers are given none.
+        """
+        return list()
+
+
+    def createOutputDataWriter(self, outputFilePath: str, customStratifyingNames = None):
+        """
+        Checks that the stratifiers can be used with sketches and creates the writer for the heaviest combinations of keys.
+        """
+        assert len(self.outputDataStratifiers) > 0, "Sketch counting requires at least one stratifier."
+        for i, outputDataStratifier in enumerate(self.outputDataStratifiers):
+            assert outputDataStratifier.ambiguityHandling is AmbiguityHandling.tolerate, (
+                "Sketch counting requires every stratifier to tolerate ambiguity.")
+            assert len(outputDataStratifier.supplementalInfoHandlers) == 0, "Sketch counting does not support supplemental information."
+            if isinstance(outputDataStratifier, (EncompassedFeatureODS, EncompassingFeatureODS)):
+                self.featureStratifierLevels.append(i)
+        self.writer = SketchOutputDataWriter(self, outputFilePath, customStratifyingNames)
+
+
+    def onEncompassedFeatureInEncompassingFeature(self, encompassedFeature: EncompassedData, encompassingFeature: EncompassingData,
+                                                  exitingEncompassment):
+        """
+        Computes the keys directly from the given pair of features and counts them in the sketch and heavy hitters
+        (or, in an exact pass, counts them exactly if they are among the heaviest combinations).
+        """
+        if exitingEncompassment: return
+
+        keys = tuple(outputDataStratifier.getKeyDirectly(encompassedFeature, encompassingFeature)
+                     for outputDataStratifier in self.outputDataStratifiers)
+        if self.exactCounts is not None:
+            if keys in self.exactCounts: self.exactCounts[keys] += encompassedFeature.countWeight
+        else:
+            self.sketch.add(keys, encompassedFeature.countWeight)
+            self.heavyHitters.add(keys, encompassedFeature.countWeight)
+
+        # Features don't need to be remembered as keys, since the counts are keyed by the sketch instead.
+        for i in self.featureStratifierLevels: self.outputDataStratifiers[i].allKeys.discard(keys[i])
+
+
+    def getApproximateCount(self, keys: Tuple):
+        """
+        Returns the estimated count for the given keys (one from each stratifier, in order).
+        """
+        return self.sketch.estimate(tuple(keys))
+
+
+    def getErrorBound(self):
+        """
+        Returns the most that any estimate from getApproximateCount is expected to exceed the true count by.
+        """
+        return self.sketch.getErrorBound()
+
+
+    def getMemoryReport(self) -> Dict[str, int]:
+        return {"sketch": self.sketch.counts.nbytes, "total": self.sketch.counts.nbytes}
+
+
+def countTopKExactly(createCounter: Callable[[], ThisInThatCounter]) -> ThisInThatCounter:
+    """
+    Counts with a counter from createCounter (which must use a SketchCounterOutputDataHandler), then counts the same input again
+    with a second counter from createCounter, this time counting only the heaviest combinations of keys from the first pass, exactly.
+    The second counter's output replaces the first's, with an exact count for each row, and the second counter is returned.
+    """
+    firstPassCounter = createCounter()
+    assert isinstance(firstPassCounter.outputDataHandler, SketchCounterOutputDataHandler), (
+        "Exact top-K counts require a counter using a SketchCounterOutputDataHandler.")
+    firstPassCounter.count()
+
+    exactPassCounter = createCounter()
+    exactPassCounter.outputDataHandler.setUpExactPass(firstPassCounter.outputDataHandler)
+    exactPassCounter.count()
+    return exactPassCounter
+
+
+class SketchOutputDataWriter:
+    """
+    Writes the heaviest combinations of keys tracked by a SketchCounterOutputDataHandler, one per row.
+    After an exact pass, each row also has the combination's exact count, and rows are sorted by it instead.
+    Custom names can be given for each stratifier's keys (or formatted keys), as with the OutputDataWriter.
+    """
+
+    def __init__(self, outputDataHandler: SketchCounterOutputDataHandler, outputFilePath: str, customStratifyingNames = None):
+        self.outputDataHandler = outputDataHandler
+        self.outputFilePath = outputFilePath
+        self.customStratifyingNames = customStratifyingNames
+
+
+    def getOutputName(self, stratificationLevel, key):
+        outputDataStratifier = self.outputDataHandler.outputDataStratifiers[stratificationLevel]
+        if self.customStratifyingNames is None or self.customStratifyingNames[stratificationLevel] is None:
+            return outputDataStratifier.formatKeyForOutput(key)
+        elif key in self.customStratifyingNames[stratificationLevel]: return self.customStratifyingNames[stratificationLevel][key]
+        else:
+            formattedKey = outputDataStratifier.formatKeyForOutput(key)
+            return self.customStratifyingNames[stratificationLevel].get(formattedKey, formattedKey)
+
+
+    def writeResults(self):
+        heavyHitters = self.outputDataHandler.heavyHitters
+        exactCounts = self.outputDataHandler.exactCounts
+        with open(self.outputFilePath, 'w') as outputFile:
+            headers = [str(outputDataStratifier.outputName) for outputDataStratifier in self.outputDataHandler.outputDataStratifiers]
+            headers += ["Approximate_Count", "Max_Overcount"]
+            if exactCounts is not None: headers.append("Exact_Count")
+            outputFile.write('\t'.join(headers) + '\n')
+
+            # Use each stratifier's own copy of equal keys (e.g. 16 instead of 16.0 for relative positions), as the output
+            # dictionaries would.
+            canonicalKeys = [{key: key for key in outputDataStratifier.allKeys}
+                             for outputDataStratifier in self.outputDataHandler.outputDataStratifiers]
+
+            sortedKeys = heavyHitters.getSortedKeys()
+            if exactCounts is not None: sortedKeys.sort(key = lambda keys: -exactCounts[keys])
+            for keys in sortedKeys:
+                row = [str(self.getOutputName(i, canonicalKeys[i].get(key, key))) for i, key in enumerate(keys)]
+                row += [str(heavyHitters.counts[keys]), str(heavyHitters.overcounts[keys])]
+                if exactCounts is not None: row.append(str(exactCounts[keys]))
+                outputFile.write('\t'.join(row) + '\n')
@@ -1,7 +1,10 @@
 # This script houses the SupplementalInformation class and subclasses.
 # These classes are used to add additional information to the output data stratifiers.
+# To keep memory usage down, handlers should store compact (and, where strings repeat, interned) information during counting
+# and only build formatted strings in getFormattedOutput, when the information is written.
+import sys
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Set, Union
+from typing import Any, Dict, List, Set, Tuple, Union
 from benbiohelpers.CountThisInThat.InputDataStructures import *
 from benbiohelpers.DNA_SequenceHandling import reverseCompliment
 
@@ -48,12 +51,16 @@ class TfbsSupInfoHandler(SupplementalInformationHandler):
 
     def __init__(self, outputName = "Transcription_Factor_Binding_Sites", updateUntilExit = True, updateOnCount = False):
         super().__init__(outputName, updateUntilExit, updateOnCount)
+        self.tfbsLabels: Dict[Tuple[str, str], str] = dict() # One shared label string for each name and strand combination.
 
     def initializeSupplementalInfo(self):
         return set()    
 
     def updateSupplementalInfo(self, currentInfo: Set[str], encompassedData: EncompassedData, encompassingData: TfbsData):
-        currentInfo.add(encompassingData.tfbsName+encompassingData.strand)
+        tfbsLabel = self.tfbsLabels.get((encompassingData.tfbsName, encompassingData.strand))
+        if tfbsLabel is None:
+            tfbsLabel = self.tfbsLabels[(encompassingData.tfbsName, encompassingData.strand)] = encompassingData.tfbsName+encompassingData.strand
+        currentInfo.add(tfbsLabel)
         return currentInfo
 
     def getFormattedOutput(self, info):
@@ -65,13 +72,14 @@ class BaseInEncompassingSequenceSupInfoHandler(SupplementalInformationHandler):
     Keeps track of the position(s) (multiple if half base position) of the encompassed feature within encompassing features.
     If there are multiple encompassing features, the longest is the one displayed.
     Information appears as the sequence associated with the longest encompassing feature with the encompassed position(s) capitalized
+    During counting, only the length of that feature, a reference to its sequence, and the relative position(s) are stored.
     """
 
     def __init__(self, outputName = "Encompassed_Base_In_Encompassing_Sequence", updateUntilExit = True, updateOnCount = False):
         super().__init__(outputName, updateUntilExit, updateOnCount)
     
     def initializeSupplementalInfo(self):
-        return [0,'']
+        return (0, '', ())
 
     def updateSupplementalInfo(self, currentInfo, encompassedData: EncompassedData, encompassingData: TfbsData):
 
@@ -87,20 +95,21 @@ class BaseInEncompassingSequenceSupInfoHandler(SupplementalInformationHandler):
             if int(encompassedData.position) == encompassedData.position: relativePos = (int(posDiff),)
             else: relativePos = (int(posDiff-0.5),int(posDiff+0.5))
 
-            # Now, construct the sequence with the capital letter(s) representing the encompassed feature
-            sequenceWithCaps = encompassingData.sequence.lower()
-            sequenceWithCaps = (
-                sequenceWithCaps[:min(relativePos)] + # Portion before capitals
-                ''.join([sequenceWithCaps[pos].upper() for pos in relativePos]) + # Capitals
-                sequenceWithCaps[max(relativePos) + 1:] # Portion after capitals
-            )
-
-            return [encompassingData.endPos - encompassingData.startPos, sequenceWithCaps]
+            return (encompassingData.endPos - encompassingData.startPos, encompassingData.sequence, relativePos)
 
         else: return currentInfo
     
     def getFormattedOutput(self, info) -> str:
-        return info[1]
+        length, sequence, relativePos = info
+        if not relativePos: return sequence
+
+        # Construct the sequence with the capital letter(s) representing the encompassed feature
+        sequenceWithCaps = sequence.lower()
+        return (
+            sequenceWithCaps[:min(relativePos)] + # Portion before capitals
+            ''.join([sequenceWithCaps[pos].upper() for pos in relativePos]) + # Capitals
+            sequenceWithCaps[max(relativePos) + 1:] # Portion after capitals
+        )
             
 
 class MutationTypeSupInfoHandler(SupplementalInformationHandler):
@@ -116,7 +125,8 @@ class MutationTypeSupInfoHandler(SupplementalInformationHandler):
         return dict()
 
     def updateSupplementalInfo(self, currentInfo: Dict, encompassedData: EncompassedDataWithContext, encompassingData: EncompassingData):
-        currentInfo[encompassedData.getMutation()] = currentInfo.setdefault(encompassedData.getMutation(),0) + 1
+        mutation = sys.intern(encompassedData.getMutation())
+        currentInfo[mutation] = currentInfo.get(mutation, 0) + 1
         return currentInfo
 
     def getFormattedOutput(self, info) -> str:
@@ -147,7 +157,7 @@ class SimpleColumnSupInfoHandler(SupplementalInformationHandler):
         if self.relevantData == ENCOMPASSED_DATA: relevantData = encompassedData
         elif self.relevantData == ENCOMPASSING_DATA: relevantData = encompassingData
         else: raise ValueError("Invalid relevant data value. Should be ENCOMPASSED_DATA or ENCOMPASSING_DATA.")
-        colData = relevantData.choppedUpLine[self.dataCol]
+        colData = sys.intern(relevantData.choppedUpLine[self.dataCol])
         if self.removeDups: currentInfo[colData] = None
         else: currentInfo.append(colData)
         return currentInfo
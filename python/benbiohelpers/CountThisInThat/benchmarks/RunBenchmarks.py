@@ -0,0 +1,179 @@
+# This script runs the CountThisInThat classes on seeded synthetic data, recording the throughput and peak memory usage of each
+# configuration.  The counters here mirror the patterns used by the templates and the TestingCountThisInThat scripts,
+# but don't depend on a GUI or on any private data directories, so performance changes can be measured before they are deployed.
+import os, tempfile, time, tracemalloc
+from typing import Dict, List
+
+from benbiohelpers.CountThisInThat.Counter import ThisInThatCounter
+from benbiohelpers.CountThisInThat.InputDataStructures import (EncompassingDataDefaultStrand, EncompassedDataWithContext, TfbsData,
+                                                               ENCOMPASSED_DATA)
+from benbiohelpers.CountThisInThat.CounterOutputDataHandler import AmbiguityHandling, CounterOutputDataHandler
+from benbiohelpers.CountThisInThat.CountDerivatives import sumOfColumns, mirroredSum
+from benbiohelpers.CountThisInThat.SupplementalInformation import (TfbsSupInfoHandler, BaseInEncompassingSequenceSupInfoHandler,
+                                                                   MutationTypeSupInfoHandler)
+from benbiohelpers.CountThisInThat.benchmarks import SyntheticData
+
+
+class MutationsInNucleosomesCounter(ThisInThatCounter):
+    """
+    Mirrors TestingCountThisInThat1 and the nucleosome encompassment template.
+    """
+
+    def setupOutputDataStratifiers(self):
+        self.outputDataHandler.addRelativePositionStratifier(self.currentEncompassingFeature, extraRangeRadius = self.encompassingFeatureExtraRadius,
+                                                             outputName = "Dyad_Position")
+        self.outputDataHandler.addStrandComparisonStratifier(strandAmbiguityHandling = AmbiguityHandling.tolerate)
+
+    def setupOutputDataWriter(self):
+        self.outputDataHandler.createOutputDataWriter(self.outputFilePath, customStratifyingNames=(None, {True:"Plus_Strand_Counts", False:"Minus_Strand_Counts"}),
+                                                      countDerivatives = [sumOfColumns("Both_Strands_Counts", True, False),
+                                                                          mirroredSum("Aligned_Strands_Counts", True, False)])
+
+    def constructEncompassingFeature(self, line) -> EncompassingDataDefaultStrand:
+        return EncompassingDataDefaultStrand(line, self.acceptableChromosomes)
+
+
+class MutationsInGenesCounter(ThisInThatCounter):
+    """
+    Mirrors TestingCountThisInThat2.
+    """
+
+    def initOutputDataHandler(self):
+        self.outputDataHandler = CounterOutputDataHandler(self.writeIncrementally, trackAllEncompassed = True, countAllEncompassed = True)
+
+    def setupOutputDataStratifiers(self):
+        self.outputDataHandler.addEncompassedFeatureContextStratifier(3, True, "Trinucleotide")
+        self.outputDataHandler.addStrandComparisonStratifier(strandAmbiguityHandling = AmbiguityHandling.record)
+
+    def setupOutputDataWriter(self):
+        self.outputDataHandler.createOutputDataWriter(self.outputFilePath,
+            customStratifyingNames = (None, {True:"NTS_Counts", False:"TS_Counts", None:"Intergenic_and_Ambiguous_Counts"}))
+
+    def constructEncompassedFeature(self, line) -> EncompassedDataWithContext:
+        return EncompassedDataWithContext(line, self.acceptableChromosomes)
+
+
+class MutationsInTfbsCounter(ThisInThatCounter):
+    """
+    Mirrors TestingCountThisInThat3.
+    """
+
+    def setupOutputDataStratifiers(self):
+        self.outputDataHandler.addEncompassedFeatureStratifier("Mutation Position")
+        self.outputDataHandler.addPlaceholderStratifier(AmbiguityHandling.record)
+        self.outputDataHandler.addSupplementalInformationHandler(TfbsSupInfoHandler, 0)
+        self.outputDataHandler.addSupplementalInformationHandler(BaseInEncompassingSequenceSupInfoHandler, 0)
+        self.outputDataHandler.addSupplementalInformationHandler(MutationTypeSupInfoHandler, 0)
+
+    def setupOutputDataWriter(self):
+        self.outputDataHandler.createOutputDataWriter(self.outputFilePath, customStratifyingNames = (None,{None:"Counts"}),
+                                                      oDSSubs=(None, None, None, 4, None))
+
+    def constructEncompassingFeature(self, line) -> TfbsData:
+        return TfbsData(line, self.acceptableChromosomes)
+
+    def constructEncompassedFeature(self, line) -> EncompassedDataWithContext:
+        return EncompassedDataWithContext(line, self.acceptableChromosomes)
+
+
+class MutationPositionsInNucleosomesCounter(ThisInThatCounter):
+    """
+    Mirrors TestingCountThisInThat4.
+    """
+
+    def setupOutputDataStratifiers(self):
+        self.outputDataHandler.addEncompassedFeatureStratifier("Mutation_Pos")
+        self.outputDataHandler.addPlaceholderStratifier()
+
+    def setupOutputDataWriter(self):
+        self.outputDataHandler.createOutputDataWriter(self.outputFilePath, customStratifyingNames = (None,{None:"Counts"}))
+
+    def constructEncompassingFeature(self, line) -> EncompassingDataDefaultStrand:
+        return EncompassingDataDefaultStrand(line, self.acceptableChromosomes)
+
+
+# Each configuration gives the counter to run, the synthetic encompassing data to run it on, the output file extension,
+# and any additional counter arguments.
+BENCHMARK_CONFIGURATIONS = {
+    "Nucleosome_Dyad_Positions": (MutationsInNucleosomesCounter, "nucleosomes", ".tsv", {"encompassingFeatureExtraRadius": 73}),
+    "Gene_Strand_Context": (MutationsInGenesCounter, "genes", ".tsv", dict()),
+    "TFBS_Incremental": (MutationsInTfbsCounter, "tfbs", ".bed", {"writeIncrementally": ENCOMPASSED_DATA}),
+    "Nucleosome_Incremental": (MutationPositionsInNucleosomesCounter, "nucleosomes", ".tsv",
+                               {"encompassingFeatureExtraRadius": 73, "writeIncrementally": ENCOMPASSED_DATA}),
+}
+
+
+def generateBenchmarkData(dataDirectory, chromosomeCount = 4, chromosomeLength = 1000000, mutationsPerKb = 1,
+                          nucleosomeRepeatLength = 200, genesPerMb = 100, tfbsPerKb = 2, seed = 0):
+    """
+    Writes all the synthetic input files to the given directory.
+    Returns a dictionary of file paths and a dictionary of line counts, both keyed by data type.
+    """
+    chromosomeSizes = SyntheticData.getChromosomeSizes(chromosomeCount, chromosomeLength)
+    filePaths = {dataType: os.path.join(dataDirectory, dataType + ".bed") for dataType in ("mutations", "nucleosomes", "genes", "tfbs")}
+    lineCounts = {
+        "mutations": SyntheticData.writeMutations(filePaths["mutations"], chromosomeSizes, mutationsPerKb, seed),
+        "nucleosomes": SyntheticData.writeNucleosomes(filePaths["nucleosomes"], chromosomeSizes, nucleosomeRepeatLength, seed = seed),
+        "genes": SyntheticData.writeGenes(filePaths["genes"], chromosomeSizes, genesPerMb, seed = seed),
+        "tfbs": SyntheticData.writeTfbs(filePaths["tfbs"], chromosomeSizes, tfbsPerKb, seed = seed)
+    }
+    return filePaths, lineCounts
+
+
+def runBenchmark(configurationName, filePaths: Dict[str, str], lineCounts: Dict[str, int], outputDirectory, measureMemory = True):
+    """
+    Runs a single benchmark configuration and returns its results as a dictionary.
+    Timing and memory are measured on separate runs, since tracing memory allocations slows python down considerably.
+    """
+    counterClass, encompassingDataType, outputExtension, counterKwargs = BENCHMARK_CONFIGURATIONS[configurationName]
+    outputFilePath = os.path.join(outputDirectory, configurationName + outputExtension)
+    def getCounter():
+        return counterClass(filePaths["mutations"], filePaths[encompassingDataType], outputFilePath, suppressOutput = True, **counterKwargs)
+
+    startTime = time.perf_counter()
+    getCounter().count()
+    elapsedTime = time.perf_counter() - startTime
+    linesRead = lineCounts["mutations"] + lineCounts[encompassingDataType]
+
+    results = {"Configuration": configurationName, "Lines_Read": linesRead, "Seconds": elapsedTime,
+               "Lines_Per_Second": linesRead/elapsedTime, "Peak_Memory_MB": None}
+
+    if measureMemory:
+        tracemalloc.start()
+        getCounter().count()
+        results["Peak_Memory_MB"] = tracemalloc.get_traced_memory()[1]/1024**2
+        tracemalloc.stop()
+
+    return results
+
+
+def runBenchmarks(workingDirectory = None, configurationNames: List[str] = None, measureMemory = True,
+                  resultsFilePath = None, **dataParameters) -> List[Dict]:
+    """
+    Generates synthetic data and runs each requested benchmark configuration on it (all of them by default).
+    Any additional keyword arguments are passed to generateBenchmarkData to control genome size and feature densities.
+    If a resultsFilePath is given, the results are also written there as a tsv file.
+    """
+    if configurationNames is None: configurationNames = list(BENCHMARK_CONFIGURATIONS)
+
+    with tempfile.TemporaryDirectory(dir = workingDirectory) as benchmarkDirectory:
+        filePaths, lineCounts = generateBenchmarkData(benchmarkDirectory, **dataParameters)
+        allResults = [runBenchmark(configurationName, filePaths, lineCounts, benchmarkDirectory, measureMemory)
+                      for configurationName in configurationNames]
+
+    if resultsFilePath is not None:
+        with open(resultsFilePath, 'w') as resultsFile:
+            resultsFile.write('\t'.join(allResults[0]) + '\n')
+            for results in allResults: resultsFile.write('\t'.join(str(value) for value in results.values()) + '\n')
+
+    return allResults
+
+
+def main():
+    for results in runBenchmarks():
+        memoryText = "" if results["Peak_Memory_MB"] is None else f", {results['Peak_Memory_MB']:.1f} MB peak"
+        print(f"{results['Configuration']}: {results['Seconds']:.2f} s "
+              f"({results['Lines_Per_Second']:.0f} lines/s{memoryText})")
+
+
+if __name__ == "__main__": main()
@@ -0,0 +1,100 @@
+# This script contains seeded generators for synthetic (but realistically shaped) input data for the CountThisInThat classes.
+# All files are written sorted by chromosome (alphabetically) and then by start and end position, just like the counter expects.
+import random
+from typing import Dict
+
+BASES = "ACGT"
+
+
+def getChromosomeSizes(chromosomeCount = 4, chromosomeLength = 1000000) -> Dict[str, int]:
+    """
+    Returns a dictionary of chromosome names (sorted alphabetically) and their lengths.
+    """
+    return {chromosome: chromosomeLength for chromosome in sorted(f"chr{i+1}" for i in range(chromosomeCount))}
+
+
+def getRandomSequence(randomNumberGenerator: random.Random, length):
+    return ''.join(randomNumberGenerator.choices(BASES, k = length))
+
+
+def writeMutations(filePath, chromosomeSizes: Dict[str, int], mutationsPerKb = 1, seed = 0):
+    """
+    Writes single base mutations in the six column bed format with trinucleotide context and the base mutated to.
+    (e.g. "chr1  99  100  ACG  T  +")
+    Returns the number of mutations written.
+    """
+    randomNumberGenerator = random.Random(seed)
+    mutationCount = 0
+    with open(filePath, 'w') as mutationsFile:
+        for chromosome, chromosomeSize in chromosomeSizes.items():
+            positions = sorted(randomNumberGenerator.sample(range(1, chromosomeSize - 1), int(chromosomeSize * mutationsPerKb / 1000)))
+            for position in positions:
+                context = getRandomSequence(randomNumberGenerator, 3)
+                alteredTo = randomNumberGenerator.choice([base for base in BASES if base != context[1]])
+                strand = randomNumberGenerator.choice("+-")
+                mutationsFile.write(f"{chromosome}\t{position}\t{position+1}\t{context}\t{alteredTo}\t{strand}\n")
+            mutationCount += len(positions)
+    return mutationCount
+
+
+def writeNucleosomes(filePath, chromosomeSizes: Dict[str, int], repeatLength = 200, positionJitter = 20, seed = 0):
+    """
+    Writes single base nucleosome dyad positions, roughly repeatLength bases apart.
+    Returns the number of nucleosomes written.
+    """
+    randomNumberGenerator = random.Random(seed)
+    nucleosomeCount = 0
+    with open(filePath, 'w') as nucleosomesFile:
+        for chromosome, chromosomeSize in chromosomeSizes.items():
+            dyadPosition = repeatLength
+            while dyadPosition < chromosomeSize - repeatLength:
+                nucleosomesFile.write(f"{chromosome}\t{dyadPosition}\t{dyadPosition+1}\t.\t.\t.\n")
+                nucleosomeCount += 1
+                dyadPosition += repeatLength + randomNumberGenerator.randint(-positionJitter, positionJitter)
+    return nucleosomeCount
+
+
+def writeGenes(filePath, chromosomeSizes: Dict[str, int], genesPerMb = 100, minGeneLength = 1000, maxGeneLength = 50000, seed = 0):
+    """
+    Writes stranded gene designations at random positions.  Genes may overlap, which exercises ambiguity handling.
+    Returns the number of genes written.
+    """
+    randomNumberGenerator = random.Random(seed)
+    geneCount = 0
+    with open(filePath, 'w') as genesFile:
+        for chromosome, chromosomeSize in chromosomeSizes.items():
+            genes = list()
+            for i in range(int(chromosomeSize * genesPerMb / 1000000)):
+                geneLength = randomNumberGenerator.randint(minGeneLength, maxGeneLength)
+                startPos = randomNumberGenerator.randint(0, max(chromosomeSize - geneLength, 0))
+                genes.append((startPos, startPos + geneLength, f"gene_{chromosome}_{i}", randomNumberGenerator.choice("+-")))
+            genes.sort()
+            for startPos, endPos, geneName, strand in genes:
+                genesFile.write(f"{chromosome}\t{startPos}\t{endPos}\t{geneName}\t.\t{strand}\n")
+            geneCount += len(genes)
+    return geneCount
+
+
+def writeTfbs(filePath, chromosomeSizes: Dict[str, int], tfbsPerKb = 2, minTfbsLength = 6, maxTfbsLength = 20,
+              transcriptionFactorCount = 50, seed = 0):
+    """
+    Writes transcription factor binding sites in the format expected by TfbsData:
+    chromosome, start, end, (unused), sequence, strand, transcription factor name.
+    Returns the number of binding sites written.
+    """
+    randomNumberGenerator = random.Random(seed)
+    tfbsCount = 0
+    with open(filePath, 'w') as tfbsFile:
+        for chromosome, chromosomeSize in chromosomeSizes.items():
+            bindingSites = list()
+            for _ in range(int(chromosomeSize * tfbsPerKb / 1000)):
+                tfbsLength = randomNumberGenerator.randint(minTfbsLength, maxTfbsLength)
+                startPos = randomNumberGenerator.randint(0, chromosomeSize - tfbsLength)
+                bindingSites.append((startPos, startPos + tfbsLength, randomNumberGenerator.choice("+-"),
+                                     f"TF_{randomNumberGenerator.randrange(transcriptionFactorCount)}"))
+            bindingSites.sort()
+            for startPos, endPos, strand, tfbsName in bindingSites:
+                sequence = getRandomSequence(randomNumberGenerator, endPos - startPos)
+                tfbsFile.write(f"{chromosome}\t{startPos}\t{endPos}\t.\t{sequence}\t{strand}\t{tfbsName}\n")
+            tfbsCount += len(bindingSites)
+    return tfbsCount
@@ -4,28 +4,24 @@ from benbiohelpers.CountThisInThat.CounterOutputDataHandler import OutputDataWri
 from benbiohelpers.CountThisInThat.InputDataStructures import (EncompassedData, EncompassingData, EncompassingDataDefaultStrand,
                                                                ENCOMPASSED_DATA, ENCOMPASSING_DATA)
 from benbiohelpers.CountThisInThat.SupplementalInformation import SimpleColumnSupInfoHandler
+from benbiohelpers.CountThisInThat.CountDerivatives import CountDerivative, CountTensor, sumOfColumns, mirroredSum
 
 
 """
 Each counter should extend the ThisInThatCounter and define at least one of the following three methods: initOutputDataHandler,
 setupOutputDataStratifiers, and setupOutputDataWriter. Each are described in detail below. Additionally, this is a good
-place to define a getCountDerivatives function, if desired.
+place to define any count derivatives, if desired.
 """
 class MutationsInNucleosomesCounter(ThisInThatCounter):
 
-    def getCountDerivatives(outputDataWriter: OutputDataWriter, getHeaders):
-        """
-        Used to derive separate counts or other values from the normally outputted counts.
-        For example: Getting the counts across both strands by combining counts on the plus or minus strand
-        or even categorizing data rows by counts and including that categorization in its own column. (This
-        is also good for categorizing data based on whether or not they were encompassed or not in the first place.)
-        """
-        if getHeaders: return ["Both_Strands_Counts", "Aligned_Strands_Counts"]
-        else:
-            thisPlusCounts = outputDataWriter.outputDataStructure[outputDataWriter.previousKeys[0]][True]
-            thisMinusCounts = outputDataWriter.outputDataStructure[outputDataWriter.previousKeys[0]][False]
-            oppositeMinusCounts = outputDataWriter.outputDataStructure[-outputDataWriter.previousKeys[0]][False]
-            return [str(thisPlusCounts+thisMinusCounts),str(thisPlusCounts+oppositeMinusCounts)]
+    # Used to derive separate counts or other values from the normally outputted counts.
+    # For example: Getting the counts across both strands by combining counts on the plus or minus strand, or aligning the strands
+    # by combining plus strand counts at each position with minus strand counts at the opposite position.
+    # Each derivative is evaluated over every row at once.  More complicated derivatives can be written as a CountDerivative
+    # with a function that takes a CountTensor, e.g. CountDerivative("Plus_Strand_Fraction", lambda counts: counts.column(True) / 
+    # (counts.column(True) + counts.column(False))).  (For derivatives that can't be written this way, like categorizing rows,
+    # a per-row getCountDerivatives function can be given to createOutputDataWriter instead.  See OutputDataWriter for details.)
+    countDerivatives = [sumOfColumns("Both_Strands_Counts", True, False), mirroredSum("Aligned_Strands_Counts", True, False)]
 
     def initOutputDataHandler(self):
         """
@@ -52,7 +48,7 @@ class MutationsInNucleosomesCounter(ThisInThatCounter):
         Default behavior creates the output data writer with the counter's "outputFilePath" value
         """
         self.outputDataHandler.createOutputDataWriter(self.outputFilePath, customStratifyingNames=(None, {True:"Plus_Strand_Counts", False:"Minus_Strand_Counts"}),
-                                                      getCountDerivatives = self.getCountDerivatives)
+                                                      countDerivatives = self.countDerivatives)
 
 
 """
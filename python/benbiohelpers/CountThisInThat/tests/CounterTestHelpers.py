@@ -0,0 +1,96 @@
+# This script contains the counters, input data, and output readers shared by the CountThisInThat tests.
+# (The inputFilePaths fixture that uses writeInputFiles is defined in conftest.py.)
+import random
+from benbiohelpers.CountThisInThat.Counter import ThisInThatCounter
+from benbiohelpers.CountThisInThat.InputDataStructures import EncompassingDataDefaultStrand
+from benbiohelpers.CountThisInThat.CounterOutputDataHandler import AmbiguityHandling
+from benbiohelpers.CountThisInThat.CountDerivatives import CountDerivative
+
+
+class DyadPositionCounter(ThisInThatCounter):
+
+    def setupOutputDataStratifiers(self):
+        self.outputDataHandler.addRelativePositionStratifier(self.currentEncompassingFeature, extraRangeRadius = self.encompassingFeatureExtraRadius,
+                                                             outputName = "Dyad_Position")
+        self.outputDataHandler.addStrandComparisonStratifier(strandAmbiguityHandling = AmbiguityHandling.tolerate)
+
+    def constructEncompassingFeature(self, line) -> EncompassingDataDefaultStrand:
+        return EncompassingDataDefaultStrand(line, self.acceptableChromosomes)
+
+
+class RecordedStrandAmbiguityCounter(DyadPositionCounter):
+
+    def setupOutputDataStratifiers(self):
+        self.outputDataHandler.addRelativePositionStratifier(self.currentEncompassingFeature, extraRangeRadius = self.encompassingFeatureExtraRadius,
+                                                             outputName = "Dyad_Position")
+        self.outputDataHandler.addStrandComparisonStratifier(strandAmbiguityHandling = AmbiguityHandling.record)
+
+
+class RecordedBinnedPositionCounter(DyadPositionCounter):
+    """
+    Requires a binSize attribute to be set before construction.
+    """
+
+    def setupOutputDataStratifiers(self):
+        self.outputDataHandler.addRelativePositionStratifier(self.currentEncompassingFeature, extraRangeRadius = self.encompassingFeatureExtraRadius,
+                                                             outputName = "Binned_Dyad_Position", binSize = self.binSize,
+                                                             positionAmbiguityHandling = AmbiguityHandling.record)
+        self.outputDataHandler.addStrandComparisonStratifier(strandAmbiguityHandling = AmbiguityHandling.record)
+
+
+class StrandRatioCounter(DyadPositionCounter):
+    """
+    Adds a derived column that isn't a sum of counts, so it can't be summed across tables.
+    """
+
+    def setupOutputDataWriter(self):
+        self.outputDataHandler.createOutputDataWriter(self.outputFilePath, countDerivatives = [
+            CountDerivative("Same_Strand_Ratio", lambda counts: counts.column(True) / (counts.column(False) + 1))
+        ])
+
+
+class MutationPositionCounter(ThisInThatCounter):
+
+    def setupOutputDataStratifiers(self):
+        self.outputDataHandler.addEncompassedFeatureStratifier("Mutation_Pos")
+        self.outputDataHandler.addPlaceholderStratifier()
+
+    def setupOutputDataWriter(self):
+        self.outputDataHandler.createOutputDataWriter(self.outputFilePath, customStratifyingNames = (None,{None:"Counts"}))
+
+    def constructEncompassingFeature(self, line) -> EncompassingDataDefaultStrand:
+        return EncompassingDataDefaultStrand(line, self.acceptableChromosomes)
+
+
+def writeInputFiles(directory):
+    """
+    Writes 500 randomly placed (but seeded) mutations on each of chr1 and chr2, and nucleosomes every 200 bp along them.
+    Returns the mutations and nucleosomes file paths.
+    """
+    randomNumberGenerator = random.Random(7)
+    mutationsFilePath = directory / "mutations.bed"
+    nucleosomesFilePath = directory / "nucleosomes.bed"
+
+    mutations = sorted((chromosome, randomNumberGenerator.randint(0, 20000), randomNumberGenerator.choice("+-"))
+                       for chromosome in ("chr1", "chr2") for _ in range(500))
+    with open(mutationsFilePath, 'w') as mutationsFile:
+        for chromosome, position, strand in mutations:
+            mutationsFile.write(f"{chromosome}\t{position}\t{position+1}\t.\t.\t{strand}\n")
+
+    with open(nucleosomesFilePath, 'w') as nucleosomesFile:
+        for chromosome in ("chr1", "chr2"):
+            for dyadPosition in range(200, 20000, 200):
+                nucleosomesFile.write(f"{chromosome}\t{dyadPosition}\t{dyadPosition+1}\t.\t.\t.\n")
+
+    return str(mutationsFilePath), str(nucleosomesFilePath)
+
+
+def getCounterOutput(outputFilePath):
+    """
+    Reads a counter's tsv output (with a single key column) into a dictionary of counts keyed by (key, header).
+    """
+    with open(outputFilePath, 'r') as outputFile:
+        headers = outputFile.readline().strip().split('\t')
+        return {(choppedUpLine[0], header): int(count)
+                for choppedUpLine in (line.strip().split('\t') for line in outputFile)
+                for header, count in zip(headers[1:], choppedUpLine[1:])}
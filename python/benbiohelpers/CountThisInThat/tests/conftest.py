@@ -0,0 +1,8 @@
+import pytest
+from benbiohelpers.CountThisInThat.tests.CounterTestHelpers import writeInputFiles
+
+
+@pytest.fixture
+def inputFilePaths(tmp_path):
+    mutationsFilePath, nucleosomesFilePath = writeInputFiles(tmp_path)
+    return mutationsFilePath, nucleosomesFilePath, tmp_path
@@ -0,0 +1,20 @@
+from benbiohelpers.CountThisInThat.benchmarks.RunBenchmarks import runBenchmarks, BENCHMARK_CONFIGURATIONS, generateBenchmarkData
+
+
+def test_synthetic_data_is_reproducible(tmp_path):
+    fileContents = list()
+    for directoryName in ("first", "second"):
+        (tmp_path / directoryName).mkdir()
+        filePaths, _ = generateBenchmarkData(str(tmp_path / directoryName), chromosomeCount = 2, chromosomeLength = 50000, seed = 3)
+        fileContents.append({dataType: open(filePath).read() for dataType, filePath in filePaths.items()})
+    assert fileContents[0] == fileContents[1]
+
+
+def test_all_configurations_run(tmp_path):
+    resultsFilePath = tmp_path / "results.tsv"
+    allResults = runBenchmarks(str(tmp_path), measureMemory = True, resultsFilePath = str(resultsFilePath),
+                               chromosomeCount = 2, chromosomeLength = 50000)
+    assert [results["Configuration"] for results in allResults] == list(BENCHMARK_CONFIGURATIONS)
+    for results in allResults:
+        assert results["Lines_Read"] > 0 and results["Peak_Memory_MB"] > 0
+    assert len(resultsFilePath.read_text().splitlines()) == len(BENCHMARK_CONFIGURATIONS) + 1
@@ -0,0 +1,69 @@
+import numpy as np
+from benbiohelpers.CountThisInThat.tests.CounterTestHelpers import DyadPositionCounter, MutationPositionCounter
+from benbiohelpers.CountThisInThat.ColumnarOutput import ColumnarTableWriter, convertTableToColumnar, loadColumnarTable
+from benbiohelpers.CountThisInThat.InputDataStructures import ENCOMPASSED_DATA
+
+
+def readTable(tableFilePath):
+    with open(tableFilePath, 'r') as tableFile:
+        return [line.rstrip('\n').split('\t') for line in tableFile]
+
+
+def assertColumnarTableMatches(columnarTable, tableRows, keyColumnCount):
+    assert columnarTable.headers == tableRows[0]
+    assert len(columnarTable) == len(tableRows) - 1
+    for i, header in enumerate(columnarTable.headers):
+        column = columnarTable[header]
+        if i < keyColumnCount: assert column.tolist() == [row[i] for row in tableRows[1:]]
+        else:
+            assert column.dtype == np.int64
+            assert column.tolist() == [int(row[i]) for row in tableRows[1:]]
+
+
+def test_columnar_output_matches_tsv(inputFilePaths):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+    for outputFilePath in (tmp_path / "dyad.tsv", tmp_path / "dyad.columnar"):
+        DyadPositionCounter(mutationsFilePath, nucleosomesFilePath, str(outputFilePath),
+                            encompassingFeatureExtraRadius = 73, suppressOutput = True).count()
+
+    columnarTable = loadColumnarTable(tmp_path / "dyad.columnar")
+    assertColumnarTableMatches(columnarTable, readTable(tmp_path / "dyad.tsv"), 1)
+    assert isinstance(columnarTable[columnarTable.getCountHeaders()[0]], np.memmap)
+    assert columnarTable.getKeyHeaders() == ["Dyad_Position"]
+
+
+def test_columnar_output_when_writing_incrementally(inputFilePaths):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+    for outputFilePath in (tmp_path / "positions.tsv", tmp_path / "positions.columnar"):
+        MutationPositionCounter(mutationsFilePath, nucleosomesFilePath, str(outputFilePath), encompassingFeatureExtraRadius = 73,
+                                writeIncrementally = ENCOMPASSED_DATA, sortOutputOnExit = True, suppressOutput = True).count()
+
+    # Headers aren't written to the tsv file when writing incrementally, but the columnar table always has them.
+    tableRows = readTable(tmp_path / "positions.tsv")
+    columnarTable = loadColumnarTable(tmp_path / "positions.columnar", mmap = False)
+    assert columnarTable.headers == ["Mutation_Pos", "Counts"]
+    assert len(columnarTable) == len(tableRows) > 0
+    assert sorted(zip(columnarTable["Mutation_Pos"].tolist(), columnarTable["Counts"].tolist())) == sorted(
+        (position, int(count)) for position, count in tableRows)
+
+
+def test_convert_table_to_columnar(tmp_path):
+    with open(tmp_path / "table.tsv", 'w') as tableFile:
+        tableFile.write("Context\tStrand\tCounts\tFraction\n")
+        tableFile.write("ACG\tplus\t3\t0\n")
+        tableFile.write("ACG\tminus\t1\t0.25\n")
+        tableFile.write("TTT\tplus\t0\t1\n")
+    convertTableToColumnar(tmp_path / "table.tsv", tmp_path / "table.columnar", 2)
+
+    columnarTable = loadColumnarTable(tmp_path / "table.columnar")
+    assert columnarTable["Context"].tolist() == ["ACG", "ACG", "TTT"]
+    assert columnarTable.getKeyLabels("Strand").tolist() == ["plus", "minus"]
+    assert columnarTable.getKeyCodes("Strand").tolist() == [0, 1, 0]
+    assert columnarTable["Counts"].tolist() == [3, 1, 0]
+    assert columnarTable["Fraction"].dtype == np.float64
+    assert columnarTable["Fraction"].tolist() == [0, 0.25, 1]
+
+    # Empty tables can be written and loaded too.
+    emptyTableWriter = ColumnarTableWriter(tmp_path / "empty.columnar", ["Key", "Counts"], 1)
+    emptyTableWriter.close()
+    assert len(loadColumnarTable(tmp_path / "empty.columnar")["Counts"]) == 0
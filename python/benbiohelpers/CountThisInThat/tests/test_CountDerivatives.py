@@ -0,0 +1,43 @@
+from benbiohelpers.CountThisInThat.CounterOutputDataHandler import OutputDataWriter
+from benbiohelpers.CountThisInThat.CountDerivatives import CountDerivative, sumOfColumns, mirroredSum
+from benbiohelpers.CountThisInThat.tests.CounterTestHelpers import DyadPositionCounter
+
+
+def getCountDerivativesPerRow(outputDataWriter: OutputDataWriter, getHeaders):
+    if getHeaders: return ["Both_Strands_Counts", "Aligned_Strands_Counts", "Weighted_Position"]
+    else:
+        dyadPosition = outputDataWriter.previousKeys[0]
+        thisPlusCounts = outputDataWriter.outputDataStructure[dyadPosition][True]
+        thisMinusCounts = outputDataWriter.outputDataStructure[dyadPosition][False]
+        oppositeMinusCounts = outputDataWriter.outputDataStructure[-dyadPosition][False]
+        return [str(thisPlusCounts+thisMinusCounts), str(thisPlusCounts+oppositeMinusCounts),
+                str(dyadPosition*(thisPlusCounts+thisMinusCounts))]
+
+
+class PerRowDerivativesCounter(DyadPositionCounter):
+
+    def setupOutputDataWriter(self):
+        self.outputDataHandler.createOutputDataWriter(self.outputFilePath, getCountDerivatives = getCountDerivativesPerRow)
+
+
+class VectorizedDerivativesCounter(DyadPositionCounter):
+
+    def setupOutputDataWriter(self):
+        self.outputDataHandler.createOutputDataWriter(self.outputFilePath, countDerivatives = [
+            sumOfColumns("Both_Strands_Counts", True, False), mirroredSum("Aligned_Strands_Counts", True, False),
+            CountDerivative("Weighted_Position", lambda counts: counts.keys(0) * (counts.column(True) + counts.column(False)))
+        ])
+
+
+def test_vectorized_derivatives_match_per_row_derivatives(inputFilePaths):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+
+    outputText = dict()
+    for counterClass in (PerRowDerivativesCounter, VectorizedDerivativesCounter):
+        outputFilePath = tmp_path / (counterClass.__name__ + ".tsv")
+        counterClass(mutationsFilePath, nucleosomesFilePath, str(outputFilePath),
+                     encompassingFeatureExtraRadius = 73, suppressOutput = True).count()
+        outputText[counterClass] = outputFilePath.read_text()
+
+    assert outputText[PerRowDerivativesCounter] == outputText[VectorizedDerivativesCounter]
+    assert outputText[VectorizedDerivativesCounter].split('\n')[0].endswith("Both_Strands_Counts\tAligned_Strands_Counts\tWeighted_Position")
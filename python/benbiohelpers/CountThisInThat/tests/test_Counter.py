@@ -0,0 +1,313 @@
+from benbiohelpers.FileSystemHandling import ChromosomeIndex
+from benbiohelpers.CountThisInThat.tests.CounterTestHelpers import (DyadPositionCounter, MutationPositionCounter,
+                                                                    RecordedStrandAmbiguityCounter, getCounterOutput)
+from benbiohelpers.CountThisInThat.Counter import ThisInThatCounter
+from benbiohelpers.CountThisInThat.InputDataStructures import EncompassingDataDefaultStrand, ENCOMPASSED_DATA, ENCOMPASSING_DATA
+from benbiohelpers.CountThisInThat.CounterOutputDataHandler import AmbiguityHandling, CounterOutputDataHandler
+from benbiohelpers.CountThisInThat.ResamplingStatistics import PermutationNullModel
+from benbiohelpers.CustomErrors import UnsortedInputError
+import io, os, random, threading
+import pytest
+
+
+def test_chromosome_index_matches_full_read(inputFilePaths):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+
+    # Add a chromosome to the mutations file that has no nucleosomes, so it has to be skipped.
+    with open(mutationsFilePath, 'a') as mutationsFile: mutationsFile.write("chr3\t100\t101\t.\t.\t+\n")
+
+    for useChromosomeIndex in (False, True):
+        DyadPositionCounter(mutationsFilePath, nucleosomesFilePath, str(tmp_path / f"counts_{useChromosomeIndex}.tsv"),
+                            encompassingFeatureExtraRadius = 73, suppressOutput = True, useChromosomeIndex = useChromosomeIndex).count()
+    assert getCounterOutput(tmp_path / "counts_False.tsv") == getCounterOutput(tmp_path / "counts_True.tsv")
+
+
+def test_chromosome_index_skips_unacceptable_chromosomes(inputFilePaths):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+
+    DyadPositionCounter(mutationsFilePath, nucleosomesFilePath, str(tmp_path / "chr2_only.tsv"), acceptableChromosomes = ["chr2"],
+                        encompassingFeatureExtraRadius = 73, suppressOutput = True, useChromosomeIndex = True).count()
+
+    with open(mutationsFilePath) as mutationsFile, open(tmp_path / "chr2_mutations.bed", 'w') as chr2MutationsFile:
+        chr2MutationsFile.writelines(line for line in mutationsFile if line.startswith("chr2\t"))
+    with open(nucleosomesFilePath) as nucleosomesFile, open(tmp_path / "chr2_nucleosomes.bed", 'w') as chr2NucleosomesFile:
+        chr2NucleosomesFile.writelines(line for line in nucleosomesFile if line.startswith("chr2\t"))
+    DyadPositionCounter(str(tmp_path / "chr2_mutations.bed"), str(tmp_path / "chr2_nucleosomes.bed"), str(tmp_path / "chr2_files.tsv"),
+                        encompassingFeatureExtraRadius = 73, suppressOutput = True).count()
+
+    assert getCounterOutput(tmp_path / "chr2_only.tsv") == getCounterOutput(tmp_path / "chr2_files.tsv")
+
+
+def test_region_restricted_counting_matches_prefiltered_files(inputFilePaths, monkeypatch):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+    monkeypatch.setattr(ChromosomeIndex, "CHECKPOINT_INTERVAL", 20) # Make sure seeking within chromosomes is exercised.
+    regions = ["chr1:1001-5000", "chr2:10001-12000", "chr2:11501-13000"]
+    regionBounds = {"chr1": [(1000, 5000)], "chr2": [(10000, 13000)]}
+
+    DyadPositionCounter(mutationsFilePath, nucleosomesFilePath, str(tmp_path / "regions.tsv"), regions = regions,
+                        encompassingFeatureExtraRadius = 73, suppressOutput = True).count()
+
+    def isInRegions(line, radius):
+        chromosome, startPos = line.split('\t')[:2]
+        return any(start - radius <= int(startPos) < end + radius for start, end in regionBounds.get(chromosome, ()))
+    with open(mutationsFilePath) as mutationsFile, open(tmp_path / "region_mutations.bed", 'w') as regionMutationsFile:
+        regionMutationsFile.writelines(line for line in mutationsFile if isInRegions(line, 0))
+    with open(nucleosomesFilePath) as nucleosomesFile, open(tmp_path / "region_nucleosomes.bed", 'w') as regionNucleosomesFile:
+        regionNucleosomesFile.writelines(line for line in nucleosomesFile if isInRegions(line, 73))
+    DyadPositionCounter(str(tmp_path / "region_mutations.bed"), str(tmp_path / "region_nucleosomes.bed"), str(tmp_path / "region_files.tsv"),
+                        encompassingFeatureExtraRadius = 73, suppressOutput = True).count()
+
+    regionCounts = getCounterOutput(tmp_path / "regions.tsv")
+    assert regionCounts == getCounterOutput(tmp_path / "region_files.tsv")
+    assert sum(regionCounts.values()) > 0
+
+
+def test_sorted_incremental_output_matches_input_sorting(inputFilePaths):
+    _, nucleosomesFilePath, tmp_path = inputFilePaths
+
+    # Features of varying lengths have midpoints that aren't sorted the same way as their start and end positions.
+    randomNumberGenerator = random.Random(3)
+    features = sorted((chromosome, startPos, startPos + randomNumberGenerator.randint(1, 40))
+                      for chromosome in ("chr1", "chr2") for startPos in randomNumberGenerator.sample(range(20000), 500))
+    featuresFilePath = tmp_path / "ranged_features.bed"
+    with open(featuresFilePath, 'w') as featuresFile:
+        for chromosome, startPos, endPos in features: featuresFile.write(f"{chromosome}\t{startPos}\t{endPos}\t.\t.\t+\n")
+
+    outputLines = dict()
+    for sortOutputOnExit in (False, True):
+        outputFilePath = tmp_path / f"positions_{sortOutputOnExit}.bed"
+        MutationPositionCounter(str(featuresFilePath), nucleosomesFilePath, str(outputFilePath), encompassingFeatureExtraRadius = 73,
+                                writeIncrementally = ENCOMPASSED_DATA, sortOutputOnExit = sortOutputOnExit, suppressOutput = True).count()
+        with open(outputFilePath) as outputFile: outputLines[sortOutputOnExit] = outputFile.readlines()
+
+    def getSortKey(line):
+        choppedUpLine = line.split('\t')
+        return (choppedUpLine[0], int(choppedUpLine[1]), int(choppedUpLine[2]))
+    assert outputLines[False] != sorted(outputLines[False], key = getSortKey)
+    assert outputLines[True] == sorted(outputLines[False], key = getSortKey)
+
+
+class RecordedNucleosomeCounter(DyadPositionCounter):
+
+    def initOutputDataHandler(self):
+        self.outputDataHandler = CounterOutputDataHandler(self.writeIncrementally, trackAllEncompassing = True)
+
+    def setupOutputDataStratifiers(self):
+        self.outputDataHandler.addEncompassingFeatureStratifier(ambiguityHandling = AmbiguityHandling.record, outputName = "Nucleosome")
+        self.outputDataHandler.addPlaceholderStratifier()
+
+
+def test_sorted_incremental_output_with_recorded_ambiguity(inputFilePaths):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+
+    # Recording ambiguity adds a None key (which has no sort key) alongside the nucleosomes at the first stratification level.
+    outputLines = dict()
+    for sortOutputOnExit in (False, True):
+        outputFilePath = tmp_path / f"nucleosomes_{sortOutputOnExit}.tsv"
+        RecordedNucleosomeCounter(mutationsFilePath, nucleosomesFilePath, str(outputFilePath), encompassingFeatureExtraRadius = 120,
+                                  writeIncrementally = ENCOMPASSING_DATA, sortOutputOnExit = sortOutputOnExit, suppressOutput = True).count()
+        with open(outputFilePath) as outputFile: outputLines[sortOutputOnExit] = outputFile.readlines()
+
+    assert len(outputLines[True]) > 1
+    assert outputLines[True] == outputLines[False]
+
+
+def test_weighted_counts_match_duplicated_features(inputFilePaths):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+
+    # Give each mutation a weight and write an equivalent file with each mutation duplicated that many times.
+    randomNumberGenerator = random.Random(5)
+    with open(mutationsFilePath) as mutationsFile, open(tmp_path / "weighted.bed", 'w') as weightedFile, \
+         open(tmp_path / "duplicated.bed", 'w') as duplicatedFile:
+        for line in mutationsFile:
+            weight = randomNumberGenerator.randint(1, 4)
+            weightedFile.write(line.rstrip('\n') + f"\t{weight}\n")
+            duplicatedFile.write(line * weight)
+
+    for counterClass in (DyadPositionCounter, RecordedStrandAmbiguityCounter):
+        for inputType in ("weighted", "duplicated"):
+            counterClass(str(tmp_path / f"{inputType}.bed"), nucleosomesFilePath, str(tmp_path / f"{inputType}_{counterClass.__name__}.tsv"),
+                         countWeightColumn = 6 if inputType == "weighted" else None,
+                         encompassingFeatureExtraRadius = 73, suppressOutput = True).count()
+        assert (getCounterOutput(tmp_path / f"weighted_{counterClass.__name__}.tsv") ==
+                getCounterOutput(tmp_path / f"duplicated_{counterClass.__name__}.tsv"))
+
+    nullModel = PermutationNullModel(DyadPositionCounter(str(tmp_path / "weighted.bed"), nucleosomesFilePath, str(tmp_path / "unused.tsv"),
+                                                         countWeightColumn = 6, encompassingFeatureExtraRadius = 73, suppressOutput = True),
+                                     permutations = 2, seed = 1)
+    observedCounts = {(str(dyadPosition), str(strandComparison)): observed
+                      for (dyadPosition, strandComparison), (observed, _, _) in nullModel.summarize().items()}
+    for key, count in getCounterOutput(tmp_path / "duplicated_DyadPositionCounter.tsv").items(): assert observedCounts.get(key, 0) == count
+
+
+def test_streamed_input_matches_file_input(inputFilePaths):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+    DyadPositionCounter(mutationsFilePath, nucleosomesFilePath, str(tmp_path / "from_files.tsv"),
+                        encompassingFeatureExtraRadius = 73, suppressOutput = True).count()
+
+    # Stream the mutations from an open text stream and the nucleosomes through a named pipe.
+    nucleosomesPipePath = str(tmp_path / "nucleosomes_pipe")
+    os.mkfifo(nucleosomesPipePath)
+    def feedPipe():
+        with open(nucleosomesFilePath) as nucleosomesFile, open(nucleosomesPipePath, 'w') as nucleosomesPipe:
+            nucleosomesPipe.write(nucleosomesFile.read())
+    pipeFeeder = threading.Thread(target = feedPipe)
+    pipeFeeder.start()
+    with open(mutationsFilePath) as mutationsFile:
+        mutationsStream = io.StringIO(mutationsFile.read())
+    DyadPositionCounter(mutationsStream, nucleosomesPipePath, str(tmp_path / "from_streams.tsv"),
+                        encompassingFeatureExtraRadius = 73, suppressOutput = True).count()
+    pipeFeeder.join()
+
+    assert getCounterOutput(tmp_path / "from_files.tsv") == getCounterOutput(tmp_path / "from_streams.tsv")
+    assert not mutationsStream.closed
+
+
+def test_FAIL_unsorted_streamed_input(inputFilePaths):
+    _, nucleosomesFilePath, tmp_path = inputFilePaths
+    mutationsStream = io.StringIO("chr1\t500\t501\t.\t.\t+\nchr1\t300\t301\t.\t.\t+\n")
+    with pytest.raises(UnsortedInputError):
+        DyadPositionCounter(mutationsStream, nucleosomesFilePath, str(tmp_path / "unsorted.tsv"),
+                            encompassingFeatureExtraRadius = 73, suppressOutput = True).count()
+
+
+def test_memory_budget_switches_to_incremental_writing(inputFilePaths):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+
+    outputLines = dict()
+    for maxMemory in (None, 1):
+        outputFilePath = tmp_path / f"positions_{maxMemory}.tsv"
+        counter = MutationPositionCounter(mutationsFilePath, nucleosomesFilePath, str(outputFilePath), maxMemory = maxMemory,
+                                          encompassingFeatureExtraRadius = 73, suppressOutput = True)
+        counter.count()
+        with open(outputFilePath) as outputFile: outputLines[maxMemory] = outputFile.readlines()
+    assert counter.writeIncrementally == ENCOMPASSED_DATA
+
+    assert outputLines[None][0] == outputLines[1][0]
+    assert sorted(outputLines[None][1:]) == sorted(outputLines[1][1:])
+
+    # Dyad position counts can't be written incrementally, so they are just counted normally (with a warning).
+    DyadPositionCounter(mutationsFilePath, nucleosomesFilePath, str(tmp_path / "dyads.tsv"),
+                        encompassingFeatureExtraRadius = 73, suppressOutput = True).count()
+    with pytest.warns(UserWarning, match = "maxMemory"):
+        DyadPositionCounter(mutationsFilePath, nucleosomesFilePath, str(tmp_path / "dyads_budgeted.tsv"), maxMemory = 1,
+                            encompassingFeatureExtraRadius = 73, suppressOutput = True).count()
+    assert getCounterOutput(tmp_path / "dyads.tsv") == getCounterOutput(tmp_path / "dyads_budgeted.tsv")
+
+
+class MutationNucleosomeNameCounter(ThisInThatCounter):
+
+    def setupOutputDataStratifiers(self):
+        self.outputDataHandler.addEncompassedFeatureStratifier("Mutation_Pos")
+        self.outputDataHandler.addSimpleEncompassingColStratifier(outputName = "Nucleosome_Name")
+
+    def constructEncompassingFeature(self, line) -> EncompassingDataDefaultStrand:
+        return EncompassingDataDefaultStrand(line, self.acceptableChromosomes)
+
+
+def test_memory_budget_keeps_batch_writing_when_final_keys_are_found_while_counting(inputFilePaths):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+
+    # Name the nucleosomes, so that the final stratifier's keys (and the output's columns) are only found while counting.
+    namedNucleosomesFilePath = tmp_path / "named_nucleosomes.bed"
+    with open(nucleosomesFilePath) as nucleosomesFile, open(namedNucleosomesFilePath, 'w') as namedNucleosomesFile:
+        for i, line in enumerate(nucleosomesFile):
+            choppedUpLine = line.strip().split('\t')
+            choppedUpLine[3] = "ABC"[i % 3]
+            namedNucleosomesFile.write('\t'.join(choppedUpLine) + '\n')
+
+    outputLines = dict()
+    for maxMemory in (None, 2000):
+        outputFilePath = tmp_path / f"named_{maxMemory}.tsv"
+        counter = MutationNucleosomeNameCounter(mutationsFilePath, str(namedNucleosomesFilePath), str(outputFilePath),
+                                                maxMemory = maxMemory, encompassingFeatureExtraRadius = 73, suppressOutput = True)
+        if maxMemory is None: counter.count()
+        else:
+            with pytest.warns(UserWarning, match = "maxMemory"): counter.count()
+        with open(outputFilePath) as outputFile: outputLines[maxMemory] = outputFile.readlines()
+    assert counter.writeIncrementally == 0
+
+    assert outputLines[None][0].strip().split('\t') == ["Mutation_Pos", "A", "B", "C"]
+    assert outputLines[None] == outputLines[2000]
+
+
+class GeneRelativePositionCounter(ThisInThatCounter):
+
+    def __init__(self, *args, binSize = None, **kwargs):
+        self.binSize = binSize
+        super().__init__(*args, **kwargs)
+
+    def setupOutputDataStratifiers(self):
+        self.outputDataHandler.addRelativePositionStratifier(None, centerRelativePos = False, outputName = "Gene_Position",
+                                                             growRange = True, binSize = self.binSize)
+        self.outputDataHandler.addPlaceholderStratifier()
+
+    def setupOutputDataWriter(self):
+        self.outputDataHandler.createOutputDataWriter(self.outputFilePath, customStratifyingNames = (None,{None:"Counts"}))
+
+    def constructEncompassingFeature(self, line) -> EncompassingDataDefaultStrand:
+        return EncompassingDataDefaultStrand(line, self.acceptableChromosomes)
+
+
+def test_relative_positions_in_variable_length_features(inputFilePaths):
+    mutationsFilePath, _, tmp_path = inputFilePaths
+
+    # Non-overlapping genes of many different lengths.
+    randomNumberGenerator = random.Random(3)
+    genes = list()
+    for chromosome in ("chr1", "chr2"):
+        start = 0
+        while True:
+            start += randomNumberGenerator.randint(10, 200)
+            end = start + randomNumberGenerator.randint(20, 400)
+            if end > 20000: break
+            genes.append((chromosome, start, end))
+            start = end
+    genesFilePath = str(tmp_path / "genes.bed")
+    with open(genesFilePath, 'w') as genesFile:
+        genesFile.writelines(f"{chromosome}\t{start}\t{end}\t.\t.\t.\n" for chromosome, start, end in genes)
+
+    expectedCounts = dict()
+    with open(mutationsFilePath) as mutationsFile:
+        for line in mutationsFile:
+            chromosome, position = line.split('\t')[:2]
+            for geneChromosome, start, end in genes:
+                if geneChromosome == chromosome and start <= int(position) < end:
+                    expectedCounts[int(position) - start] = expectedCounts.get(int(position) - start, 0) + 1
+
+    GeneRelativePositionCounter(mutationsFilePath, genesFilePath, str(tmp_path / "gene_positions.tsv"), suppressOutput = True).count()
+    counts = {int(position): count for (position, _), count in getCounterOutput(tmp_path / "gene_positions.tsv").items()}
+    assert sorted(counts) == list(range(max(expectedCounts) + 1))
+    assert counts == {position: expectedCounts.get(position, 0) for position in counts}
+
+    GeneRelativePositionCounter(mutationsFilePath, genesFilePath, str(tmp_path / "binned_gene_positions.tsv"),
+                                binSize = 50, suppressOutput = True).count()
+    binnedCounts = {int(position): count for (position, _), count in getCounterOutput(tmp_path / "binned_gene_positions.tsv").items()}
+    assert sorted(binnedCounts) == list(range(0, max(expectedCounts) + 1, 50))
+    assert binnedCounts == {binStart: sum(counts[position] for position in range(binStart, min(binStart + 50, len(counts))))
+                            for binStart in binnedCounts}
+
+
+def test_estimate_projects_sampled_counts(inputFilePaths):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+
+    # With every line sampled, the projections should be exact.
+    counter = MutationPositionCounter(mutationsFilePath, nucleosomesFilePath, str(tmp_path / "positions.tsv"),
+                                      encompassingFeatureExtraRadius = 73, suppressOutput = True)
+    estimates = counter.estimate(sampleLinesPerChromosome = 1000)
+    counter.count()
+    with open(tmp_path / "positions.tsv", 'rb') as outputFile: outputLines = outputFile.readlines()
+
+    assert estimates["projectedEncompassedFeatures"] == 1000
+    assert estimates["projectedEncompassingFeatures"] == 198
+    assert estimates["projectedOutputRows"] == len(outputLines)
+    assert estimates["projectedOutputBytes"] == sum(len(line) for line in outputLines)
+    assert estimates["projectedStratifierKeys"]["0:EncompassedFeatureODS(Mutation_Pos)"] == len(outputLines) - 1
+    assert 0 < estimates["projectedPeakMemory"]["incremental"] < estimates["projectedPeakMemory"]["batch"]
+
+    # Smaller samples are scaled up to the full inputs.
+    estimates = DyadPositionCounter(mutationsFilePath, nucleosomesFilePath, str(tmp_path / "dyads.tsv"),
+                                    encompassingFeatureExtraRadius = 73, suppressOutput = True).estimate(sampleLinesPerChromosome = 100)
+    assert estimates["sampledEncompassedFeatures"] == 200
+    assert 800 < estimates["projectedEncompassedFeatures"] < 1200
+    assert estimates["projectedPeakMemory"]["incremental"] is None
@@ -0,0 +1,130 @@
+import os, subprocess, sys, threading, time
+import pytest
+from benbiohelpers.CountThisInThat.tests.CounterTestHelpers import DyadPositionCounter, MutationPositionCounter, StrandRatioCounter
+from benbiohelpers.CountThisInThat.CounterJobQueue import CounterJob, CounterJobQueue, runWorker
+from benbiohelpers.CountThisInThat.ColumnarOutput import loadColumnarTable
+from benbiohelpers.CountThisInThat.InputDataStructures import ENCOMPASSED_DATA
+
+
+def test_sharded_jobs_match_single_counter(inputFilePaths):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+    queue = CounterJobQueue(tmp_path / "queue")
+    jobs = [CounterJob(counterClass, mutationsFilePath, nucleosomesFilePath, tmp_path / f"sharded_{name}.tsv",
+                       dict(encompassingFeatureExtraRadius = 73, suppressOutput = True))
+            for name, counterClass in (("dyad", DyadPositionCounter), ("positions", MutationPositionCounter))]
+    for job in jobs: assert len(queue.submitShards(job)) == 2
+
+    # Run several workers at once, as separate processes.
+    workers = [subprocess.Popen([sys.executable, "-m", "benbiohelpers.CountThisInThat.CounterJobQueue", str(tmp_path / "queue")])
+               for _ in range(3)]
+    for worker in workers: assert worker.wait(timeout = 120) == 0
+    assert queue.getStatus() == {"pending": 0, "claimed": 0, "done": 4, "failed": 0}
+
+    for job in jobs:
+        queue.mergeShards(job)
+        counter = job.getCounterClass()(mutationsFilePath, nucleosomesFilePath, str(tmp_path / "single.tsv"),
+                                        encompassingFeatureExtraRadius = 73, suppressOutput = True)
+        counter.count()
+        with open(job.outputFilePath) as shardedFile, open(tmp_path / "single.tsv") as singleFile:
+            shardedLines = shardedFile.readlines()
+            singleLines = singleFile.readlines()
+            assert len(shardedLines) > 1
+            # Features at the same position (but on different strands) may be written in either order.
+            assert shardedLines[0] == singleLines[0] and sorted(shardedLines) == sorted(singleLines)
+
+
+def test_failed_jobs_are_recorded(inputFilePaths):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+    queue = CounterJobQueue(tmp_path / "queue")
+    queue.submit(CounterJob(DyadPositionCounter, tmp_path / "missing.bed", nucleosomesFilePath, tmp_path / "missing.tsv"))
+    assert runWorker(tmp_path / "queue") == 1
+    assert queue.getStatus()["failed"] == 1
+    with open(tmp_path / "queue" / "failed" / "missing.record") as recordFile: assert "missing.bed" in recordFile.read()
+
+
+class HeaderedMutationPositionCounter(MutationPositionCounter):
+
+    def setupOutputDataWriter(self):
+        self.outputDataHandler.createOutputDataWriter(self.outputFilePath, customStratifyingNames = (None,{None:"Counts"}),
+                                                      writeHeadersImmediately = True)
+
+
+@pytest.mark.parametrize("counterClass, outputFileName, writeIncrementally, hasHeaders", [
+    (MutationPositionCounter, "positions.tsv", ENCOMPASSED_DATA, False),
+    (HeaderedMutationPositionCounter, "positions.tsv", ENCOMPASSED_DATA, True),
+    (MutationPositionCounter, "positions.bed", ENCOMPASSED_DATA, False),
+    (MutationPositionCounter, "positions.bed", 0, True) # Bed output that isn't written incrementally is written like a tsv table.
+])
+def test_sharded_feature_tables_match_single_counter(inputFilePaths, counterClass, outputFileName, writeIncrementally, hasHeaders):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+    queue = CounterJobQueue(tmp_path / "queue")
+    job = CounterJob(counterClass, mutationsFilePath, nucleosomesFilePath, tmp_path / outputFileName,
+                     dict(encompassingFeatureExtraRadius = 73, writeIncrementally = writeIncrementally, suppressOutput = True))
+    shards = queue.submitShards(job)
+    assert len(shards) == 2 and all(shard.outputFilePath.endswith(os.path.splitext(outputFileName)[1]) for shard in shards)
+    assert runWorker(tmp_path / "queue") == 2
+    queue.mergeShards(job)
+
+    counterClass(mutationsFilePath, nucleosomesFilePath, str(tmp_path / ("single_" + outputFileName)), encompassingFeatureExtraRadius = 73,
+                 writeIncrementally = writeIncrementally, suppressOutput = True).count()
+    with open(tmp_path / outputFileName) as shardedFile, open(tmp_path / ("single_" + outputFileName)) as singleFile:
+        shardedLines = shardedFile.readlines()
+        singleLines = singleFile.readlines()
+    # Features at the same position (but on different strands) may be written in either order.
+    assert len(shardedLines) > 1 and sorted(shardedLines) == sorted(singleLines)
+    assert shardedLines[0].startswith("Mutation_Pos") == hasHeaders
+
+
+def test_sharded_columnar_table_matches_single_counter(inputFilePaths):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+    queue = CounterJobQueue(tmp_path / "queue")
+    job = CounterJob(DyadPositionCounter, mutationsFilePath, nucleosomesFilePath, tmp_path / "dyad.columnar",
+                     dict(encompassingFeatureExtraRadius = 73, suppressOutput = True))
+    queue.submitShards(job)
+    assert runWorker(tmp_path / "queue") == 2
+    queue.mergeShards(job)
+
+    DyadPositionCounter(mutationsFilePath, nucleosomesFilePath, str(tmp_path / "single.columnar"),
+                        encompassingFeatureExtraRadius = 73, suppressOutput = True).count()
+    shardedTable, singleTable = loadColumnarTable(tmp_path / "dyad.columnar"), loadColumnarTable(tmp_path / "single.columnar")
+    assert shardedTable.headers == singleTable.headers and len(shardedTable) == len(singleTable) > 0
+    for header in shardedTable.headers: assert list(shardedTable[header]) == list(singleTable[header])
+
+
+def test_running_jobs_keep_their_claims(inputFilePaths):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+    queue = CounterJobQueue(tmp_path / "queue")
+    queue.submit(CounterJob(DyadPositionCounter, mutationsFilePath, nucleosomesFilePath, tmp_path / "dyad.tsv"))
+    jobFileName, _ = queue.claimNextJob("worker_A")
+    claimedFilePath = tmp_path / "queue" / "claimed" / jobFileName
+
+    # While the heartbeat runs, the claim is refreshed, so the job isn't requeued even though it was claimed long ago.
+    os.utime(claimedFilePath, (0, 0))
+    stopHeartbeat = threading.Event()
+    heartbeat = threading.Thread(target = queue.keepClaimAlive, args = (jobFileName, "worker_A", 0.01, stopHeartbeat))
+    heartbeat.start()
+    time.sleep(0.2)
+    stopHeartbeat.set()
+    heartbeat.join()
+    assert queue.requeueStaleJobs(10) == []
+
+    # Once the claim goes stale, the job is requeued and can be claimed by another worker, and the original worker can't finish it.
+    os.utime(claimedFilePath, (0, 0))
+    assert queue.requeueStaleJobs(10) == [jobFileName]
+    assert queue.claimNextJob("worker_B")[0] == jobFileName
+    assert not queue.refreshClaim(jobFileName, "worker_A")
+    assert not queue.finishJob(jobFileName, "done", {"worker": "worker_A"}, "worker_A")
+    assert queue.getStatus()["claimed"] == 1
+    assert queue.finishJob(jobFileName, "done", {"worker": "worker_B"}, "worker_B")
+    assert queue.getStatus() == {"pending": 0, "claimed": 0, "done": 1, "failed": 0}
+
+
+def test_shards_with_non_sum_derivatives_are_not_merged(inputFilePaths):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+    queue = CounterJobQueue(tmp_path / "queue")
+    job = CounterJob(StrandRatioCounter, mutationsFilePath, nucleosomesFilePath, tmp_path / "ratios.tsv",
+                     dict(encompassingFeatureExtraRadius = 73, suppressOutput = True))
+    queue.submitShards(job)
+    assert runWorker(tmp_path / "queue") == 2
+    with pytest.raises(ValueError, match = "Same_Strand_Ratio"): queue.mergeShards(job)
+    assert not os.path.exists(job.outputFilePath)
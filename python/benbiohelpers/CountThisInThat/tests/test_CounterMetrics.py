@@ -0,0 +1,24 @@
+from benbiohelpers.CountThisInThat.tests.CounterTestHelpers import DyadPositionCounter, getCounterOutput
+
+
+def test_metrics_do_not_change_output(inputFilePaths):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+    DyadPositionCounter(mutationsFilePath, nucleosomesFilePath, str(tmp_path / "counts.tsv"),
+                        encompassingFeatureExtraRadius = 73, suppressOutput = True).count()
+
+    callbackMetrics = list()
+    metrics = DyadPositionCounter(mutationsFilePath, nucleosomesFilePath, str(tmp_path / "counts_with_metrics.tsv"),
+                                  encompassingFeatureExtraRadius = 73, suppressOutput = True,
+                                  metricsCallback = callbackMetrics.append).count()
+
+    assert getCounterOutput(tmp_path / "counts.tsv") == getCounterOutput(tmp_path / "counts_with_metrics.tsv")
+
+    assert metrics["linesRead"] == {"encompassed": 1000, "encompassing": 198}
+    assert metrics["phaseCalls"]["encompassmentHandling"] > 0
+    assert any(phaseName.endswith("(Dyad_Position).getRelevantKey") for phaseName in metrics["phaseTimes"])
+    assert set(metrics["chromosomeTimes"]) == {"chr1", "chr2"}
+    assert metrics["outputCells"] > 0
+
+    # Called once after chr1, once after chr2, and once at the end.
+    assert len(callbackMetrics) == 3
+    assert callbackMetrics[-1] == metrics
@@ -0,0 +1,66 @@
+from benbiohelpers.CountThisInThat.CounterOutputDataHandler import CounterOutputDataHandler
+from benbiohelpers.CountThisInThat.tests.CounterTestHelpers import MutationPositionCounter, DyadPositionCounter, getCounterOutput
+from benbiohelpers.CountThisInThat.InputDataStructures import EncompassedData, ENCOMPASSED_DATA
+
+
+class SlowPathOutputDataHandler(CounterOutputDataHandler):
+    """
+    Overriding countFeature prevents the tolerant fast path from being chosen.
+    """
+    def countFeature(self, encompassedFeature, encompassingFeature, countValue = 1):
+        super().countFeature(encompassedFeature, encompassingFeature, countValue)
+
+
+class SlowPathDyadPositionCounter(DyadPositionCounter):
+
+    def initOutputDataHandler(self):
+        self.outputDataHandler = SlowPathOutputDataHandler(self.writeIncrementally)
+
+
+def test_tolerant_fast_path_matches_slow_path(inputFilePaths):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+
+    fastCounter = DyadPositionCounter(mutationsFilePath, nucleosomesFilePath, str(tmp_path / "fast.tsv"),
+                                      encompassingFeatureExtraRadius = 73, suppressOutput = True)
+    assert fastCounter.outputDataHandler.onEncompassedFeatureInEncompassingFeature == (
+        fastCounter.outputDataHandler.onEncompassedFeatureInEncompassingFeatureTolerant)
+    fastCounter.count()
+
+    slowCounter = SlowPathDyadPositionCounter(mutationsFilePath, nucleosomesFilePath, str(tmp_path / "slow.tsv"),
+                                              encompassingFeatureExtraRadius = 73, suppressOutput = True)
+    assert slowCounter.outputDataHandler.onEncompassedFeatureInEncompassingFeature != (
+        slowCounter.outputDataHandler.onEncompassedFeatureInEncompassingFeatureTolerant)
+    slowCounter.count()
+
+    assert getCounterOutput(tmp_path / "fast.tsv") == getCounterOutput(tmp_path / "slow.tsv")
+
+
+def test_memory_report_tracks_orphaned_dictionaries(inputFilePaths):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+    counter = MutationPositionCounter(mutationsFilePath, nucleosomesFilePath, str(tmp_path / "positions.bed"),
+                                      encompassingFeatureExtraRadius = 73, writeIncrementally = ENCOMPASSED_DATA,
+                                      suppressOutput = True, recordMemorySnapshots = True)
+    counter.count()
+    assert set(counter.memoryReports) == set(counter.memorySnapshots) == {"chr1", "chr2"}
+    assert counter.memoryReports["chr2"]["orphanedDictionaryCount"] == 0
+
+    # Popping features without managing memory leaves their dictionaries behind.
+    outputDataHandler = CounterOutputDataHandler(ENCOMPASSED_DATA)
+    outputDataHandler.addEncompassedFeatureStratifier()
+    outputDataHandler.addPlaceholderStratifier()
+    features = [EncompassedData(f"chr1\t{i}\t{i+1}\t.\t.\t+", None) for i in range(100)]
+    for feature in features: outputDataHandler.outputDataStratifiers[0].attemptAddKey(feature)
+    report = outputDataHandler.getMemoryReport()
+    assert report["orphanedDictionaryCount"] == 0 and report["keys"] > 0
+
+    for feature in features[:50]:
+        outputDataHandler.outputDataStructure.pop(feature)
+        outputDataHandler.outputDataStratifiers[0].removeKey(feature)
+    report = outputDataHandler.getMemoryReport()
+    assert report["orphanedDictionaryCount"] == 50 and report["orphanedDictionaries"] > 0
+
+    outputDataHandler.outputDataStratifiers[0].manageMemory()
+    managedReport = outputDataHandler.getMemoryReport()
+    assert managedReport["orphanedDictionaryCount"] == 0
+    assert managedReport["total"] < report["total"]
+    assert managedReport["total"] == sum(size for category, size in managedReport.items() if category not in ("total", "orphanedDictionaryCount"))
@@ -0,0 +1,95 @@
+import pytest
+from benbiohelpers.CountThisInThat.tests.CounterTestHelpers import DyadPositionCounter, MutationPositionCounter, StrandRatioCounter
+from benbiohelpers.CountThisInThat.DeltaCounting import writeCounterConfiguration
+from benbiohelpers.CountThisInThat.CountDerivatives import sumOfColumns
+
+
+class SummedStrandsCounter(DyadPositionCounter):
+
+    def setupOutputDataWriter(self):
+        self.outputDataHandler.createOutputDataWriter(self.outputFilePath,
+                                                      countDerivatives = [sumOfColumns("Both_Strands_Counts", True, False)])
+
+
+def splitMutations(mutationsFilePath, tmp_path):
+    """
+    Splits the mutations into an "old" file and a "new" file (every third mutation), both still sorted.
+    """
+    with open(mutationsFilePath, 'r') as mutationsFile: lines = mutationsFile.readlines()
+    oldMutationsFilePath, newMutationsFilePath = str(tmp_path / "old_mutations.bed"), str(tmp_path / "new_mutations.bed")
+    with open(oldMutationsFilePath, 'w') as oldMutationsFile, open(newMutationsFilePath, 'w') as newMutationsFile:
+        for i, line in enumerate(lines): (newMutationsFile if i % 3 == 0 else oldMutationsFile).write(line)
+    return oldMutationsFilePath, newMutationsFilePath
+
+
+@pytest.mark.parametrize("counterClass", [DyadPositionCounter, SummedStrandsCounter, MutationPositionCounter])
+def test_delta_counts_match_full_recount(inputFilePaths, counterClass):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+    oldMutationsFilePath, newMutationsFilePath = splitMutations(mutationsFilePath, tmp_path)
+
+    counter = counterClass(oldMutationsFilePath, nucleosomesFilePath, str(tmp_path / "table.tsv"),
+                           encompassingFeatureExtraRadius = 73, suppressOutput = True)
+    counter.count()
+    writeCounterConfiguration(counter)
+
+    counterClass(newMutationsFilePath, nucleosomesFilePath, str(tmp_path / "delta.tsv"),
+                 encompassingFeatureExtraRadius = 73, suppressOutput = True).countDelta(str(tmp_path / "table.tsv"))
+    counterClass(mutationsFilePath, nucleosomesFilePath, str(tmp_path / "full.tsv"),
+                 encompassingFeatureExtraRadius = 73, suppressOutput = True).count()
+
+    with open(tmp_path / "table.tsv") as tableFile, open(tmp_path / "full.tsv") as fullFile:
+        tableLines, fullLines = tableFile.readlines(), fullFile.readlines()
+    assert len(tableLines) > 1
+    if counterClass is not MutationPositionCounter: assert tableLines == fullLines
+    else:
+        # Features at the same position (but on different strands) may be written in either order.
+        assert [line.split('(')[0] for line in tableLines] == [line.split('(')[0] for line in fullLines]
+        assert sorted(tableLines) == sorted(fullLines)
+
+
+def test_delta_counting_rejects_mismatched_configuration(inputFilePaths):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+    oldMutationsFilePath, newMutationsFilePath = splitMutations(mutationsFilePath, tmp_path)
+
+    counter = DyadPositionCounter(oldMutationsFilePath, nucleosomesFilePath, str(tmp_path / "table.tsv"),
+                                  encompassingFeatureExtraRadius = 73, suppressOutput = True)
+    counter.count()
+    writeCounterConfiguration(counter)
+    with open(tmp_path / "table.tsv") as tableFile: originalLines = tableFile.readlines()
+
+    with pytest.raises(ValueError, match = "counterClass"):
+        MutationPositionCounter(newMutationsFilePath, nucleosomesFilePath, str(tmp_path / "delta.tsv"),
+                                encompassingFeatureExtraRadius = 73, suppressOutput = True).countDelta(str(tmp_path / "table.tsv"))
+    with open(tmp_path / "table.tsv") as tableFile: assert tableFile.readlines() == originalLines
+
+
+@pytest.mark.parametrize("counterArguments, mismatchedKey", [({"countWeightColumn": 1}, "countWeightColumn"),
+                                                              ({"acceptableChromosomes": ["chr1"]}, "acceptableChromosomes")])
+def test_delta_counting_rejects_mismatched_counting_options(inputFilePaths, counterArguments, mismatchedKey):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+    oldMutationsFilePath, newMutationsFilePath = splitMutations(mutationsFilePath, tmp_path)
+
+    counter = DyadPositionCounter(oldMutationsFilePath, nucleosomesFilePath, str(tmp_path / "table.tsv"),
+                                  encompassingFeatureExtraRadius = 73, suppressOutput = True)
+    counter.count()
+    writeCounterConfiguration(counter)
+
+    with pytest.raises(ValueError, match = mismatchedKey):
+        DyadPositionCounter(newMutationsFilePath, nucleosomesFilePath, str(tmp_path / "delta.tsv"), encompassingFeatureExtraRadius = 73,
+                            suppressOutput = True, **counterArguments).countDelta(str(tmp_path / "table.tsv"))
+
+
+def test_delta_counting_rejects_non_sum_derivatives(inputFilePaths):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+    oldMutationsFilePath, newMutationsFilePath = splitMutations(mutationsFilePath, tmp_path)
+
+    counter = StrandRatioCounter(oldMutationsFilePath, nucleosomesFilePath, str(tmp_path / "table.tsv"),
+                                 encompassingFeatureExtraRadius = 73, suppressOutput = True)
+    counter.count()
+    writeCounterConfiguration(counter)
+    with open(tmp_path / "table.tsv") as tableFile: originalLines = tableFile.readlines()
+
+    with pytest.raises(ValueError, match = "Same_Strand_Ratio"):
+        StrandRatioCounter(newMutationsFilePath, nucleosomesFilePath, str(tmp_path / "delta.tsv"),
+                           encompassingFeatureExtraRadius = 73, suppressOutput = True).countDelta(str(tmp_path / "table.tsv"))
+    with open(tmp_path / "table.tsv") as tableFile: assert tableFile.readlines() == originalLines
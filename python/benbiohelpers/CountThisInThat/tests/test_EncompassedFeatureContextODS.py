@@ -0,0 +1,35 @@
+from benbiohelpers.CountThisInThat.CounterOutputDataHandler import CounterOutputDataHandler
+from benbiohelpers.CountThisInThat.InputDataStructures import EncompassedDataWithContext
+from benbiohelpers.DNA_SequenceHandling import encodeSequence, decodeSequence
+
+
+def getContextStratifier(contextSize, includeAlteredTo):
+    outputDataHandler = CounterOutputDataHandler(0)
+    outputDataHandler.addEncompassedFeatureContextStratifier(contextSize, includeAlteredTo, "Context")
+    return outputDataHandler.outputDataStratifiers[0]
+
+
+def getMutation(context, alteredTo):
+    return EncompassedDataWithContext(f"chr1\t10\t11\t{context}\t{alteredTo}\t+\n", None)
+
+
+def test_sequence_encoding_round_trips():
+    for sequence in ("", "A", "AAA", "ACGT", "TTTTTTTT"):
+        assert decodeSequence(encodeSequence(sequence)) == sequence
+    assert encodeSequence("A") != encodeSequence("AA")
+    assert encodeSequence("ANA") is None
+
+
+def test_context_keys_are_integers_formatted_for_output():
+    contextStratifier = getContextStratifier(3, True)
+    key = contextStratifier.getRelevantKey(getMutation("GACGT", "T"))
+    assert isinstance(key, int)
+    assert contextStratifier.getRelevantKey(getMutation("CACGG", "T")) == key
+    assert contextStratifier.getKey("ACG>T") == key
+    assert contextStratifier.formatKeyForOutput(key) == "ACG>T"
+
+
+def test_non_ACGT_contexts_fall_back_to_strings_and_sort_together():
+    contextStratifier = getContextStratifier(3, False)
+    for context in ("TTT", "ANA", "CCC", "AAA"): contextStratifier.getRelevantKey(getMutation(context, "T"))
+    assert contextStratifier.getKeysForOutput(formatted = True) == ["AAA", "ANA", "CCC", "TTT"]
@@ -0,0 +1,47 @@
+import random
+from benbiohelpers.CountThisInThat.CounterOutputDataHandler import CounterOutputDataHandler
+from benbiohelpers.CountThisInThat.InputDataStructures import EncompassedData, EncompassingData
+from benbiohelpers.CountThisInThat.OutputDataStratifiers import sortPositionIDs, getNaturalChromosomeSortKey
+
+
+def test_sort_position_ids():
+    positionIDs = ["chr2:5-9(+)", "chr10:1-3(-)", "chr1:5-7(+)", "chr1:5-6(-)", "chr1:10-11(+)"]
+    assert sortPositionIDs(list(positionIDs)) == ["chr1:5-6(-)", "chr1:5-7(+)", "chr1:10-11(+)", "chr10:1-3(-)", "chr2:5-9(+)"]
+    assert sortPositionIDs(list(positionIDs), naturalChromosomeOrder = True) == [
+        "chr1:5-6(-)", "chr1:5-7(+)", "chr1:10-11(+)", "chr2:5-9(+)", "chr10:1-3(-)"]
+
+    assert sortPositionIDs(["chr1:10.5(+)", "chr1:2.0(-)"]) == ["chr1:2.0(-)", "chr1:10.5(+)"]
+    assert sortPositionIDs([("chr2", 1, 4, '+'), ("chr1", 3, 9, '+'), ("chr1", 3, 5, '-')]) == [
+        ("chr1", 3, 5, '-'), ("chr1", 3, 9, '+'), ("chr2", 1, 4, '+')]
+    assert sortPositionIDs([]) == []
+
+
+def test_natural_chromosome_sort_key():
+    chromosomes = ["chrX", "chr10", "chrM", "chr2", "chr1", "chr1_random", "scaffold_12", "scaffold_3"]
+    assert sorted(chromosomes, key = getNaturalChromosomeSortKey) == [
+        "chr1", "chr1_random", "chr2", "chr10", "chrM", "chrX", "scaffold_3", "scaffold_12"]
+
+
+def test_feature_keys_sort_like_comparison_operators():
+    random.seed(1)
+    outputDataHandler = CounterOutputDataHandler(0)
+    outputDataHandler.addEncompassedFeatureStratifier()
+    outputDataHandler.addEncompassingFeatureStratifier()
+    encompassedStratifier, encompassingStratifier = outputDataHandler.outputDataStratifiers
+
+    for _ in range(200):
+        chromosome = random.choice(("chr1", "chr2", "chr10"))
+        start = random.randint(0, 1000)
+        encompassedStratifier.attemptAddKey(EncompassedData(f"{chromosome}\t{start}\t{start+1}\t.\t.\t{random.choice('+-')}", None))
+        encompassingStratifier.attemptAddKey(
+            EncompassingData(f"{chromosome}\t{start}\t{start+random.randint(1,100)}\t.\t.\t+", None))
+
+    for stratifier in (encompassedStratifier, encompassingStratifier):
+        sortedKeys = stratifier.getKeysForOutput()
+        assert len(sortedKeys) == len(stratifier.allKeys)
+        assert all(not sortedKeys[i+1] < sortedKeys[i] for i in range(len(sortedKeys) - 1))
+
+        stratifier.naturalChromosomeOrder = True
+        stratifier.sortedKeys = None
+        assert [key.chromosome for key in stratifier.getKeysForOutput()] == sorted(
+            (key.chromosome for key in sortedKeys), key = getNaturalChromosomeSortKey)
@@ -0,0 +1,73 @@
+from benbiohelpers.CountThisInThat.tests.CounterTestHelpers import DyadPositionCounter, getCounterOutput
+from benbiohelpers.CountThisInThat.CounterOutputDataHandler import AmbiguityHandling
+from benbiohelpers.CountThisInThat.ResamplingStatistics import PermutationNullModel
+import pytest
+
+
+class BinnedDyadPositionCounter(DyadPositionCounter):
+
+    def setupOutputDataStratifiers(self):
+        self.outputDataHandler.addRelativePositionStratifier(self.currentEncompassingFeature, extraRangeRadius = self.encompassingFeatureExtraRadius,
+                                                             outputName = "Binned_Dyad_Position", binSize = 10)
+        self.outputDataHandler.addStrandComparisonStratifier(strandAmbiguityHandling = AmbiguityHandling.tolerate)
+
+
+@pytest.mark.parametrize("counterClass", [DyadPositionCounter, BinnedDyadPositionCounter])
+def test_observed_counts_match_counter(inputFilePaths, counterClass):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+    counterClass(mutationsFilePath, nucleosomesFilePath, str(tmp_path / "counts.tsv"),
+                 encompassingFeatureExtraRadius = 73, suppressOutput = True).count()
+    counterOutput = getCounterOutput(tmp_path / "counts.tsv")
+
+    nullModel = PermutationNullModel(counterClass(mutationsFilePath, nucleosomesFilePath, str(tmp_path / "unused.tsv"),
+                                                  encompassingFeatureExtraRadius = 73, suppressOutput = True),
+                                     permutations = 5, seed = 1)
+    summary = nullModel.summarize()
+    observedCounts = {(str(dyadPosition), str(strandComparison)): observed
+                      for (dyadPosition, strandComparison), (observed, _, _) in summary.items()}
+
+    # Every cell in the null model's summary should be one of the counter's output cells.
+    assert {dyadPosition for dyadPosition, _ in observedCounts} <= {dyadPosition for dyadPosition, _ in counterOutput}
+    for key, count in counterOutput.items(): assert observedCounts.get(key, 0) == count
+
+
+def test_seeded_permutations_are_reproducible(inputFilePaths):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+    permutedCounts = list()
+    for _ in range(2):
+        nullModel = PermutationNullModel(DyadPositionCounter(mutationsFilePath, nucleosomesFilePath, str(tmp_path / "unused.tsv"),
+                                                             encompassingFeatureExtraRadius = 73, suppressOutput = True),
+                                         permutations = 5, seed = 42)
+        nullModel.run()
+        permutedCounts.append(nullModel.summarize())
+    assert permutedCounts[0] == permutedCounts[1]
+
+
+def test_masked_regions_are_never_used(inputFilePaths):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+    maskedRegionsFilePath = tmp_path / "masked.bed"
+    with open(maskedRegionsFilePath, 'w') as maskedRegionsFile:
+        for chromosome in ("chr1", "chr2"): maskedRegionsFile.write(f"{chromosome}\t0\t15000\n")
+
+    nullModel = PermutationNullModel(DyadPositionCounter(mutationsFilePath, nucleosomesFilePath, str(tmp_path / "unused.tsv"),
+                                                         encompassingFeatureExtraRadius = 73, suppressOutput = True),
+                                     permutations = 10, seed = 3, maskedRegionsFilePath = str(maskedRegionsFilePath))
+    for chromosome in ("chr1", "chr2"):
+        for _ in range(10): assert nullModel.getRandomPositions(chromosome).min() >= 15000
+
+
+def test_bootstrap_observed_counts_match_counter(inputFilePaths):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+    counter = DyadPositionCounter(mutationsFilePath, nucleosomesFilePath, str(tmp_path / "counts.tsv"),
+                                  encompassingFeatureExtraRadius = 73, suppressOutput = True, bootstrapIterations = 50, bootstrapSeed = 5)
+    counter.count()
+    counterOutput = getCounterOutput(tmp_path / "counts.tsv")
+
+    with open(counter.getBootstrapFilePath(), 'r') as bootstrapFile:
+        headers = bootstrapFile.readline().strip().split('\t')
+        assert headers[2:] == ["Observed_Counts", "Bootstrap_Mean", "Bootstrap_Quantile_0.025",
+                               "Bootstrap_Quantile_0.5", "Bootstrap_Quantile_0.975"]
+        for line in bootstrapFile:
+            dyadPosition, strandComparison, observed, _, lowerBound, _, upperBound = line.strip().split('\t')
+            assert int(observed) == counterOutput[(dyadPosition, strandComparison)]
+            assert float(lowerBound) <= float(upperBound)
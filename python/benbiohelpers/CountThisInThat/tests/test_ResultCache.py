@@ -0,0 +1,67 @@
+from benbiohelpers.CountThisInThat.tests.CounterTestHelpers import DyadPositionCounter, RecordedBinnedPositionCounter
+from benbiohelpers.CountThisInThat.ColumnarOutput import loadColumnarTable
+from benbiohelpers.CountThisInThat.CountDerivatives import sumOfColumns, mirroredSum
+from benbiohelpers.CountThisInThat.ResultCache import describeCallable
+import os, subprocess, sys
+
+
+def countWithCache(counterClass, mutationsFilePath, nucleosomesFilePath, outputFilePath, cacheDirectory, **counterAttributes):
+    counter = counterClass.__new__(counterClass)
+    counter.__dict__.update(counterAttributes)
+    counter.__init__(mutationsFilePath, nucleosomesFilePath, str(outputFilePath), encompassingFeatureExtraRadius = 73, suppressOutput = True)
+    return counter.countWithCache(cacheDirectory)
+
+
+def test_repeated_counts_use_cache(inputFilePaths):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+    cacheDirectory = tmp_path / "cache"
+
+    assert not countWithCache(DyadPositionCounter, mutationsFilePath, nucleosomesFilePath, tmp_path / "first.tsv", cacheDirectory)
+    assert countWithCache(DyadPositionCounter, mutationsFilePath, nucleosomesFilePath, tmp_path / "second.tsv", cacheDirectory)
+    with open(tmp_path / "first.tsv") as firstFile, open(tmp_path / "second.tsv") as secondFile:
+        firstLines = firstFile.readlines()
+        assert len(firstLines) > 1
+        assert secondFile.readlines() == firstLines
+
+    # Columnar tables are cached separately, and copied as whole directories.
+    assert not countWithCache(DyadPositionCounter, mutationsFilePath, nucleosomesFilePath, tmp_path / "first.columnar", cacheDirectory)
+    assert countWithCache(DyadPositionCounter, mutationsFilePath, nucleosomesFilePath, tmp_path / "second.columnar", cacheDirectory)
+    assert len(loadColumnarTable(tmp_path / "second.columnar")) == len(firstLines) - 1
+
+
+def test_cache_distinguishes_configurations_and_inputs(inputFilePaths):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+    cacheDirectory = tmp_path / "cache"
+
+    assert not countWithCache(RecordedBinnedPositionCounter, mutationsFilePath, nucleosomesFilePath, tmp_path / "binned.tsv",
+                              cacheDirectory, binSize = 20)
+    assert not countWithCache(RecordedBinnedPositionCounter, mutationsFilePath, nucleosomesFilePath, tmp_path / "binned.tsv",
+                              cacheDirectory, binSize = 10)
+    assert not countWithCache(DyadPositionCounter, mutationsFilePath, nucleosomesFilePath, tmp_path / "dyad.tsv", cacheDirectory)
+    assert countWithCache(RecordedBinnedPositionCounter, mutationsFilePath, nucleosomesFilePath, tmp_path / "binned.tsv",
+                          cacheDirectory, binSize = 20)
+
+    # Changing the contents of an input invalidates its cached outputs.
+    with open(mutationsFilePath, 'r') as mutationsFile: lines = mutationsFile.readlines()
+    with open(mutationsFilePath, 'w') as mutationsFile: mutationsFile.writelines(lines[1:])
+    assert not countWithCache(RecordedBinnedPositionCounter, mutationsFilePath, nucleosomesFilePath, tmp_path / "binned.tsv",
+                              cacheDirectory, binSize = 20)
+
+
+DESCRIBE_COUNT_DERIVATIVES = """
+from benbiohelpers.CountThisInThat.CountDerivatives import sumOfColumns, mirroredSum
+from benbiohelpers.CountThisInThat.ResultCache import describeCallable
+print(describeCallable(sumOfColumns("Both_Strands_Counts", True, False).function))
+print(describeCallable(mirroredSum("Aligned_Strands_Counts", True, False).function))
+"""
+
+
+def test_count_derivative_descriptions_match_across_processes():
+    descriptions = [describeCallable(sumOfColumns("Both_Strands_Counts", True, False).function),
+                    describeCallable(mirroredSum("Aligned_Strands_Counts", True, False).function)]
+    assert all("0x" not in description for description in descriptions)
+
+    for hashSeed in ("1", "2"):
+        result = subprocess.run([sys.executable, "-c", DESCRIBE_COUNT_DERIVATIVES], capture_output = True, text = True, check = True,
+                                env = {**os.environ, "PYTHONHASHSEED": hashSeed})
+        assert result.stdout.split('\n')[:2] == descriptions
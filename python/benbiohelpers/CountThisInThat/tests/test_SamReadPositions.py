@@ -0,0 +1,74 @@
+import gzip, random
+import pytest
+from benbiohelpers.CountThisInThat.tests.CounterTestHelpers import DyadPositionCounter
+from benbiohelpers.CountThisInThat.SamReadPositions import (SamReadPositionReader, getReferenceLength,
+                                                            FIVE_PRIME, THREE_PRIME, MIDPOINT)
+from benbiohelpers.CustomErrors import UnsortedInputError
+
+
+def writeSamFile(samFilePath, reads, sortReads = True):
+    """
+    Writes the given (chromosome, 0-based start, cigar string, flag) reads to a sam file, sorted by start position unless
+    sortReads is False.
+    """
+    if sortReads: reads = sorted(reads, key = lambda read: read[:2])
+    openFunction = gzip.open if str(samFilePath).endswith(".gz") else open
+    with openFunction(samFilePath, 'wt') as samFile:
+        samFile.write("@HD\tVN:1.6\tSO:coordinate\n@SQ\tSN:chr1\tLN:25000\n@SQ\tSN:chr2\tLN:25000\n")
+        for i, (chromosome, start, cigarString, flag) in enumerate(reads):
+            samFile.write(f"read{i}\t{flag}\t{chromosome}\t{start+1}\t42\t{cigarString}\t*\t0\t0\tACGT\tIIII\n")
+
+
+def test_get_reference_length():
+    assert getReferenceLength("25M") == 25
+    assert getReferenceLength("3S10M2D4M1I5M100N2M4H") == 123
+
+
+@pytest.mark.parametrize("readPosition, expectedPositions", [
+    (FIVE_PRIME, [("chr1", 100, 101, '+'), ("chr1", 109, 110, '-'), ("chr1", 109, 110, '-'), ("chr2", 54, 55, '-')]),
+    (THREE_PRIME, [("chr1", 100, 101, '-'), ("chr1", 104, 105, '-'), ("chr1", 109, 110, '+'), ("chr2", 50, 51, '-')]),
+    (MIDPOINT, [("chr1", 100, 110, '+'), ("chr1", 100, 110, '-'), ("chr1", 104, 110, '-'), ("chr2", 50, 55, '-')])
+])
+def test_read_positions(tmp_path, readPosition, expectedPositions):
+    # Unmapped reads and secondary alignments are skipped.
+    reads = [("chr1", 100, "10M", 0), ("chr1", 100, "2S10M", 16), ("chr1", 104, "3M2I3M", 16), ("chr1", 200, "4M", 4),
+             ("chr1", 300, "4M", 256), ("chr2", 50, "5M", 16)]
+    writeSamFile(tmp_path / "reads.sam.gz", reads)
+
+    with SamReadPositionReader(tmp_path / "reads.sam.gz", readPosition) as reader:
+        positions = [(choppedUpLine[0], int(choppedUpLine[1]), int(choppedUpLine[2]), choppedUpLine[5])
+                     for choppedUpLine in (line.strip().split('\t') for line in reader)]
+        assert reader.readsSkipped == 2
+    assert positions == expectedPositions
+
+
+def test_unsorted_reads_are_rejected(tmp_path):
+    writeSamFile(tmp_path / "reads.sam", [("chr1", 100, "10M", 0), ("chr1", 50, "10M", 0)], sortReads = False)
+    with SamReadPositionReader(tmp_path / "reads.sam") as reader:
+        with pytest.raises(UnsortedInputError): list(reader)
+
+
+def test_counts_match_bed_input(inputFilePaths):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+
+    # Create reads whose 5' ends are the mutation positions, with lengths that reorder the 5' ends of minus strand reads.
+    randomNumberGenerator = random.Random(3)
+    reads = list()
+    with open(mutationsFilePath, 'r') as mutationsFile:
+        for line in mutationsFile:
+            chromosome, start, _, _, _, strand = line.strip().split('\t')
+            readLength = min(randomNumberGenerator.randint(10, 30), int(start) + 1)
+            if strand == '+': reads.append((chromosome, int(start), f"{readLength}M", 0))
+            else: reads.append((chromosome, int(start) - readLength + 1, f"{readLength}M", 16))
+    writeSamFile(tmp_path / "reads.sam", reads)
+
+    DyadPositionCounter(mutationsFilePath, nucleosomesFilePath, str(tmp_path / "bed_counts.tsv"),
+                        encompassingFeatureExtraRadius = 73, suppressOutput = True).count()
+    with SamReadPositionReader(tmp_path / "reads.sam", FIVE_PRIME) as reader:
+        DyadPositionCounter(reader, nucleosomesFilePath, str(tmp_path / "sam_counts.tsv"),
+                            encompassingFeatureExtraRadius = 73, suppressOutput = True).count()
+
+    with open(tmp_path / "bed_counts.tsv") as bedCountsFile, open(tmp_path / "sam_counts.tsv") as samCountsFile:
+        bedCountsLines = bedCountsFile.readlines()
+        assert len(bedCountsLines) > 1
+        assert samCountsFile.readlines() == bedCountsLines
@@ -0,0 +1,32 @@
+from benbiohelpers.CountThisInThat.tests.CounterTestHelpers import (DyadPositionCounter, MutationPositionCounter,
+                                                                    RecordedStrandAmbiguityCounter, RecordedBinnedPositionCounter)
+from benbiohelpers.CountThisInThat.SharedParseCounter import SharedParseCounter, CounterConfiguration
+from benbiohelpers.CountThisInThat.InputDataStructures import ENCOMPASSED_DATA
+
+
+def test_shared_parse_matches_individual_counters(inputFilePaths):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+    configurations = {
+        "dyad": (DyadPositionCounter, dict()),
+        "positions": (MutationPositionCounter, dict(writeIncrementally = ENCOMPASSED_DATA)),
+        "recorded": (RecordedStrandAmbiguityCounter, dict()),
+        "binned": (RecordedBinnedPositionCounter, dict(binSize = 20)),
+    }
+
+    SharedParseCounter(mutationsFilePath, nucleosomesFilePath,
+                       [CounterConfiguration(counterClass, str(tmp_path / f"shared_{name}.tsv"), **counterAttributes)
+                        for name, (counterClass, counterAttributes) in configurations.items()],
+                       encompassingFeatureExtraRadius = 73, suppressOutput = True).count()
+
+    for name, (counterClass, counterAttributes) in configurations.items():
+        counter = counterClass.__new__(counterClass)
+        counter.__dict__.update(counterAttributes) # Set any attributes needed before the constructor sets up the output data handler.
+        counter.__init__(mutationsFilePath, nucleosomesFilePath, str(tmp_path / f"individual_{name}.tsv"),
+                         encompassingFeatureExtraRadius = 73, suppressOutput = True,
+                         writeIncrementally = counterAttributes.get("writeIncrementally", 0))
+        counter.count()
+
+        with open(tmp_path / f"shared_{name}.tsv") as sharedFile, open(tmp_path / f"individual_{name}.tsv") as individualFile:
+            sharedLines = sharedFile.readlines()
+            assert len(sharedLines) > 1
+            assert sharedLines == individualFile.readlines()
@@ -0,0 +1,128 @@
+from benbiohelpers.CountThisInThat.tests.CounterTestHelpers import DyadPositionCounter, getCounterOutput
+from benbiohelpers.CountThisInThat.SketchCounting import (SketchCounterOutputDataHandler, HeavyHitters, CountMinSketch,
+                                                          countTopKExactly)
+import os, subprocess, sys
+
+
+class SketchDyadPositionCounter(DyadPositionCounter):
+
+    def __init__(self, *args, relativeError = 0.0001, topK = 1000, **kwargs):
+        self.relativeError = relativeError
+        self.topK = topK
+        super().__init__(*args, **kwargs)
+
+    def initOutputDataHandler(self):
+        self.outputDataHandler = SketchCounterOutputDataHandler(relativeError = self.relativeError, topK = self.topK)
+
+
+def getSketchOutput(outputFilePath):
+    with open(outputFilePath, 'r') as outputFile:
+        assert outputFile.readline().strip().split('\t') == ["Dyad_Position", "Strand_Comparison", "Approximate_Count", "Max_Overcount"]
+        return {(position, strandComparison): (int(count), int(overcount))
+                for position, strandComparison, count, overcount in (line.strip().split('\t') for line in outputFile)}
+
+
+def getExactPassOutput(outputFilePath):
+    with open(outputFilePath, 'r') as outputFile:
+        assert outputFile.readline().strip().split('\t') == ["Dyad_Position", "Strand_Comparison", "Approximate_Count",
+                                                             "Max_Overcount", "Exact_Count"]
+        return [((position, strandComparison), int(count), int(overcount), int(exactCount))
+                for position, strandComparison, count, overcount, exactCount in (line.strip().split('\t') for line in outputFile)]
+
+
+def getExactCounts(inputFilePaths):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+    DyadPositionCounter(mutationsFilePath, nucleosomesFilePath, str(tmp_path / "exact.tsv"),
+                        encompassingFeatureExtraRadius = 73, suppressOutput = True).count()
+    return {key: count for key, count in getCounterOutput(tmp_path / "exact.tsv").items() if count > 0}
+
+
+def test_sketch_counts_are_exact_when_all_keys_fit(inputFilePaths):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+    exactCounts = getExactCounts(inputFilePaths)
+
+    counter = SketchDyadPositionCounter(mutationsFilePath, nucleosomesFilePath, str(tmp_path / "sketch.tsv"),
+                                        encompassingFeatureExtraRadius = 73, suppressOutput = True)
+    counter.count()
+    sketchCounts = getSketchOutput(tmp_path / "sketch.tsv")
+
+    assert {key: count for key, (count, _) in sketchCounts.items()} == exactCounts
+    assert all(overcount == 0 for _, overcount in sketchCounts.values())
+    counts = [count for count, _ in sketchCounts.values()]
+    assert counts == sorted(counts, reverse = True)
+    assert counter.outputDataHandler.sketch.totalCount == sum(counts)
+
+
+def test_sketch_counts_are_bounded_with_few_tracked_keys(inputFilePaths):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+    exactCounts = getExactCounts(inputFilePaths)
+
+    counter = SketchDyadPositionCounter(mutationsFilePath, nucleosomesFilePath, str(tmp_path / "sketch.tsv"),
+                                        encompassingFeatureExtraRadius = 73, suppressOutput = True, relativeError = 0.02, topK = 10)
+    counter.count()
+    sketchCounts = getSketchOutput(tmp_path / "sketch.tsv")
+
+    # The heavy hitters' true counts are within their reported overcounts.
+    assert len(sketchCounts) == 10
+    for key, (count, overcount) in sketchCounts.items():
+        assert count - overcount <= exactCounts.get(key, 0) <= count
+
+    # Sketch estimates never undercount, and rarely exceed the error bound.
+    outputDataHandler: SketchCounterOutputDataHandler = counter.outputDataHandler
+    dyadPositionODS, strandComparisonODS = outputDataHandler.outputDataStratifiers
+    keysByName = {(dyadPositionODS.formatKeyForOutput(position), strandComparisonODS.formatKeyForOutput(strandComparison)):
+                  (position, strandComparison) for position in dyadPositionODS.allKeys for strandComparison in strandComparisonODS.allKeys}
+    errorBound = outputDataHandler.getErrorBound()
+    exceedingBound = 0
+    for key, count in exactCounts.items():
+        estimate = outputDataHandler.getApproximateCount(keysByName[key])
+        assert estimate >= count
+        if estimate > count + errorBound: exceedingBound += 1
+    assert exceedingBound <= 0.05 * len(exactCounts)
+
+
+def test_exact_pass_counts_top_k_exactly(inputFilePaths):
+    mutationsFilePath, nucleosomesFilePath, tmp_path = inputFilePaths
+    exactCounts = getExactCounts(inputFilePaths)
+
+    counter = countTopKExactly(lambda: SketchDyadPositionCounter(mutationsFilePath, nucleosomesFilePath, str(tmp_path / "sketch.tsv"),
+                                                                 encompassingFeatureExtraRadius = 73, suppressOutput = True,
+                                                                 relativeError = 0.02, topK = 10))
+    exactPassOutput = getExactPassOutput(tmp_path / "sketch.tsv")
+
+    assert len(exactPassOutput) == 10
+    for key, count, overcount, exactCount in exactPassOutput:
+        assert exactCount == exactCounts.get(key, 0)
+        assert count - overcount <= exactCount <= count
+    exactPassCounts = [exactCount for _, _, _, exactCount in exactPassOutput]
+    assert exactPassCounts == sorted(exactPassCounts, reverse = True)
+
+    # The exact pass doesn't add to the first pass's sketch.
+    assert counter.outputDataHandler.sketch.totalCount == sum(exactCounts.values())
+
+
+def test_heavy_hitters_guarantee_frequent_keys():
+    heavyHitters = HeavyHitters(topK = 5)
+    for i in range(1000):
+        heavyHitters.add("frequent" if i % 3 == 0 else i)
+    assert heavyHitters.getSortedKeys()[0] == "frequent"
+    count, overcount = heavyHitters.counts["frequent"], heavyHitters.overcounts["frequent"]
+    assert count - overcount <= 334 <= count
+
+
+GET_SKETCH_COLUMNS = """
+from benbiohelpers.CountThisInThat.SketchCounting import CountMinSketch
+print(CountMinSketch(seed = 3).getColumns(("chr1:100(+)", 16, True, None)))
+"""
+
+
+def test_sketch_columns_match_across_processes():
+    sketch = CountMinSketch(seed = 3)
+    columns = sketch.getColumns(("chr1:100(+)", 16, True, None))
+    assert sketch.getColumns(("chr1:100(+)", 16.0, True, None)) == columns
+    assert sketch.getColumns(("chr1:100(-)", 16, True, None)) != columns
+
+    for hashSeed in ("1", "2"):
+        result = subprocess.run([sys.executable, "-c", GET_SKETCH_COLUMNS], capture_output = True, text = True, check = True,
+                                env = {**os.environ, "PYTHONHASHSEED": hashSeed})
+        assert result.stdout.strip() == str(columns)
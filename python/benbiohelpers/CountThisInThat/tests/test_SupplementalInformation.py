@@ -0,0 +1,30 @@
+from benbiohelpers.CountThisInThat.InputDataStructures import EncompassedDataWithContext, TfbsData
+from benbiohelpers.CountThisInThat.SupplementalInformation import TfbsSupInfoHandler, BaseInEncompassingSequenceSupInfoHandler
+
+
+def test_sequence_is_formatted_from_longest_encompassing_feature():
+    handler = BaseInEncompassingSequenceSupInfoHandler()
+    mutation = EncompassedDataWithContext("chr1\t14\t15\tC\tT\t+", None)
+    shortTfbs = TfbsData("chr1\t12\t18\t.\tAACAAA\t+\tTF_1", None)
+    longTfbs = TfbsData("chr1\t10\t20\t.\tGGGGCGGGGG\t+\tTF_2", None)
+
+    info = handler.initializeSupplementalInfo()
+    assert handler.getFormattedOutput(info) == ''
+    info = handler.updateSupplementalInfo(info, mutation, shortTfbs)
+    assert handler.getFormattedOutput(info) == "aaCaaa"
+    info = handler.updateSupplementalInfo(info, mutation, longTfbs)
+    info = handler.updateSupplementalInfo(info, mutation, shortTfbs)
+    # Only a reference to the sequence is stored until the information is formatted.
+    assert info[1] is longTfbs.sequence
+    assert handler.getFormattedOutput(info) == "ggggCggggg"
+
+
+def test_tfbs_labels_are_shared():
+    handler = TfbsSupInfoHandler()
+    mutation = EncompassedDataWithContext("chr1\t14\t15\tC\tT\t+", None)
+    firstInfo = handler.updateSupplementalInfo(handler.initializeSupplementalInfo(), mutation,
+                                               TfbsData("chr1\t10\t20\t.\tGGGGCGGGGG\t+\tTF_2", None))
+    secondInfo = handler.updateSupplementalInfo(handler.initializeSupplementalInfo(), mutation,
+                                                TfbsData("chr1\t12\t18\t.\tAACAAA\t+\tTF_2", None))
+    assert next(iter(firstInfo)) is next(iter(secondInfo))
+    assert handler.getFormattedOutput(firstInfo) == "TF_2+"
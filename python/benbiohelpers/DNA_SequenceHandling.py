@@ -17,4 +17,31 @@ def reverseCompliment(DNA):
 def reverseComplement(DNA): return reverseCompliment(DNA)
 
 #Determines whether or not a given base is a purine.
-def isPurine(nucleotide: str): return (nucleotide.upper() == "G" or nucleotide.upper() == "A")
\ No newline at end of file
+def isPurine(nucleotide: str): return (nucleotide.upper() == "G" or nucleotide.upper() == "A")
+
+# Dictionaries for converting between bases and their 2-bit integer representations.
+baseToBits = {'A':0,'C':1,'G':2,'T':3}
+bitsToBase = "ACGT"
+
+def encodeSequence(DNA: str):
+    """
+    Encodes the given (uppercase, ACGT-only) sequence as an integer using 2 bits per base.
+    A leading 1 bit is included so that sequences of different lengths (or with leading 'A's) remain distinct.
+    Returns None if the sequence contains any other characters.
+    """
+    code = 1
+    for base in DNA:
+        bits = baseToBits.get(base)
+        if bits is None: return None
+        code = (code << 2) | bits
+    return code
+
+def decodeSequence(code: int):
+    """
+    Converts an integer created by encodeSequence back into its sequence.
+    """
+    bases = list()
+    while code > 1:
+        bases.append(bitsToBase[code & 3])
+        code >>= 2
+    return ''.join(reversed(bases))
@@ -0,0 +1,242 @@
+# This script contains functions and classes for indexing sorted bed-like files by chromosome, so that reading can skip
+# straight to the chromosomes of interest instead of parsing every line in between.
+# Indices are stored as sidecar files next to the indexed file and are rebuilt automatically when the indexed file changes.
+import os
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+from benbiohelpers.CustomErrors import UnsortedInputError
+from benbiohelpers.FileSystemHandling.GenomicRegionSet import GenomicRegionSet
+
+CHROMOSOME_INDEX_SUFFIX = ".chrom_index"
+CHECKPOINT_INTERVAL = 1000 # The number of lines between positional checkpoints within each chromosome.
+
+
+class ChromosomeIndex:
+    """
+    Stores the byte offsets where each chromosome's lines start and end within a file, in the order they appear.
+    Also stores the size and modification time of the file when it was indexed (along with the number of header lines skipped)
+    so that stale indices can be detected.
+    Within each chromosome, positional checkpoints (the start position and byte offset of every CHECKPOINT_INTERVAL-th line)
+    and the maximum feature length are stored as well, so that reading can also skip to specific regions.
+    NOTE: Positions are taken from the second and third columns, so files are expected to be bed formatted.
+    """
+
+    def __init__(self, chromosomeOffsets: Dict[str, Tuple[int, int]], fileSize, modificationTime, headerLineCount = 0,
+                 checkpoints: Dict[str, List[Tuple[int, int]]] = None, maxFeatureLengths: Dict[str, int] = None):
+        self.chromosomeOffsets = chromosomeOffsets
+        self.fileSize = fileSize
+        self.modificationTime = modificationTime
+        self.headerLineCount = headerLineCount
+        if checkpoints is None: checkpoints = {chromosome: list() for chromosome in chromosomeOffsets}
+        self.checkpoints = checkpoints
+        if maxFeatureLengths is None: maxFeatureLengths = {chromosome: 0 for chromosome in chromosomeOffsets}
+        self.maxFeatureLengths = maxFeatureLengths
+
+
+    @classmethod
+    def build(cls, filePath, headerLineCount = 0):
+        """
+        Reads through the given file once, recording where each chromosome (first column) starts and ends.
+        The given number of header lines are skipped.  An UnsortedInputError is raised if any chromosome's lines are not contiguous.
+        """
+        fileStats = os.stat(filePath)
+        chromosomeOffsets: Dict[str, Tuple[int, int]] = dict()
+        checkpoints: Dict[str, List[Tuple[int, int]]] = dict()
+        maxFeatureLengths: Dict[str, int] = dict()
+        currentChromosome = None
+        currentChromosomeStart = None
+        offset = 0
+
+        with open(filePath, 'rb') as file:
+            for _ in range(headerLineCount): offset += len(file.readline())
+            for line in file:
+                choppedUpLine = line.split(b'\t', 3)
+                chromosome = choppedUpLine[0].decode()
+                if chromosome != currentChromosome:
+                    if currentChromosome is not None: chromosomeOffsets[currentChromosome] = (currentChromosomeStart, offset)
+                    if chromosome in chromosomeOffsets:
+                        raise UnsortedInputError(filePath, f"Lines for chromosome {chromosome} are not contiguous.")
+                    currentChromosome = chromosome
+                    currentChromosomeStart = offset
+                    chromosomeCheckpoints = checkpoints[chromosome] = list()
+                    maxFeatureLengths[chromosome] = 0
+                    linesUntilCheckpoint = 0
+
+                startPos = int(choppedUpLine[1])
+                featureLength = int(choppedUpLine[2]) - startPos
+                if featureLength > maxFeatureLengths[chromosome]: maxFeatureLengths[chromosome] = featureLength
+                if linesUntilCheckpoint == 0:
+                    chromosomeCheckpoints.append((startPos, offset))
+                    linesUntilCheckpoint = CHECKPOINT_INTERVAL
+                linesUntilCheckpoint -= 1
+
+                offset += len(line)
+
+        if currentChromosome is not None: chromosomeOffsets[currentChromosome] = (currentChromosomeStart, offset)
+
+        return cls(chromosomeOffsets, fileStats.st_size, fileStats.st_mtime_ns, headerLineCount, checkpoints, maxFeatureLengths)
+
+
+    @classmethod
+    def read(cls, indexFilePath):
+        """
+        Reads in an index previously written with the write function.
+        """
+        with open(indexFilePath, 'r') as indexFile:
+            _, fileSize, _, modificationTime, _, headerLineCount = indexFile.readline().strip().split('\t')
+            chromosomeOffsets = dict()
+            checkpoints = dict()
+            maxFeatureLengths = dict()
+            for line in indexFile:
+                chromosome, startOffset, endOffset, maxFeatureLength, checkpointsString = line.rstrip('\n').split('\t')
+                chromosomeOffsets[chromosome] = (int(startOffset), int(endOffset))
+                maxFeatureLengths[chromosome] = int(maxFeatureLength)
+                checkpoints[chromosome] = [tuple(int(value) for value in checkpoint.split(':'))
+                                           for checkpoint in checkpointsString.split(',') if checkpoint]
+        return cls(chromosomeOffsets, int(fileSize), int(modificationTime), int(headerLineCount), checkpoints, maxFeatureLengths)
+
+
+    def write(self, indexFilePath):
+        with open(indexFilePath, 'w') as indexFile:
+            indexFile.write(f"#File_Size\t{self.fileSize}\tModification_Time\t{self.modificationTime}\t"
+                            f"Header_Lines\t{self.headerLineCount}\n")
+            for chromosome, (startOffset, endOffset) in self.chromosomeOffsets.items():
+                checkpointsString = ','.join(f"{position}:{offset}" for position, offset in self.checkpoints[chromosome])
+                indexFile.write(f"{chromosome}\t{startOffset}\t{endOffset}\t{self.maxFeatureLengths[chromosome]}\t{checkpointsString}\n")
+
+
+    def isCurrent(self, filePath, headerLineCount = 0):
+        """
+        Determines whether or not the index still matches the file at the given path (with the given number of header lines).
+        """
+        fileStats = os.stat(filePath)
+        return (fileStats.st_size == self.fileSize and fileStats.st_mtime_ns == self.modificationTime
+                and headerLineCount == self.headerLineCount)
+
+
+    def getChromosomes(self) -> List[str]:
+        return list(self.chromosomeOffsets)
+
+
+    def getRegionOffsets(self, chromosome, startPos, endPos, padding = 0):
+        """
+        Returns the byte offsets of a range of lines guaranteed to contain every feature on the given chromosome that overlaps
+        the given 0-based, half-open region, expanded by the given padding.  (Features that start before the region but are long
+        enough to reach it are included as well.)  The range may contain additional features outside of the region.
+        """
+        chromosomeStart, chromosomeEnd = self.chromosomeOffsets[chromosome]
+        checkpointPositions = [position for position, _ in self.checkpoints[chromosome]]
+
+        # Start at the last checkpoint before any feature that could reach the region...
+        checkpointIndex = bisect_left(checkpointPositions, startPos - padding - self.maxFeatureLengths[chromosome]) - 1
+        if checkpointIndex < 0: startOffset = chromosomeStart
+        else: startOffset = self.checkpoints[chromosome][checkpointIndex][1]
+
+        # ...and stop at the first checkpoint where every feature starts after the region.
+        checkpointIndex = bisect_left(checkpointPositions, endPos + padding)
+        if checkpointIndex == len(checkpointPositions): endOffset = chromosomeEnd
+        else: endOffset = self.checkpoints[chromosome][checkpointIndex][1]
+
+        return startOffset, endOffset
+
+
+def getChromosomeIndexFilePath(filePath):
+    return filePath + CHROMOSOME_INDEX_SUFFIX
+
+
+def getChromosomeIndex(filePath, headerLineCount = 0, writeIndexFile = True) -> ChromosomeIndex:
+    """
+    Returns the chromosome index for the given file, reading it from its sidecar file if it exists and is current.
+    Otherwise, the index is built and (if writeIndexFile is true and the directory is writable) written to the sidecar file.
+    """
+    indexFilePath = getChromosomeIndexFilePath(filePath)
+    if os.path.exists(indexFilePath):
+        try:
+            chromosomeIndex = ChromosomeIndex.read(indexFilePath)
+            if chromosomeIndex.isCurrent(filePath, headerLineCount): return chromosomeIndex
+        except ValueError: pass # Unreadable (e.g. outdated) index files are just rebuilt.
+
+    chromosomeIndex = ChromosomeIndex.build(filePath, headerLineCount)
+    if writeIndexFile:
+        try: chromosomeIndex.write(indexFilePath)
+        except OSError: pass # The index is still usable; it just needs to be rebuilt next time.
+    return chromosomeIndex
+
+
+class ChromosomeIndexedFile:
+    """
+    A read-only, file-like wrapper for an indexed file which only returns lines from the given chromosomes
+    (all chromosomes if None) and can jump forward to any chromosome without reading the lines in between.
+    If regions are given, only the lines near those regions (see ChromosomeIndex.getRegionOffsets) are returned.
+    Header lines are never returned, since they are not part of any chromosome's range.
+    """
+
+    def __init__(self, filePath, chromosomeIndex: ChromosomeIndex, chromosomes = None,
+                 regions: GenomicRegionSet = None, regionPadding = 0):
+        self.file = open(filePath, 'rb')
+        self.ranges: List[Tuple[str, int, int]] = list()
+        for chromosome, (startOffset, endOffset) in chromosomeIndex.chromosomeOffsets.items():
+            if chromosomes is not None and chromosome not in chromosomes: continue
+            if regions is None: self.ranges.append((chromosome, startOffset, endOffset))
+            else:
+                for regionStart, regionEnd in regions.getRegions(chromosome):
+                    startOffset, endOffset = chromosomeIndex.getRegionOffsets(chromosome, regionStart, regionEnd, regionPadding)
+                    # Merge overlapping ranges so that no line is returned twice.
+                    if self.ranges and self.ranges[-1][0] == chromosome and startOffset <= self.ranges[-1][2]:
+                        self.ranges[-1] = (chromosome, self.ranges[-1][1], max(endOffset, self.ranges[-1][2]))
+                    else: self.ranges.append((chromosome, startOffset, endOffset))
+        self.rangeIndex = 0
+        self.remainingBytes = 0
+
+
+    def getChromosomes(self) -> List[str]:
+        """
+        Returns the chromosomes that can be read from this file, in file order.
+        """
+        return [chromosome for chromosome, _, _ in self.ranges]
+
+
+    def seekToChromosome(self, chromosome):
+        """
+        Jumps to the first line of the first remaining chromosome that is not less than the given chromosome.
+        (If there are no such chromosomes, the next readline call will return an empty string.)
+        Never moves backwards, since the files being read are sorted.
+        """
+        # Start from the chromosome currently being read, if there is one.
+        if self.remainingBytes > 0: currentRangeIndex = self.rangeIndex - 1
+        else: currentRangeIndex = self.rangeIndex
+
+        for rangeIndex in range(currentRangeIndex, len(self.ranges)):
+            if self.ranges[rangeIndex][0] >= chromosome: break
+        else: rangeIndex = len(self.ranges)
+
+        # If we're already reading the requested chromosome, there's nothing to do.
+        if rangeIndex == currentRangeIndex and self.remainingBytes > 0: return
+
+        self.rangeIndex = rangeIndex
+        self.remainingBytes = 0
+
+
+    def readline(self) -> str:
+        while self.remainingBytes <= 0:
+            if self.rangeIndex >= len(self.ranges): return ''
+            _, startOffset, endOffset = self.ranges[self.rangeIndex]
+            self.rangeIndex += 1
+            self.file.seek(startOffset)
+            self.remainingBytes = endOffset - startOffset
+
+        line = self.file.readline()
+        self.remainingBytes -= len(line)
+        return line.decode()
+
+
+    def __iter__(self): return iter(self.readline, '')
+
+
+    def close(self):
+        self.file.close()
+
+
+    def __enter__(self): return self
+
+    def __exit__(self, type, value, traceback): self.close()
@@ -0,0 +1,87 @@
+# This script contains a class for storing a set of genomic regions (e.g. loci of interest) and quickly checking whether
+# positions or features fall within them.
+import os
+from bisect import bisect_right
+from typing import Dict, List, Tuple, Union
+from benbiohelpers.CustomErrors import UserInputError
+
+
+class GenomicRegionSet:
+    """
+    Stores merged, sorted regions for each chromosome as 0-based, half-open intervals (like bed files).
+    Regions can be given as strings of the form "chr:start-end" (1-based and inclusive, as in samtools),
+    as a path to a bed file of regions, or as a list containing any combination of the two.
+    """
+
+    def __init__(self, regions: Union[str, List[str]]):
+        if isinstance(regions, str): regions = [regions]
+
+        unmergedRegions: Dict[str, List[Tuple[int, int]]] = dict()
+        for region in regions:
+            if os.path.isfile(region):
+                with open(region, 'r') as regionsFile:
+                    for line in regionsFile:
+                        if not line.strip() or line.startswith(("#", "track", "browser")): continue
+                        choppedUpLine = line.strip().split('\t')
+                        unmergedRegions.setdefault(choppedUpLine[0], list()).append((int(choppedUpLine[1]), int(choppedUpLine[2])))
+            else:
+                chromosome, start, end = self.parseRegionString(region)
+                unmergedRegions.setdefault(chromosome, list()).append((start, end))
+
+        # Sort and merge the regions on each chromosome.
+        self.regionStarts: Dict[str, List[int]] = dict()
+        self.regionEnds: Dict[str, List[int]] = dict()
+        for chromosome in sorted(unmergedRegions):
+            starts = list()
+            ends = list()
+            for start, end in sorted(unmergedRegions[chromosome]):
+                if ends and start <= ends[-1]: ends[-1] = max(ends[-1], end)
+                else:
+                    starts.append(start)
+                    ends.append(end)
+            self.regionStarts[chromosome] = starts
+            self.regionEnds[chromosome] = ends
+
+
+    @staticmethod
+    def parseRegionString(region: str):
+        """
+        Converts a region string of the form "chr:start-end" (1-based, inclusive) to a chromosome with 0-based, half-open coordinates.
+        """
+        try:
+            chromosome, coordinates = region.rsplit(':', 1)
+            start, end = (int(coordinate.replace(',', '')) for coordinate in coordinates.split('-'))
+        except ValueError:
+            raise UserInputError(f"Invalid region \"{region}\".  Expected a bed file or a region of the form \"chr:start-end\".")
+        if start < 1 or end < start:
+            raise UserInputError(f"Invalid coordinates in region \"{region}\".  Expected 1 <= start <= end.")
+        return chromosome, start - 1, end
+
+
+    def getChromosomes(self) -> List[str]:
+        return list(self.regionStarts)
+
+
+    def getRegions(self, chromosome) -> List[Tuple[int, int]]:
+        """
+        Returns the (0-based, half-open) regions on the given chromosome.
+        """
+        return list(zip(self.regionStarts.get(chromosome, ()), self.regionEnds.get(chromosome, ())))
+
+
+    def containsPosition(self, chromosome, position):
+        """
+        Determines whether the given 0-based position (which may be a half position) is within any region.
+        """
+        if chromosome not in self.regionStarts: return False
+        regionIndex = bisect_right(self.regionStarts[chromosome], position) - 1
+        return regionIndex >= 0 and position <= self.regionEnds[chromosome][regionIndex] - 1
+
+
+    def overlaps(self, chromosome, startPos, endPos):
+        """
+        Determines whether the given 0-based, inclusive range overlaps any region.
+        """
+        if chromosome not in self.regionStarts: return False
+        regionIndex = bisect_right(self.regionStarts[chromosome], endPos) - 1
+        return regionIndex >= 0 and self.regionEnds[chromosome][regionIndex] - 1 >= startPos
@@ -9,6 +9,7 @@ import os, subprocess
 from typing import List
 from benbiohelpers.InputParsing.CheckForNumber import checkForNonNegativeInteger
 from benbiohelpers.CustomErrors import UnsortedInputError
+from benbiohelpers.FileSystemHandling.ChromosomeIndex import getChromosomeIndex, ChromosomeIndexedFile
 from benbiohelpers.TkWrappers.TkinterDialog import TkinterDialog
 
 
@@ -29,10 +30,14 @@ class GenomicRegion:
 class BlacklistFilterer:
     """
     The class which removes blacklisted regions from a given set of genomic regions.
+    If useChromosomeIndex is true, both files are indexed by chromosome (see ChromosomeIndex) so that blacklisted regions on
+    chromosomes without any features are skipped instead of read.  If acceptableChromosomes is also given, only features
+    on those chromosomes are read (and written).
     """
 
     def __init__(self, unfilteredFilePath: str, blacklistedRegionsFilePath: str, filteredFilePath: str,
-                 filteringExpansionRadius = 0, checkSorting = True, verbose = True):
+                 filteringExpansionRadius = 0, checkSorting = True, verbose = True,
+                 useChromosomeIndex = False, acceptableChromosomes = None):
         
         self.verbose = verbose # Have to initialize this guy before checking for sorting.
 
@@ -40,8 +45,14 @@ class BlacklistFilterer:
         if checkSorting: self.checkSorting(blacklistedRegionsFilePath, unfilteredFilePath)
 
         # Open files for reading and writing.
-        self.unfilteredFile = open(unfilteredFilePath, 'r')
-        self.blacklistedRegionsFile = open(blacklistedRegionsFilePath, 'r')
+        self.useChromosomeIndex = useChromosomeIndex or acceptableChromosomes is not None
+        if self.useChromosomeIndex:
+            self.unfilteredFile = ChromosomeIndexedFile(unfilteredFilePath, getChromosomeIndex(unfilteredFilePath), acceptableChromosomes)
+            self.blacklistedRegionsFile = ChromosomeIndexedFile(blacklistedRegionsFilePath, getChromosomeIndex(blacklistedRegionsFilePath),
+                                                                acceptableChromosomes)
+        else:
+            self.unfilteredFile = open(unfilteredFilePath, 'r')
+            self.blacklistedRegionsFile = open(blacklistedRegionsFilePath, 'r')
         self.filteredFile = open(filteredFilePath, 'w')
 
         # Initialize variables.
@@ -159,6 +170,15 @@ class BlacklistFilterer:
         else: self.currentFeature = None
 
 
+    def skipIrrelevantBlacklistedRegions(self):
+        """
+        If every unconfirmed feature is on the current feature's chromosome, any remaining blacklisted regions on earlier
+        chromosomes can't affect them, so jump straight to the blacklisted regions on that chromosome.
+        """
+        if (self.currentFeature is not None and self.currentBlacklistedRegion.chromosome < self.currentFeature.chromosome and
+            all(feature.chromosome == self.currentFeature.chromosome for feature in self.unconfirmedFeatures)):
+            self.blacklistedRegionsFile.seekToChromosome(self.currentFeature.chromosome)
+
 
     def filter(self):
         """
@@ -174,6 +194,7 @@ class BlacklistFilterer:
                 not self.isFeatureBeyondBlacklistedRegion(self.currentFeature, self.currentBlacklistedRegion)
             ):
                 self.getNextFeature()
+            if self.useChromosomeIndex: self.skipIrrelevantBlacklistedRegions()
             self.getNextBlacklistedRegion()
 
         # Make sure we read through any remaining features.
@@ -184,12 +205,14 @@ class BlacklistFilterer:
 
 
 def removeBlacklistedRegions(unfilteredFilePaths: List[str], blacklistedRegionsFilePath: str,
-                             filteringExpansionRadius = 0, checkSorting = True, verbose = True) -> List[str]:
+                             filteringExpansionRadius = 0, checkSorting = True, verbose = True,
+                             useChromosomeIndex = False, acceptableChromosomes = None) -> List[str]:
     """
     This function takes a file of bed-formatted features (e.g., nucleosomes) and a file of blacklisted regions as input.
     Features which overlap the blacklisted regions are removed, producing a filtered output file.
     The filteringExpansionRadius parameter increases the start and stop positions of blacklisted regions by the given amount.
         (This is useful when filtering larger features defined by their midpoints, such as nucleosomes.)
+    See BlacklistFilterer for the useChromosomeIndex and acceptableChromosomes parameters.
     """
 
     filteredFilePaths = list()
@@ -203,7 +226,7 @@ def removeBlacklistedRegions(unfilteredFilePaths: List[str], blacklistedRegionsF
         filteredFilePaths.append(filteredFilePath)
 
         BlacklistFilterer(unfilteredFilePath, blacklistedRegionsFilePath, filteredFilePath,
-                          filteringExpansionRadius, checkSorting, verbose).filter()
+                          filteringExpansionRadius, checkSorting, verbose, useChromosomeIndex, acceptableChromosomes).filter()
 
     return filteredFilePaths
 
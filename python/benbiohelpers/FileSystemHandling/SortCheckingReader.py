@@ -0,0 +1,55 @@
+# This script contains a file-like wrapper for streams of bed-like data (e.g. stdin or a named pipe fed by another program)
+# which checks that the data is sorted as it is read, since streams can't be checked ahead of time like files on disk.
+from benbiohelpers.CustomErrors import UnsortedInputError
+
+EXPECTED_SORTING = "Expected sorting based on chromosome name, alphabetically, followed by start and end position."
+
+
+class SortCheckingReader:
+    """
+    Wraps a text stream, returning its lines unchanged while checking that they are sorted by chromosome (first column,
+    alphabetically) and then by start and end position (second and third columns, numerically).
+    An UnsortedInputError is raised as soon as a line is out of order.
+    The given number of header lines are passed through without being checked.
+    If closeStream is false, closing the reader leaves the underlying stream open (e.g. for sys.stdin).
+    """
+
+    def __init__(self, stream, name = None, checkSorting = True, headerLineCount = 0, closeStream = False):
+        self.stream = stream
+        if name is None: name = getattr(stream, "name", "<stream>")
+        self.name = str(name)
+        self.checkSorting = checkSorting
+        self.remainingHeaderLines = headerLineCount
+        self.closeStream = closeStream
+
+        self.previousSortKey = None
+        self.lineNumber = 0
+
+
+    def readline(self) -> str:
+        line = self.stream.readline()
+        if isinstance(line, bytes): line = line.decode()
+        if not line: return line
+        self.lineNumber += 1
+
+        if self.remainingHeaderLines > 0: self.remainingHeaderLines -= 1
+        elif self.checkSorting:
+            choppedUpLine = line.split('\t', 3)
+            sortKey = (choppedUpLine[0], int(choppedUpLine[1]), int(choppedUpLine[2]))
+            if self.previousSortKey is not None and sortKey < self.previousSortKey:
+                raise UnsortedInputError(self.name, f"Line {self.lineNumber} comes before the line preceding it.\n{EXPECTED_SORTING}")
+            self.previousSortKey = sortKey
+
+        return line
+
+
+    def __iter__(self): return iter(self.readline, '')
+
+
+    def close(self):
+        if self.closeStream: self.stream.close()
+
+
+    def __enter__(self): return self
+
+    def __exit__(self, type, value, traceback): self.close()
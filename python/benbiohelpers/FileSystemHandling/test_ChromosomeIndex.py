@@ -0,0 +1,72 @@
+from benbiohelpers.FileSystemHandling.ChromosomeIndex import (ChromosomeIndex, ChromosomeIndexedFile, getChromosomeIndex,
+                                                              getChromosomeIndexFilePath)
+from benbiohelpers.FileSystemHandling import ChromosomeIndex as ChromosomeIndex_module
+from benbiohelpers.FileSystemHandling.GenomicRegionSet import GenomicRegionSet
+from benbiohelpers.FileSystemHandling.RemoveBlacklistedRegions import BlacklistFilterer
+from benbiohelpers.CustomErrors import UnsortedInputError
+import os, pytest
+
+
+@pytest.fixture
+def bedFilePath(tmp_path):
+    bedFilePath = tmp_path / "features.bed"
+    with open(bedFilePath, 'w') as bedFile:
+        bedFile.write("Chromosome\tStart\tEnd\n")
+        for chromosome in ("chr1", "chr2", "chr3"):
+            for position in range(0, 1000, 100): bedFile.write(f"{chromosome}\t{position}\t{position+1}\n")
+    return str(bedFilePath)
+
+
+def test_index_is_written_and_reused(bedFilePath):
+    chromosomeIndex = getChromosomeIndex(bedFilePath, 1)
+    assert chromosomeIndex.getChromosomes() == ["chr1", "chr2", "chr3"]
+    assert os.path.exists(getChromosomeIndexFilePath(bedFilePath))
+    assert ChromosomeIndex.read(getChromosomeIndexFilePath(bedFilePath)).chromosomeOffsets == chromosomeIndex.chromosomeOffsets
+
+
+def test_stale_index_is_rebuilt(bedFilePath):
+    getChromosomeIndex(bedFilePath, 1)
+    with open(bedFilePath, 'a') as bedFile: bedFile.write("chr4\t0\t1\n")
+    assert getChromosomeIndex(bedFilePath, 1).getChromosomes() == ["chr1", "chr2", "chr3", "chr4"]
+
+
+def test_FAIL_noncontiguous_chromosomes(tmp_path):
+    bedFilePath = tmp_path / "unsorted.bed"
+    bedFilePath.write_text("chr1\t0\t1\nchr2\t0\t1\nchr1\t5\t6\n")
+    with pytest.raises(UnsortedInputError): ChromosomeIndex.build(str(bedFilePath))
+
+
+def test_indexed_file_reads_only_requested_chromosomes(bedFilePath):
+    with ChromosomeIndexedFile(bedFilePath, getChromosomeIndex(bedFilePath, 1), ("chr1", "chr3")) as indexedFile:
+        assert indexedFile.readline() == "chr1\t0\t1\n"
+        indexedFile.seekToChromosome("chr2")
+        lines = list(indexedFile)
+    assert len(lines) == 10 and all(line.startswith("chr3") for line in lines)
+
+
+def test_indexed_blacklist_filtering_matches_unindexed(tmp_path, bedFilePath):
+    blacklistFilePath = tmp_path / "blacklist.bed"
+    blacklistFilePath.write_text("chr0\t0\t1000\nchr2\t150\t350\nchr2b\t0\t1000\n")
+
+    unfilteredFilePath = tmp_path / "unfiltered.bed"
+    unfilteredFilePath.write_text(''.join(open(bedFilePath).readlines()[1:]))
+
+    for useChromosomeIndex in (False, True):
+        BlacklistFilterer(str(unfilteredFilePath), str(blacklistFilePath), str(tmp_path / f"filtered_{useChromosomeIndex}.bed"),
+                          checkSorting = False, verbose = False, useChromosomeIndex = useChromosomeIndex).filter()
+
+    assert (tmp_path / "filtered_False.bed").read_text() == (tmp_path / "filtered_True.bed").read_text()
+
+
+def test_region_offsets_cover_overlapping_features(tmp_path, monkeypatch):
+    monkeypatch.setattr(ChromosomeIndex_module, "CHECKPOINT_INTERVAL", 3)
+    bedFilePath = tmp_path / "regions_test.bed"
+    bedFilePath.write_text(''.join(f"chr1\t{position}\t{position + (50 if position == 300 else 1)}\n" for position in range(0, 1000, 50)))
+    chromosomeIndex = getChromosomeIndex(str(bedFilePath))
+    assert chromosomeIndex.maxFeatureLengths["chr1"] == 50
+    assert ChromosomeIndex.read(getChromosomeIndexFilePath(str(bedFilePath))).checkpoints == chromosomeIndex.checkpoints
+
+    with ChromosomeIndexedFile(str(bedFilePath), chromosomeIndex, regions = GenomicRegionSet("chr1:351-400")) as indexedFile:
+        startPositions = [int(line.split('\t')[1]) for line in indexedFile]
+    assert 300 in startPositions and 350 in startPositions # The feature starting at 300 reaches into the region.
+    assert len(startPositions) < 20
@@ -0,0 +1,20 @@
+from benbiohelpers.FileSystemHandling.GenomicRegionSet import GenomicRegionSet
+from benbiohelpers.CustomErrors import UserInputError
+import pytest
+
+
+def test_region_strings_and_bed_files_are_merged(tmp_path):
+    regionsFilePath = tmp_path / "regions.bed"
+    regionsFilePath.write_text("track name=regions\nchr1\t150\t300\nchr2\t0\t10\n")
+    regions = GenomicRegionSet(["chr1:101-200", str(regionsFilePath), "chr1:1,001-2,000"])
+
+    assert regions.getChromosomes() == ["chr1", "chr2"]
+    assert regions.getRegions("chr1") == [(100, 300), (1000, 2000)]
+    assert regions.containsPosition("chr1", 100) and regions.containsPosition("chr1", 298.5)
+    assert not regions.containsPosition("chr1", 300) and not regions.containsPosition("chr3", 5)
+    assert regions.overlaps("chr1", 500, 1000) and not regions.overlaps("chr1", 300, 999)
+
+
+@pytest.mark.parametrize("region", ["chr1", "chr1:100", "chr1:0-10", "chr1:20-10"])
+def test_FAIL_invalid_region_string(region):
+    with pytest.raises(UserInputError): GenomicRegionSet(region)
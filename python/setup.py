@@ -13,7 +13,7 @@ setup(
     author_email='b.morledge-hampton@wsu.edu',
     license='MIT',
     python_requires='>=3.8',
-    install_requires=['plotnine'],
+    install_requires=['plotnine', 'numpy'],
     packages=find_packages(),
     package_data={"benbiohelpers": ["TkWrappers/test_tube.png"]}
 )
\ No newline at end of file